@@ -1,9 +1,7 @@
 import json
 import re
 from urllib.parse import quote_plus
-from selenium.common.exceptions import NoSuchElementException
-from selenium.webdriver.common.by import By
-from time import sleep
+from time import sleep, time
 from Clients.BaseClient import BaseClient
 
 class AnimePaheClient(BaseClient):
@@ -19,6 +17,9 @@ class AnimePaheClient(BaseClient):
         super().__init__(config['request_timeout'], session)
 
     def _get_new_cookies(self, url, check_condition, max_retries=3, wait_time_in_secs=5):
+        from selenium.common.exceptions import NoSuchElementException
+        from selenium.webdriver.common.by import By
+
         driver = self._get_undetected_chrome_driver(client='AnimePaheClient')
         driver.get(url)
 
@@ -160,6 +161,36 @@ class AnimePaheClient(BaseClient):
 
         return episodes_data
 
+    def fetch_new_episodes(self, target, last_episode=None):
+        '''
+        Episodes released after the last episode. Episodes list is fetched newest first, page by page,
+        only till the last episode is reached (usually a single request)
+        '''
+        if last_episode is None:
+            return super().fetch_new_episodes(target)
+
+        if not getattr(self, 'cookies', None):
+            self.cookies = self._get_site_cookies(self.base_url)
+        self.anime_id = target.get('session')
+        list_episodes_url = self.episodes_list_url.replace('sort=episode_asc', 'sort=episode_desc') + self.anime_id
+
+        new_episodes, pgno, last_page = [], 1, 1
+        while pgno <= last_page:
+            raw_data = self._send_request(f'{list_episodes_url}&page={pgno}', cookies=self.cookies, return_type='json')
+            if raw_data is None:
+                raise Exception(f'Failed to fetch episodes list of [{target.get("title")}]')
+            episodes_data = raw_data.get('data', [])
+            new_episodes.extend(episode for episode in episodes_data if float(episode.get('episode')) > float(last_episode))
+            if not episodes_data or float(episodes_data[-1].get('episode')) <= float(last_episode):
+                break
+            last_page = int(raw_data.get('last_page', 1))
+            pgno += 1
+
+        return new_episodes[::-1]
+
+    def is_airing(self, target):
+        return target.get('status') != 'Finished Airing'
+
     def show_episode_results(self, items, *predefined_range):
         start, end = self._get_episode_range_to_show(items[0].get('episode'), 
                                                     items[-1].get('episode'), 
@@ -188,6 +219,9 @@ class AnimePaheClient(BaseClient):
 
                 if not links:
                     continue
+                # duration is listed per episode (same for all resolutions), used to estimate the missing sizes
+                for res_dict in links.values():
+                    res_dict['duration'] = episode.get('duration')
 
                 self._update_scraper_dict(episode.get('episode'),
                                     {'episodeId': episode.get('session'), 
@@ -204,15 +238,26 @@ class AnimePaheClient(BaseClient):
         episode_prefix = f"{anime_title} {anime_type}"
         return target_dir, episode_prefix
 
-    def fetch_m3u8_links(self, target_links, resolution, episode_prefix):
+    def get_series_id(self, target_series):
+        # session of the anime is not permanent, so its id is used
+        return target_series.get('id') or target_series.get('session')
+
+    def get_filesize_mb(self, res_dict):
+        # size is only listed as text on the download button, e.g. "SubsPlease · 720p (137MB)"
+        match = re.search(r'\(([\d.]+)\s*([KMG])B\)', str(res_dict.get('filesize', '')), re.I)
+        if match is None:
+            return None
+        return float(match.group(1)) * {'K': 1/1024, 'M': 1, 'G': 1024}[match.group(2).upper()]
+
+    def fetch_m3u8_links(self, target_links, resolution, episode_prefix, resolutions=None):
         def _get_ep_name(resltn):
-            return f"{episode_prefix}{' ' if episode_prefix.lower().endswith('movie') and len(target_links.items()) <= 1 else f' {ep} '}- {resltn}P.mp4"
+            return f"{episode_prefix}{' ' if episode_prefix.lower().endswith('movie') and (self.target_episodes_count or len(target_links.items())) <= 1 else f' {ep} '}- {resltn}P.mp4"
 
         for ep, link in target_links.items():
             error = None
             info = f'Episode: {self._safe_type_cast(ep)} |'
 
-            selected_resolution = self._resolution_selector(link.keys(), resolution, self.selector_strategy)
+            selected_resolution = (resolutions or {}).get(ep) or self._resolution_selector(link.keys(), resolution, self.selector_strategy)
             res_dict = link.get(selected_resolution)
 
             if 'error' in link:
@@ -230,7 +275,10 @@ class AnimePaheClient(BaseClient):
                     self._update_scraper_dict(ep, {'episodeName': ep_name,
                                              'refererLink': kwik_link,
                                              'downloadLink': ep_link, 
-                                             'downloadType': 'hls'})
+                                             'downloadType': 'hls',
+                                             'resolvedAt': time()})
+                    # size listed on the site is used to check the free disk space before downloading
+                    if self.get_filesize_mb(res_dict): self._update_scraper_dict(ep, {'filesizeMb': self.get_filesize_mb(res_dict)})
                     self._colprint('results', f'{info} Link found [{ep_link}]')
 
                 except Exception as e:
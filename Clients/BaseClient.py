@@ -3,15 +3,17 @@ import logging
 import re
 import requests
 import os
-from bs4 import BeautifulSoup as BS
-from copy import deepcopy
-from urllib.parse import parse_qs, urlparse
+import threading
+from copy import copy, deepcopy
+from functools import partial
+from time import monotonic, time
+from urllib.parse import parse_qs, urljoin, urlparse
 
 import base64
-from Cryptodome.Cipher import AES
-import undetected_chromedriver as uc
 
-from Utils.commons import colprint, exec_os_cmd, pretty_time, retry, threaded, ExitException
+from Utils.MirrorSelector import DEFAULT_SCORES_FILE, get_mirror_selector
+from Utils.FFmpegRunner import get_runner
+from Utils.commons import colprint, pretty_time, retry, threaded, ExitException
 
 
 class BaseClient():
@@ -26,6 +28,14 @@ class BaseClient():
             self.hls_size_accuracy
         except AttributeError:
             self.hls_size_accuracy = 0      # set default value if not set
+        try:
+            self.max_mirrors
+        except AttributeError:
+            self.max_mirrors = 1            # number of download links (mirrors) to collect per resolution
+        try:
+            self.mirror_selector
+        except AttributeError:
+            self.mirror_selector = 'race'   # race: order download links by probing them, static: order by preferred_urls
 
         self.header = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36",
@@ -33,10 +43,14 @@ class BaseClient():
             "Connection": "keep-alive"
         }
         self.scraper_episode_dict = {}   # dict containing all details of epsiodes
+        self.target_episodes_count = None   # number of selected episodes (set when episodes are resolved one at a time)
+        self.resolve_lock = threading.Lock()    # episodes are resolved again from download threads, when their links expire
         self.cookies_file = os.path.join(os.path.dirname(__file__), '.scraper_client_cookies.json')      # file containing re-usable cookies
+        self.mirror_scores_file = DEFAULT_SCORES_FILE      # file containing mirror health & speed scores
+        self.mirror_ranker = get_mirror_selector(self.mirror_scores_file) if self.mirror_selector == 'race' else None
         # list of invalid characters not allowed in windows file system
         self.invalid_chars = ['/', '\\', '"', ':', '?', '|', '<', '>', '*']
-        self.bs = AES.block_size
+        self.bs = 16    # AES block size
         # get the root logger
         self.logger = logging.getLogger()
         # re-usable lambda functions
@@ -121,12 +135,16 @@ class BaseClient():
         '''
         return html parsed soup
         '''
+        from bs4 import BeautifulSoup as BS
         html_content = self._send_request(search_url, referer=referer, request_type=request_type, extra_headers=extra_headers, cookies=cookies, return_type='text', post_data=post_data, upload_data=upload_data, silent=silent)
         if html_content is not None:
             return BS(html_content, 'html.parser')
 
-    def _exec_cmd(self, cmd):
-        return exec_os_cmd(cmd)
+    def _exec_cmd(self, args, timeout=60):
+        '''
+        run a light ffmpeg/ffprobe command (list of args) and return its output
+        '''
+        return get_runner().run(args, timeout=timeout, heavy=False)
 
     def _windows_safe_string(self, word):
         for i in self.invalid_chars:
@@ -190,9 +208,10 @@ class BaseClient():
                 stream_link = stream['data-video']
                 return pad_https(stream_link)
 
-    def _parse_m3u8_links(self, master_m3u8_link, referer):
+    def _parse_m3u8_links(self, master_m3u8_link, referer, with_metadata=True):
         '''
         parse master m3u8 data and return dict of resolutions and m3u8 links
+        - with_metadata: fetch duration & size of the resolutions (not required for mirror links)
         '''
         m3u8_links = {}
         base_url = '/'.join(master_m3u8_link.split('/')[:-1])
@@ -207,7 +226,10 @@ class BaseClient():
         if len(resolution_names) == 0:
             resolution_names = [ res.lower().split('x')[-1] for res in resolutions ]
         resolution_links = _regex_list(master_m3u8_data, '(.*)m3u8', 0)
-        self.logger.debug(f'Resolutions data: {resolutions = }, {resolution_names = }, {resolution_links = }')
+        # bits/sec of the variants (average if listed, else peak), to estimate the size when it is not measured
+        _bandwidth = lambda info: int((re.search(r'AVERAGE-BANDWIDTH=(\d+)', info) or re.search(r'BANDWIDTH=(\d+)', info)).group(1))
+        bandwidths = [ _bandwidth(info) for info in _regex_list(master_m3u8_data, '#EXT-X-STREAM-INF:.*BANDWIDTH=.*', 0) ]
+        self.logger.debug(f'Resolutions data: {resolutions = }, {resolution_names = }, {resolution_links = }, {bandwidths = }')
 
         if len(resolution_links) == 0:
             # check for original keyword in the link, or if '#EXT-X-ENDLIST' in m3u8 data
@@ -215,9 +237,14 @@ class BaseClient():
             master_is_child = re.search('#EXT-X-ENDLIST', master_m3u8_data)
             if 'original' in master_m3u8_link or master_is_child:
                 self.logger.debug('master m3u8 link itself is the download link')
+                if not with_metadata:
+                    # resolution is not listed in a media playlist (None: matched to the single resolution of the stream)
+                    return {None: {'downloadLink': master_m3u8_link, 'downloadType': 'hls'}}
                 # treat is as mp4 to fetch metadata using ffprobe
                 duration, size, resolution = self._get_video_metadata(master_m3u8_link, 'mp4', referer)
-                m3u8_links[resolution.split('x')[-1]] = {
+                res_key = (resolution or '').split('x')[-1]
+                res_key = res_key if res_key.isdigit() else '1080'
+                m3u8_links[res_key] = {
                     'resolution_size': resolution,
                     'downloadLink': master_m3u8_link,
                     'downloadType': 'hls',
@@ -225,15 +252,22 @@ class BaseClient():
                 }
                 # get approx download size and add file size if available
                 file_size = self._get_download_size(master_m3u8_link, referer)
-                if file_size: m3u8_links['1080'].update({'filesize_mb': file_size})
+                if file_size: m3u8_links[res_key].update({'filesize_mb': file_size})
 
             return m3u8_links
 
+        if not with_metadata:
+            return { _res.replace('p',''): {'downloadLink': _full_link(_link), 'downloadType': 'hls'}
+                     for _res, _link in zip(resolution_names, resolution_links) }
+
         # calculate duration from any resolution, as it is same for all resolutions
         temp_link = _full_link(resolution_links[0]) if resolution_links else master_m3u8_link
-        duration = pretty_time(self._get_video_metadata(temp_link, 'hls', referer)[0])
+        seconds = self._get_video_metadata(temp_link, 'hls', referer)[0]
+        duration = pretty_time(seconds)
+        if len(bandwidths) != len(resolution_links):
+            bandwidths = [ None ] * len(resolution_links)
 
-        for _res, _pixels, _link in zip(resolution_names, resolutions, resolution_links):
+        for _res, _pixels, _link, _bandwidth in zip(resolution_names, resolutions, resolution_links, bandwidths):
             # prepend base url if it is relative url
             m3u8_link = _full_link(_link)
             m3u8_links[_res.replace('p','')] = {
@@ -244,6 +278,9 @@ class BaseClient():
             }
             # get approx download size and add file size if available
             file_size = self._get_download_size(m3u8_link, referer)
+            if not file_size and _bandwidth and seconds:
+                # not measured (hls_size_accuracy: 0), so estimate it as bitrate x duration
+                file_size = round(_bandwidth / 8 * seconds / 1024**2)
             if file_size: m3u8_links[_res.replace('p','')].update({'filesize_mb': file_size})
 
         return m3u8_links
@@ -262,11 +299,11 @@ class BaseClient():
                 duration = sum([ float(match.group(1)) for match in re.finditer('#EXTINF:(.*),', data) ])
             else:
                 # add -show_streams in ffprobe to get more information
-                ffprobe_cmd = f'ffprobe -loglevel quiet -print_format json -show_format -select_streams v:0 -show_entries stream=width,height'
+                ffprobe_cmd = ['ffprobe', '-loglevel', 'quiet', '-print_format', 'json', '-show_format', '-select_streams', 'v:0', '-show_entries', 'stream=width,height']
                 if referer:
-                    ffprobe_cmd += f' -referer "{referer}"'
-                self.logger.debug(f'Fetching video duration using ffprobe command: {ffprobe_cmd} "{link}"')
-                video_metadata = json.loads(self._exec_cmd(f'{ffprobe_cmd} "{link}"'))
+                    ffprobe_cmd.extend(['-referer', referer])
+                self.logger.debug(f'Fetching video duration using ffprobe command: {ffprobe_cmd + [link]}')
+                video_metadata = json.loads(self._exec_cmd(ffprobe_cmd + [link], timeout=self.request_timeout * 2))
                 duration = float(video_metadata.get('format', {}).get('duration', 0))
                 size = float(video_metadata.get('format', {}).get('size', 0))
                 resolution = f"{video_metadata.get('streams', [{}])[0].get('width')}x{video_metadata.get('streams', [{}])[0].get('height')}"
@@ -279,6 +316,24 @@ class BaseClient():
 
         return round(duration), size, resolution
 
+    def _get_content_length(self, url, referer=None):
+        '''
+        Size (in bytes) of the file at the url from its headers (HEAD, else a single byte range request), None if not known
+        '''
+        headers = {**self.header, 'Referer': referer} if referer else self.header
+        try:
+            response = self.req_session.head(url, headers=headers, timeout=self.request_timeout, allow_redirects=True)
+            if response.ok and int(response.headers.get('content-length', 0)) > 0:
+                return int(response.headers['content-length'])
+            # some hosts don't answer HEAD requests, but list the total size in the range of a partial response
+            response = self.req_session.get(url, headers={**headers, 'Range': 'bytes=0-0'}, stream=True, timeout=self.request_timeout)
+            response.close()
+            total = response.headers.get('content-range', '').split('/')[-1]
+            return int(total) if total.isdigit() else None
+        except Exception as e:
+            self.logger.warning(f'Failed to fetch content length for {url = }. Error: {e}')
+            return None
+
     @threaded()
     def _fetch_content_length(self, url):
         try:
@@ -419,19 +474,58 @@ class BaseClient():
 
         return download_links
 
+    def _probe_download_link(self, url, referer=None, sample_bytes=256*1024):
+        '''
+        measure time-to-first-byte of the link and throughput of a short sample of the media.
+        For m3u8 links, the sample is taken from the first segment of the first resolution.
+        Returns: (ttfb in secs, throughput in bytes/sec)
+        '''
+        headers = {**self.header, 'Referer': referer} if referer else self.header
+        _get = lambda url, **kwargs: self.req_session.get(url, headers={**headers, **kwargs}, stream=True, timeout=self.request_timeout)
+        _first_uri = lambda base, data: next(urljoin(base, line.strip()) for line in data.splitlines() if line.strip() and not line.startswith('#'))
+
+        response = _get(url)
+        response.raise_for_status()
+        ttfb = response.elapsed.total_seconds()
+
+        media_url = url
+        if url.split('?')[0].endswith('.m3u8'):
+            media_url = _first_uri(url, response.text)
+            if media_url.split('?')[0].endswith('.m3u8'):      # master playlist
+                media_url = _first_uri(media_url, _get(media_url).text)
+        response.close()
+
+        start = monotonic()
+        response = _get(media_url, Range=f'bytes=0-{sample_bytes - 1}')
+        response.raise_for_status()
+        sampled = 0
+        for chunk in response.iter_content(64*1024):
+            sampled += len(chunk)
+            if sampled >= sample_bytes:
+                break
+        response.close()
+
+        return ttfb, sampled / max(monotonic() - start, 1e-3)
+
     def _get_download_links(self, download_links, *config_data):
         '''
         retrieve download links from stream link and return available resolution links
+        - Order the links by racing them (mirror_selector: race) or by preferred urls (mirror_selector: static)
         - Sort the resolutions in ascending order
         '''
         link, preferred_urls, blacklist_urls = config_data
         pad_https = lambda x: 'https:' + x if x.startswith('//') else x
-        # re-order urls based on user preference
-        ordered_download_links = [ j for i in preferred_urls for j in download_links if i in j.get('file') ]
-        # append remaining urls
-        ordered_download_links.extend([ j for j in download_links if j not in ordered_download_links ])
         # remove blacklisted urls
-        ordered_download_links = [ j for j in ordered_download_links if not any(i in j.get('file') for i in blacklist_urls) ]
+        download_links = [ j for j in download_links if not any(i in j.get('file') for i in blacklist_urls) ]
+        if self.mirror_ranker:
+            # probe all the links concurrently and order them by measured speed & past health
+            probe_func = lambda url: self._probe_download_link(url, referer=link)
+            ordered_download_links = self.mirror_ranker.rank(download_links, probe_func, get_url=lambda x: pad_https(x.get('file')))
+        else:
+            # re-order urls based on user preference
+            ordered_download_links = [ j for i in preferred_urls for j in download_links if i in j.get('file') ]
+            # append remaining urls
+            ordered_download_links.extend([ j for j in download_links if j not in ordered_download_links ])
 
         self.logger.debug(f'{ordered_download_links = }')
         if len(ordered_download_links) == 0:
@@ -441,6 +535,7 @@ class BaseClient():
         self.logger.debug('Extracting resolution download links...')
         counter = 0
         resolution_links = {}
+        hls_found = 0       # number of master m3u8 links parsed (primary + mirrors)
 
         for download_link in ordered_download_links:
             counter += 1
@@ -450,17 +545,24 @@ class BaseClient():
             if dtype == '' and dlink.split('?')[0].endswith('.m3u8'):
                 dtype = 'hls'
 
-            if dtype == 'hls':
+            if dtype == 'hls' and hls_found >= self.max_mirrors:
+                self.logger.debug(f'Collected {hls_found} m3u8 links. Skipping [{dlink}]')
+
+            elif dtype == 'hls':
                 try:
                     # extract inner m3u8 resolution links from master m3u8 link
                     self.logger.debug(f'Found m3u8 link. Getting m3u8 links from master m3u8 link [{dlink}]')
-                    m3u8_links = self._parse_m3u8_links(dlink, link)
+                    m3u8_links = self._parse_m3u8_links(dlink, link, with_metadata=hls_found == 0)
                     self.logger.debug(f'Returned {m3u8_links = }')
 
-                    if len(m3u8_links) > 0:
-                        self.logger.debug('m3u8 links obtained. No need to try with alternative. Breaking loop')
+                    if len(m3u8_links) > 0 and hls_found > 0:
+                        self.logger.debug('m3u8 links obtained from alternative. Adding them as mirror links')
+                        self._add_mirror_links(resolution_links, m3u8_links)
+                        hls_found += 1
+                    elif len(m3u8_links) > 0:
+                        self.logger.debug(f'm3u8 links obtained. Collecting up to {self.max_mirrors - 1} mirror links from alternatives')
                         resolution_links.update(m3u8_links)
-                        break
+                        hls_found += 1
 
                 except Exception as e:
                     # try with alternative master m3u8 link
@@ -472,8 +574,14 @@ class BaseClient():
                 # if link is mp4, it is a direct download link
                 self.logger.debug(f'Found mp4 link. Adding the direct download link [{dlink}]')
                 duration, file_size, resolution = self._get_video_metadata(dlink, link_type='mp4', referer=link)
+                file_size = file_size or self._get_content_length(dlink, referer=link)
                 duration = pretty_time(duration)
-                resltn = resolution.split('x')[-1]
+                resltn = (resolution or '').split('x')[-1]
+                resltn = resltn if resltn.isdigit() else '720'
+                if resolution_links.get(resltn, {}).get('downloadType') == 'mp4':
+                    # same resolution from another source is a mirror (validated by size at download time)
+                    self._add_mirror_links(resolution_links, {resltn: {'downloadLink': dlink, 'downloadType': 'mp4'}})
+                    continue
                 resolution_links[resltn] = {
                     'resolution_size': resolution,
                     'downloadLink': dlink,
@@ -496,6 +604,45 @@ class BaseClient():
 
         return resolution_links
 
+    def _add_mirror_links(self, resolution_links, links):
+        '''
+        Keep the links (resolution -> {downloadLink, downloadType}) of already found resolutions of the same type as
+        mirrors of the same stream, up to max_mirrors links per resolution. A link of unknown resolution (None) is a
+        mirror only if the stream has a single resolution of its type
+        '''
+        for _res, _details in links.items():
+            if _res is None:
+                same_type = [ res for res, details in resolution_links.items() if details.get('downloadType') == _details['downloadType'] ]
+                _res = same_type[0] if len(same_type) == 1 else None
+            if _res is None or resolution_links.get(_res, {}).get('downloadType') != _details['downloadType']:
+                self.logger.debug(f'No matching resolution for mirror link [{_details["downloadLink"]}]')
+                continue
+            mirror_links = resolution_links[_res].setdefault('mirrorLinks', [])
+            if len(mirror_links) < self.max_mirrors - 1 and _details['downloadLink'] not in mirror_links:
+                mirror_links.append(_details['downloadLink'])
+
+    def _add_mirror_sources(self, resolution_links, mirror_sources, *config_data):
+        '''
+        Add the links of mirror sources (e.g., alternate servers of the same stream) as mirrors of the matching
+        resolutions. Only the resolutions of the mirror sources are read (no metadata)
+        '''
+        link, _, blacklist_urls = config_data
+        pad_https = lambda x: 'https:' + x if x.startswith('//') else x
+        for source in mirror_sources:
+            dlink = pad_https(source.get('file'))
+            if any(i in dlink for i in blacklist_urls):
+                continue
+            try:
+                if source.get('type') == 'hls':
+                    links = self._parse_m3u8_links(dlink, link, with_metadata=False)
+                else:
+                    resolution = (self._get_video_metadata(dlink, link_type='mp4', referer=link)[2] or '').split('x')[-1]
+                    links = {resolution if resolution.isdigit() else None: {'downloadLink': dlink, 'downloadType': 'mp4'}}
+            except Exception as e:
+                self.logger.warning(f'Failed to fetch mirror links from [{dlink}] with error: {e}')
+                continue
+            self._add_mirror_links(resolution_links, links)
+
     # step-4.3
     def _show_episode_links(self, key, details, display_prefix='Episode'):
         '''
@@ -519,9 +666,10 @@ class BaseClient():
 
         self._colprint('results', info)
 
-    def fetch_m3u8_links(self, target_links, resolution, episode_prefix):
+    def fetch_m3u8_links(self, target_links, resolution, episode_prefix, resolutions=None):
         '''
         return dict containing m3u8 links based on resolution. (this is a default method. override if required)
+        resolutions: dict of episode -> resolution planned for the episode (overrides the resolution selection)
         '''
         _get_ep_name = lambda resltn: f"{self.scraper_episode_dict.get(ep).get('episodeName')} - {resltn}P.mp4"
 
@@ -550,8 +698,8 @@ class BaseClient():
             self.logger.debug(f'{display_prefix}: {ep}, Link: {link}')
             info = f'{display_prefix}: {self._safe_type_cast(ep_no)} |'
 
-            # select the resolution based on the selection strategy
-            selected_resolution = self._resolution_selector(link.keys(), resolution, self.selector_strategy)
+            # select the resolution based on the selection strategy (unless planned for the episode)
+            selected_resolution = (resolutions or {}).get(ep) or self._resolution_selector(link.keys(), resolution, self.selector_strategy)
             res_dict = link.get(selected_resolution)
             self.logger.debug(f'{selected_resolution = } based on {self.selector_strategy = }, Data: {res_dict = }')
 
@@ -568,8 +716,11 @@ class BaseClient():
                     ep_link = res_dict['downloadLink']
                     link_type = res_dict['downloadType']
 
-                    # add download link and it's type against episode
-                    self._update_scraper_dict(ep, {'episodeName': ep_name, 'downloadLink': ep_link, 'downloadType': link_type})
+                    # add download link and it's type against episode (along with mirrors of the same stream, if any)
+                    self._update_scraper_dict(ep, {'episodeName': ep_name, 'downloadLink': ep_link, 'downloadType': link_type,
+                                                   'mirrorLinks': res_dict.get('mirrorLinks', []), 'resolvedAt': time()})
+                    # size estimate is used to check the free disk space before downloading
+                    if res_dict.get('filesize_mb'): self._update_scraper_dict(ep, {'filesizeMb': res_dict['filesize_mb']})
                     self.logger.debug(f'{info} Link found [{ep_link}]')
                     self._colprint('results', f'{info} Link found [{ep_link}]')
 
@@ -586,6 +737,96 @@ class BaseClient():
 
         return final_dict
 
+    def iter_episode_links(self, episodes, ep_ranges):
+        '''
+        Fetch episode links one episode at a time. Yields (episode, links) as soon as the links of an episode are found
+        '''
+        is_selected = lambda ep: (float(ep) >= ep_ranges['start'] and float(ep) <= ep_ranges['end']) or float(ep) in ep_ranges.get('specific_no', [])
+        selected_episodes = [ episode for episode in episodes if is_selected(episode.get('episode')) ]
+        self.target_episodes_count = len(selected_episodes)
+
+        for episode in selected_episodes:
+            try:
+                ep_links = self.fetch_episode_links([episode], ep_ranges)
+            except Exception as e:
+                # skip the episode, so that the episodes already queued for download are not affected
+                self.logger.error(f'Failed to fetch links of episode {episode.get("episode")} with error: {e}')
+                continue
+
+            for links in ep_links.values():
+                yield episode, links
+
+    def iter_download_links(self, episode_links, resolution, episode_prefix):
+        '''
+        Yields download details of the episodes as soon as the download link of an episode is found
+        - episode_links: iterable of (episode, links), e.g. from iter_episode_links()
+        '''
+        for episode, links in episode_links:
+            ep = episode.get('episode')
+            ep_details = self.fetch_m3u8_links({ep: links}, resolution, episode_prefix)[ep]
+            yield self.add_resolver(ep_details, episode, resolution, episode_prefix)
+
+    def resolve_episode(self, episode, resolution, episode_prefix):
+        '''
+        Resolve the download link of a single episode again. Returns the episode details (with error, if failed)
+        '''
+        ep = episode.get('episode')
+        with self.resolve_lock:
+            self.logger.debug(f'Resolving download link of episode {ep} again')
+            ep_links = self.fetch_episode_links([episode], {'start': float(ep), 'end': float(ep)})
+            if ep not in ep_links:
+                return {'error': 'Episode links not found'}
+
+            self.scraper_episode_dict.get(ep, {}).pop('error', None)
+            return dict(self.fetch_m3u8_links({ep: ep_links[ep]}, resolution, episode_prefix)[ep])
+
+    def add_resolver(self, ep_details, episode, resolution, episode_prefix):
+        '''
+        Attach a callback to the episode details, to resolve its download link again (signed stream links expire)
+        '''
+        if 'downloadLink' in ep_details:
+            ep_details['resolver'] = partial(self.resolve_episode, episode, resolution, episode_prefix)
+
+        return ep_details
+
+    def fetch_new_episodes(self, target, last_episode=None):
+        '''
+        Episodes of the series released after the last episode (all the episodes if None), in ascending order.
+        (this is a default method listing all the episodes. override if the site can list only the newer ones)
+        '''
+        episodes = self.fetch_episodes_list(target)
+        if last_episode is None:
+            return episodes
+
+        return [ episode for episode in episodes if float(episode.get('episode')) > float(last_episode) ]
+
+    def is_airing(self, target):
+        '''
+        Check if new episodes of the series may still be released (override if the site has the status of the series)
+        '''
+        return True
+
+    def get_series_id(self, target_series):
+        '''
+        Id of the series on the site, to identify its downloads in the library index (override if the site has an id)
+        '''
+        return target_series.get('title')
+
+    def get_filesize_mb(self, res_dict):
+        '''
+        Size (in MB) of a resolution of an episode as listed by fetch_episode_links, None if not known
+        '''
+        return res_dict.get('filesize_mb')
+
+    def get_duration(self, res_dict):
+        '''
+        Duration (in seconds) of a resolution of an episode as listed by fetch_episode_links, None if not known
+        '''
+        duration = res_dict.get('duration')
+        if not duration or duration == pretty_time(0):
+            return None
+        return sum(int(part) * 60**i for i, part in enumerate(reversed(duration.split(':'))))
+
     def _pad(self, s):
         return s + (self.bs - len(s) % self.bs) * chr(self.bs - len(s) % self.bs)
 
@@ -594,6 +835,7 @@ class BaseClient():
 
     def _aes_encrypt(self, word: str, key: bytes, iv: bytes):
         # Encrypt the message and add PKCS#7 padding
+        from Cryptodome.Cipher import AES
         padded_message = self._pad(word)
         # set up the AES cipher in CBC mode
         cipher = AES.new(key, AES.MODE_CBC, iv)
@@ -604,6 +846,7 @@ class BaseClient():
         return base64_encrypted_message
 
     def _aes_decrypt(self, word: str, key: bytes, iv: bytes):
+        from Cryptodome.Cipher import AES
         encrypted_msg = base64.b64decode(word)
         # set up the AES cipher in CBC mode
         cipher = AES.new(key, AES.MODE_CBC, iv)
@@ -614,6 +857,46 @@ class BaseClient():
 
         return decrypted_msg
 
+    def _aes_decrypt_batch(self, words: list, key: bytes, iv: bytes):
+        '''
+        Decrypt many messages encrypted with the same key & iv (AES-CBC) in one go.
+        CBC decryption is P[i] = D(C[i]) xor C[i-1], with C[-1] = iv for every message. So all the messages are
+        decrypted with a single ECB pass over the concatenated blocks, and xor-ed with their previous blocks at once.
+        Returns list of decrypted messages (None for the ones that failed to decrypt).
+        '''
+        from Cryptodome.Cipher import AES
+        bs = self.bs
+        encrypted_msgs = []
+        for word in words:
+            try:
+                msg = base64.b64decode(word)
+                encrypted_msgs.append(msg if msg and len(msg) % bs == 0 else None)
+            except ValueError:
+                encrypted_msgs.append(None)
+
+        valid_msgs = [ msg for msg in encrypted_msgs if msg is not None ]
+        if not valid_msgs:
+            return [ None ] * len(words)
+
+        ciphertext = b''.join(valid_msgs)
+        previous_blocks = b''.join(iv + msg[:-bs] for msg in valid_msgs)
+        decrypted = AES.new(key, AES.MODE_ECB).decrypt(ciphertext)
+        plaintext = (int.from_bytes(decrypted, 'big') ^ int.from_bytes(previous_blocks, 'big')).to_bytes(len(ciphertext), 'big')
+
+        results, offset = [], 0
+        for msg in encrypted_msgs:
+            if msg is None:
+                results.append(None)
+                continue
+            padded, offset = plaintext[offset:offset + len(msg)], offset + len(msg)
+            try:
+                if not 1 <= padded[-1] <= bs: raise ValueError('Invalid padding')
+                results.append(padded[:-padded[-1]].decode('utf-8').strip())
+            except ValueError:
+                results.append(None)
+
+        return results
+
     def _get_episode_range_to_show(self, start, end, predefined_range=None, threshold=24, type='episodes'):
         '''
         Get the range of episodes from user and return the range to display
@@ -687,6 +970,8 @@ class BaseClient():
         Get the undetected chrome driver in headless mode.
         Args: client - name of the client (used for logging only)
         '''
+        import undetected_chromedriver as uc
+
         def __suppress_exception_in_del(uc):
             '''
             Suppress the exception saying "OSError: [WinError 6] The handle is invalid"
@@ -713,6 +998,17 @@ class BaseClient():
 
         return uc.Chrome(headless=True)
 
+    def clone(self):
+        '''
+        New client to resolve another series, sharing the warm state (session, cookies, site tokens) of this client
+        '''
+        client = copy(self)
+        client.scraper_episode_dict = {}
+        client.target_episodes_count = None
+        client.resolve_lock = threading.Lock()
+
+        return client
+
     def cleanup(self):
         '''
         Perform any clean-up activities as required.
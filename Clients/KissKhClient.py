@@ -1,6 +1,5 @@
 # Remove existing author info
 import re
-from quickjs import Context as quickjsContext
 from urllib.parse import quote_plus
 
 from Clients.BaseClient import BaseClient
@@ -21,9 +20,12 @@ class KissKhClient(BaseClient):
         self.blacklist_urls = config['blacklist_urls'] if config.get('blacklist_urls') else []
         self.selector_strategy = config.get('alternate_resolution_selector', 'lowest')
         self.hls_size_accuracy = config.get('hls_size_accuracy', 0)
+        self.max_mirrors = config.get('max_mirrors', 3)
+        self.alternate_video_keys = ['Video_tmp', 'ThirdParty']     # keys of the alternate servers in the video response
+        self.mirror_selector = config.get('mirror_selector', 'race')
         super().__init__(config.get('request_timeout', 30), session=session)
         self.logger.debug(f'KissKh client initialized with {config = }')
-        self.token_generation_js_code = None
+        self.token_cache = {}   # js code to create tokens (shared with the clones of the client)
         self.quickjs_context = None
         # site specific details required to create token
         self.subGuid = "VgV52sWhwvBSf8BsM3BRY9weWiiCbtGp"
@@ -43,23 +45,51 @@ class KissKhClient(BaseClient):
                f"\n   | Episodes: {details.get('episodesCount', 'NA')} | Released: {details.get('year')} | Status: {details.get('status')}"
         self._colprint('results', line)
 
+    def _get_video_sources(self, video_response):
+        '''
+        Stream links of the episode, as sources for _get_download_links. Returns (qualities of the main server, highest
+        first, or its single link, alternate servers serving the same stream)
+        '''
+        def _to_sources(links, keep_unknown=False):
+            sources = []
+            for link in dict.fromkeys(l for l in links if isinstance(l, str) and l.startswith(('http', '//'))):
+                link_type = 'mp4' if '.mp4' in link else 'hls' if '.m3u8' in link else None
+                if link_type or keep_unknown:
+                    sources.append({'file': link, 'type': link_type or 'hls'})
+            return sources
+
+        video_data = video_response.get('Video')
+        if isinstance(video_data, dict):
+            qualities = video_data.get('qualities', {})
+            links = [ qualities[q] for q in sorted(qualities, key=lambda q: -int(q) if str(q).isdigit() else 0) ] or [video_data.get('url')]
+        else:
+            links = [video_data]
+        # countdown timer links of upcoming episodes are kept as the main link
+        main_sources = _to_sources(links, keep_unknown=True)
+        # embed pages (third party players) of the alternate servers are not usable
+        alternate_sources = [ source for source in _to_sources(video_response.get(key) for key in self.alternate_video_keys)
+                              if source not in main_sources ]
+
+        return main_sources, alternate_sources
+
     def _get_token(self, episode_id, uid):
         '''Create token required to fetch stream & subtitle links'''
         # js code to generate token from kisskh site
-        if self.token_generation_js_code is None:
+        if 'js_code' not in self.token_cache:
             self.logger.debug('Fetching token generation js code...')
             soup = self._get_bsoup(self.base_url + 'index.html')
             common_js_url = self.base_url + [i['src'] for i in soup.select('script') if i.get('src') and 'common' in i['src']][0]
-            self.token_generation_js_code = self._send_request(common_js_url)
+            self.token_cache['js_code'] = self._send_request(common_js_url)
 
         # quickjs context for evaluating js code
         if self.quickjs_context is None:
             self.logger.debug('Creating quickjs context...')
+            from quickjs import Context as quickjsContext
             self.quickjs_context = quickjsContext()
 
         # evaluate js code to generate token
         self.logger.debug(f'Evaluating js code to generate token using {episode_id = } and {uid = }')
-        token = self.quickjs_context.eval(self.token_generation_js_code + f'_0x54b991({episode_id}, null, "2.8.10", "{uid}", 4830201, "kisskh", "kisskh", "kisskh", "kisskh", "kisskh", "kisskh")')
+        token = self.quickjs_context.eval(self.token_cache['js_code'] + f'_0x54b991({episode_id}, null, "2.8.10", "{uid}", 4830201, "kisskh", "kisskh", "kisskh", "kisskh", "kisskh", "kisskh")')
         return token
 
     def search(self, keyword, search_limit=10):
@@ -148,6 +178,18 @@ class KissKhClient(BaseClient):
 
         return all_episodes_list[::-1]   # return episodes in ascending
 
+    def fetch_new_episodes(self, target, last_episode=None):
+        '''Refresh the episodes & status of the series (single request) and return the episodes after the last episode'''
+        series_data = self._send_request(self.series_url + str(target['series_id']), return_type='json')
+        if series_data is None:
+            raise Exception(f'Failed to fetch details of [{target.get("title")}]')
+        target.update({'episodes': series_data['episodes'], 'episodesCount': series_data['episodesCount'], 'status': series_data['status']})
+
+        return super().fetch_new_episodes(target, last_episode)
+
+    def is_airing(self, target):
+        return str(target.get('status')).lower() != 'completed'
+
     def show_episode_results(self, items, *predefined_range):
         '''Display episode list'''
         start, end = self._get_episode_range_to_show(items[0].get('episode'), items[-1].get('episode'), predefined_range[1], threshold=24)
@@ -177,17 +219,9 @@ class KissKhClient(BaseClient):
                     continue
 
                 self.logger.debug(f'Got video response: {dl_links}')
-                video_data = dl_links.get('Video', {})
-                if isinstance(video_data, str):
-                    link = video_data
-                    self.logger.debug(f'Direct video link: {link}')
-                else:
-                    # Try to get different quality options
-                    qualities = video_data.get('qualities', {})
-                    self.logger.debug(f'Available qualities: {qualities}')
-                    # Use highest quality as default
-                    link = qualities.get('1080', qualities.get('720', qualities.get('480', video_data.get('url'))))
-                    self.logger.debug(f'Selected quality link: {link}')
+                main_sources, alternate_sources = self._get_video_sources(dl_links)
+                self.logger.debug(f'Video sources: {main_sources = }, {alternate_sources = }')
+                link = main_sources[0]['file'] if main_sources else None
 
                 # skip if no stream link found
                 if link is None:
@@ -218,9 +252,9 @@ class KissKhClient(BaseClient):
                         self.logger.debug(f'Checking encryption type for {k} language...')
                         encryption_type = v.split('?')[0].split('.')[-1]
                         if encryption_type == 'txt':
-                            encrypted_subs_details[k] = {'key': self.DECRYPT_SUBS_KEY, 'iv': self.DECRYPT_SUBS_IV, 'decrypter': self._aes_decrypt}
+                            encrypted_subs_details[k] = {'key': self.DECRYPT_SUBS_KEY, 'iv': self.DECRYPT_SUBS_IV, 'decrypter': self._aes_decrypt, 'batch_decrypter': self._aes_decrypt_batch}
                         elif encryption_type == 'txt1':
-                            encrypted_subs_details[k] = {'key': self.DECRYPT_SUBS_KEY2, 'iv': self.DECRYPT_SUBS_IV2, 'decrypter': self._aes_decrypt}
+                            encrypted_subs_details[k] = {'key': self.DECRYPT_SUBS_KEY2, 'iv': self.DECRYPT_SUBS_IV2, 'decrypter': self._aes_decrypt, 'batch_decrypter': self._aes_decrypt_batch}
                         elif encryption_type == 'srt':
                             continue    # no encryption
                         else:
@@ -230,17 +264,20 @@ class KissKhClient(BaseClient):
                         self.logger.debug(f'Encrypted subtitles found. Adding decryption details')
                         self._update_scraper_dict(episode.get('episode'), {'encrypted_subs_details': encrypted_subs_details})
 
-                # Create quality options if we have a video data object
-                if isinstance(dl_links.get('Video'), dict):
-                    qualities = dl_links['Video'].get('qualities', {})
-                    m3u8_links = {}
-                    for quality, quality_link in qualities.items():
-                        m3u8_links[quality] = {'file': quality_link, 'type': 'mp4' if '.mp4' in quality_link else 'hls'}
+                # resolutions of the stream, with the alternate servers of the same stream collected as mirrors
+                config_data = (self.base_url, self.preferred_urls, self.blacklist_urls)
+                if len(main_sources) == 1:
+                    # single (master) link: raced against the alternate servers, the fastest one is the primary
+                    m3u8_links = self._get_download_links(main_sources + alternate_sources, *config_data)
                 else:
-                    # Single quality link
-                    link_type = 'mp4' if '.mp4' in link else 'hls'
-                    m3u8_links = {'720': {'file': link, 'type': link_type}}
-
+                    # every quality is a resolution on its own, the alternate servers are mirrors of the matching one
+                    m3u8_links = {}
+                    for source in main_sources:
+                        m3u8_links.update((res, details) for res, details in self._get_download_links([source], *config_data).items() if res != 'error')
+                    m3u8_links = dict(sorted(m3u8_links.items(), key=lambda x: int(x[0])))
+                    self._add_mirror_sources(m3u8_links, alternate_sources, *config_data)
+                if not m3u8_links:
+                    m3u8_links = {'error': 'No resolutions found in the stream links'}
                 self.logger.debug(f'Available quality options: {list(m3u8_links.keys())}')
 
                 download_links[episode.get('episode')] = m3u8_links
@@ -248,6 +285,15 @@ class KissKhClient(BaseClient):
 
         return download_links
 
+    def clone(self):
+        client = super().clone()
+        # quickjs context is not thread-safe, so every clone creates its own
+        client.quickjs_context = None
+        return client
+
+    def get_series_id(self, target_series):
+        return target_series.get('series_id')
+
     def set_out_names(self, target_series):
         '''Set output names for downloads'''
         drama_title = self._windows_safe_string(target_series['title'])
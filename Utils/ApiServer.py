@@ -0,0 +1,117 @@
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import GeneratorType
+from urllib.parse import parse_qsl, urlparse
+
+
+class ApiError(Exception):
+    '''
+    Exception raised by the route handlers to return an error response with the given http status
+    '''
+    def __init__(self, msg, status=400):
+        super().__init__(msg)
+        self.status = status
+
+
+class ApiServer():
+    '''
+    Minimal JSON API on top of http.server (one thread per request).
+
+    Routes map (method, path) to handler functions accepting a dict of parameters (query parameters merged with
+    the JSON body). The result of the handler is returned as JSON. Handlers returning a generator are streamed as
+    newline-delimited JSON (an object per line), to report progress of long-running requests.
+    '''
+    def __init__(self, host, port, routes):
+        self.logger = logging.getLogger()
+        self.routes = routes
+        self.httpd = ThreadingHTTPServer((host, port), self._create_handler())
+        self.httpd.daemon_threads = True
+        self.address = f'http://{host}:{self.httpd.server_address[1]}'
+
+    def _create_handler(self):
+        server = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                server.logger.debug(f'[API] {self.address_string()} {format % args}')
+
+            def _send_json(self, status, data):
+                body = json.dumps(data, default=str).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _stream_json(self, results):
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.send_header('Cache-Control', 'no-cache')
+                self.end_headers()
+                try:
+                    for result in results:
+                        self.wfile.write(json.dumps(result, default=str).encode('utf-8') + b'\n')
+                        self.wfile.flush()
+                except ConnectionError:
+                    # broken pipe, connection reset/aborted: client went away, so stop producing results
+                    server.logger.debug(f'[API] Client disconnected from stream {self.path}')
+                except Exception as e:
+                    server.logger.error(f'[API] Stream {self.path} failed with error: {e}')
+                    try:
+                        self.wfile.write(json.dumps({'error': str(e)}).encode('utf-8') + b'\n')
+                    except ConnectionError:
+                        pass
+                finally:
+                    results.close()
+                self.close_connection = True
+
+            def _handle(self, method):
+                url = urlparse(self.path)
+                handler = server.routes.get((method, url.path.rstrip('/') or '/'))
+                if handler is None:
+                    return self._send_json(404, {'error': f'Unknown endpoint: {method} {url.path}'})
+
+                try:
+                    params = dict(parse_qsl(url.query))
+                    length = int(self.headers.get('Content-Length') or 0)
+                    if length > 0:
+                        body = json.loads(self.rfile.read(length))
+                        if not isinstance(body, dict):
+                            raise ApiError('Request body must be a JSON object')
+                        params.update(body)
+                    result = handler(params)
+                except ApiError as e:
+                    return self._send_json(e.status, {'error': str(e)})
+                except (KeyError, ValueError) as e:
+                    return self._send_json(400, {'error': f'Invalid request: {e}'})
+                except Exception as e:
+                    server.logger.error(f'[API] {method} {self.path} failed with error: {e}')
+                    return self._send_json(500, {'error': str(e)})
+
+                if isinstance(result, GeneratorType):
+                    return self._stream_json(result)
+                self._send_json(200, result)
+
+            def do_GET(self):
+                self._handle('GET')
+
+            def do_POST(self):
+                self._handle('POST')
+
+        return RequestHandler
+
+    def serve_forever(self):
+        self.logger.info(f'API server listening on {self.address}')
+        self.httpd.serve_forever()
+
+    def start(self):
+        '''
+        Serve in a background thread
+        '''
+        threading.Thread(target=self.serve_forever, name='scraper-api', daemon=True).start()
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
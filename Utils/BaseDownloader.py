@@ -1,13 +1,68 @@
+import bisect
+import hashlib
 import logging
 import os
 import requests
+import subprocess
 import sys
+import threading
 import http.client
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from shutil import rmtree
+from time import monotonic, sleep, time
 from tqdm.auto import tqdm
 
-from Utils.commons import colprint, exec_os_cmd, retry, PRINT_THEMES, DISPLAY_COLORS
+from Utils.commons import colprint, DownloadCancelled, DownloadError, PRINT_THEMES, DISPLAY_COLORS
+from Utils.ConcurrencyController import get_controller, get_host
+from Utils.DiskSpace import get_disk_space
+from Utils.DownloadJournal import DownloadJournal, crc32_file, sync_file
+from Utils.FFmpegRunner import get_runner
+from Utils.FileMerger import FileMerger
+from Utils.MirrorPool import MirrorPool
+from Utils.MirrorSelector import get_mirror_selector
+from Utils.RateLimiter import get_limiter
+from Utils.RetryScheduler import RetryPolicy, RetryScheduler
+
+# command line limits for starting ffmpeg: Windows limits the whole command line to 32767 chars (CreateProcess),
+# Linux limits every single argument to 128 KiB including the terminating null byte (MAX_ARG_STRLEN)
+MAX_COMMAND_LINE = 32767
+MAX_ARG_BYTES = 128 * 1024
+
+# bytes & wall time of the transfers per download host, across the process: host -> {'active': running transfers,
+# 'since': start of the current busy period, 'busy': secs with any transfer running (before it), 'bytes': received}
+_host_transfers = {}
+_host_transfers_lock = threading.Lock()
+
+def _get_host_totals(meter, now):
+    '''
+    Returns (bytes received, secs with any transfer running) from the host so far
+    '''
+    busy = meter['busy'] + (now - meter['since'] if meter['active'] else 0)
+    return meter['bytes'], busy
+
+
+class ByteRange():
+    '''
+    Byte range of a file downloaded by a single request.
+    End of the range can shrink while downloading, when its remaining part is split into a new range.
+    '''
+    def __init__(self, url, start, end, name):
+        self.url = url
+        self.start = start
+        self.end = end
+        self.name = name
+        self.position = start       # next byte to be received
+        self.streaming = False      # range can be split only while data is being received
+        self.reported = 0           # bytes added to the progress bar
+        self.lock = threading.Lock()
+
+    def size(self):
+        return self.end - self.start + 1
+
+    def remaining(self):
+        return self.end - self.position + 1
 
 
 class BaseDownloader():
@@ -24,14 +79,61 @@ class BaseDownloader():
         if ep_details.get('type', '') == 'tv':
             self.out_dir = f"{self.out_dir}{os.sep}Season-{ep_details['season']}"
         self.concurrency = None if dl_config.get('concurrency_per_file', 'auto') == 'auto' else dl_config['concurrency_per_file']
+        # in-flight requests per host are adapted live (AIMD), if concurrency is auto
+        self.adaptive_concurrency = dl_config.get('adaptive_concurrency', {}) if self.concurrency is None else None
         self.parent_temp_dir = os.path.join(f'{self.out_dir}', 'temp_dir') if dl_config.get('temp_download_dir', 'auto') == 'auto' else dl_config['temp_download_dir']
         self.temp_dir = os.path.join(f"{self.parent_temp_dir}", f"{self.out_file.replace('.mp4','')}") #create temp directory per episode
         self.request_timeout = dl_config.get('request_timeout', 30)
+        # ffmpeg jobs: max heavy jobs running at once across all downloads ('auto' = CPU cores) and timeout per job
+        max_parallel_ffmpeg = dl_config.get('max_parallel_ffmpeg', 'auto')
+        self.ffmpeg_runner = get_runner(None if max_parallel_ffmpeg == 'auto' else max_parallel_ffmpeg)
+        self.ffmpeg_timeout = dl_config.get('ffmpeg_timeout', 3600)
+        self.duration = None        # duration of the video in secs, if known (to show muxing progress)
+        # process-wide bandwidth limit shared by all parallel downloads
+        self.rate_limiter = get_limiter(dl_config.get('bandwidth_limit'))
+        # retry policies per error class and max retries allowed per download ('auto' scales with number of segments/chunks)
+        self.retry_policy = RetryPolicy(dl_config.get('retry_policies'))
+        self.retry_budget = dl_config.get('retry_budget', 'auto')
+        # speculative duplicate requests for straggler segments at the tail of the download
+        self.hedge_config = {'enabled': True, 'after_progress': 0.9, 'latency_percentile': 95, 'min_samples': 20, 'min_delay': 2}
+        self.hedge_config.update(dl_config.get('hedge_requests', {}))
         self.series_type = ep_details.get('type', 'series')
         self.subtitles = ep_details.get('subtitles', {})
         # special case for encrypted subtitles in kisskh client
         self.encrypted_subs_details = ep_details.get('encrypted_subs_details', {})
+        self.subtitles_thread = None
+        # decrypted subtitles are cached by source url (shared by all episodes/resolutions). 0 disables the cache
+        self.subtitles_cache_days = dl_config.get('subtitles_cache_days', 7)
+        self.subtitles_cache_dir = dl_config.get('subtitles_cache_dir', os.path.join(f"{dl_config['download_dir']}", '.scraper_subtitles_cache'))
         self.thread_name_prefix = 'scraper-mp4-'
+        # remaining part of a range is split for a free connection only if both parts are at least this big
+        self.min_split_size = dl_config.get('min_split_size_mb', 4) * 1024 * 1024
+        self.range_support = True
+        self.progress = None
+        # alternative links serving the same stream. Requests are spread across all the healthy mirrors
+        self.mirror_links = [ m for m in ep_details.get('mirrorLinks', []) if m != ep_details.get('downloadLink') ]
+        self.mirror_pool = None
+        self.mirror_sources = {}    # item url -> {mirror: source url}
+        self.source_mirrors = {}    # source url -> mirror
+        self.failed_mirrors = {}    # item name -> mirrors failed for the item
+        # callback to resolve the download link again, as signed stream links expire (before or while downloading)
+        self.download_link = ep_details.get('downloadLink')
+        self.resolver = ep_details.get('resolver')
+        self.link_resolved_at = ep_details.get('resolvedAt', time())
+        self.link_max_age = dl_config.get('link_max_age', 900)
+        self.max_link_refreshes = dl_config.get('max_link_refreshes', 3)
+        self.link_refreshes = 0
+        self.refresh_lock = threading.Lock()
+        self.refreshed_urls = {}    # url being downloaded -> url from the latest resolution of the link
+        self.progress_lock = threading.Lock()
+        # host the bytes of the running transfer are counted for, to measure the throughput
+        self.transfer_host = None
+        # space for temp files & output is reserved when the download starts (off: no check)
+        self.disk_space_check = dl_config.get('disk_space_check', 'trim')
+        self.disk_space = get_disk_space(dl_config.get('min_free_space_mb', 500))
+        self.size_estimate = int(ep_details['filesizeMb'] * 1024**2) if ep_details.get('filesizeMb') else None
+        # journal of completed segments/chunks, used to resume downloads safely
+        self.journal = DownloadJournal(os.path.join(f'{self.temp_dir}', 'download.journal'))
 
         # create a requests session and use across to re-use cookies
         self.req_session = session if session else requests.Session()
@@ -72,7 +174,7 @@ class BaseDownloader():
             if response.status in [200, 206]:  # 206 means partial data (i.e., for chunked downloads)
                 return response
             else:
-                raise Exception(f'Failed with response code: {response.status}')
+                raise DownloadError(f'Failed with response code: {response.status}', response.status, response.getheader('Retry-After'))
         else:
             # Use requests for the request
             headers = self.req_session.headers.copy()
@@ -81,7 +183,108 @@ class BaseDownloader():
             if response.status_code in [200, 206]:  # 206 means partial data (i.e., for chunked downloads)
                 return response
             else:
-                raise Exception(f'Failed with response code: {response.status_code}')
+                raise DownloadError(f'Failed with response code: {response.status_code}', response.status_code, response.headers.get('Retry-After'))
+
+    def _resolve_link(self):
+        '''
+        Resolve the download link of the episode again. Returns the new download link
+        '''
+        ep_details = self.resolver()
+        if not ep_details.get('downloadLink'):
+            raise Exception(f'Failed to resolve download link again: {ep_details.get("error", "Unknown")}')
+
+        self.link_resolved_at = time()
+        self.mirror_links = [ m for m in ep_details.get('mirrorLinks', []) if m != ep_details['downloadLink'] ]
+        if ep_details.get('refererLink'): self.req_session.headers.update({"Referer": ep_details['refererLink']})
+        self.logger.debug(f'Download link of {self.out_file} resolved again: {ep_details["downloadLink"]}')
+
+        return ep_details['downloadLink']
+
+    def get_download_link(self):
+        '''
+        Download link of the episode, resolved again just before the download if it is older than link_max_age
+        '''
+        if self.resolver and time() - self.link_resolved_at > self.link_max_age:
+            self.logger.info(f'Download link of {self.out_file} is older than {self.link_max_age}s. Resolving it again')
+            try:
+                self.download_link = self._resolve_link()
+            except Exception as e:
+                self.logger.warning(f'{e}. Using the existing link')
+
+        return self.download_link
+
+    def _is_link_url(self, url):
+        '''
+        Check if the url comes from the download link of the episode (i.e., not from a mirror), so it can be refreshed
+        '''
+        return url == getattr(self, 'dl_link', None)
+
+    def _refresh_sources(self, dl_link):
+        '''
+        Map the url being downloaded to the newly resolved link (only if it serves the same file)
+        '''
+        file_size, _ = self._get_file_details(dl_link)
+        if file_size != self.file_size:
+            raise Exception(f'Resolved link serves a different file (size {file_size} / {self.file_size})')
+        self.refreshed_urls[self.dl_link] = dl_link
+
+    def _refresh_expired_url(self, url, used_url):
+        '''
+        Called when the request for url failed as expired (403/410). Resolves the link again (once for all the requests)
+        and maps the urls being downloaded to the new ones. Returns True if the request should be retried with the new url.
+        '''
+        if self.resolver is None or not self._is_link_url(url):
+            return False
+
+        with self.refresh_lock:
+            if self.refreshed_urls.get(url, url) != used_url:
+                return True     # already refreshed by another request
+
+            if self.link_refreshes >= self.max_link_refreshes:
+                return False
+            self.link_refreshes += 1
+
+            self.logger.info(f'[{self._get_display_prefix()}] Link expired. Resolving it again ({self.link_refreshes}/{self.max_link_refreshes})...')
+            try:
+                self._refresh_sources(self._resolve_link())
+            except Exception as e:
+                self.logger.warning(f'[{self._get_display_prefix()}] Failed to refresh expired link: {e}')
+                return False
+
+            return self.refreshed_urls.get(url, url) != used_url
+
+    def _open_stream(self, url, header=None, report_latency=True):
+        '''
+        Open stream for the url (from the latest resolution of the link). Returns (response, requested url).
+        Request is retried once with the refreshed url, if the link has expired.
+        - report_latency: report time-to-first-byte to the concurrency controller of the host (segment & chunk requests only)
+        '''
+        def _open(current_url):
+            request_start = monotonic()
+            response = self._get_raw_stream_data(current_url, True, header)
+            if report_latency: self._report_latency(current_url, monotonic() - request_start)
+            return response, current_url
+
+        current_url = self.refreshed_urls.get(url, url)
+        try:
+            return _open(current_url)
+        except DownloadError as e:
+            if e.status not in (403, 410) or not self._refresh_expired_url(url, current_url):
+                raise
+
+        return _open(self.refreshed_urls.get(url, url))
+
+    def _get_concurrency_controller(self, url):
+        if self.adaptive_concurrency is None:
+            return None
+        return get_controller(url, **self.adaptive_concurrency)
+
+    def _report_latency(self, url, latency):
+        '''
+        Report time-to-first-byte to the concurrency controller of the host
+        '''
+        controller = self._get_concurrency_controller(url)
+        if controller: controller.on_response(latency)
 
     def _get_stream_data(self, url, to_text=False, stream=False):
         response = self._get_raw_stream_data(url, stream)
@@ -91,6 +294,12 @@ class BaseDownloader():
         else:
             return response.text if to_text else response.content
 
+    def get_out_files(self):
+        '''
+        Possible output files of the download. Download is skipped if any of them already exists
+        '''
+        return [ os.path.join(f'{self.out_dir}', f'{self.out_file}') ]
+
     def _create_out_dirs(self):
         self.logger.debug(f'Creating output directories: {self.out_dir}')
         os.makedirs(self.out_dir, exist_ok=True)
@@ -99,13 +308,45 @@ class BaseDownloader():
     def _remove_out_dirs(self):
         rmtree(self.temp_dir)
 
+    def _reserve_disk_space(self, size):
+        '''
+        Reserve space for the temp files & output of the download. Fails the download right away if it doesn't fit,
+        instead of running out of space midway
+        '''
+        if self.disk_space_check != 'off' and size:
+            # bytes already written (temp files of a resumed download, output being merged) are not reserved again
+            out_files = self.get_out_files()
+            paths = [self.temp_dir] + out_files + [ os.path.join(os.path.dirname(f), f'temp_{os.path.basename(f)}') for f in out_files ]
+            self.disk_space.reserve(self.temp_dir, size, self.out_dir, self.parent_temp_dir, paths)
+
     def _cleanup_out_dirs(self):
+        self.disk_space.release(self.temp_dir)
+        self._prune_subtitles_cache()
         if len(os.listdir(self.parent_temp_dir)) == 0: os.rmdir(self.parent_temp_dir)
         if len(os.listdir(self.out_dir)) == 0: os.rmdir(self.out_dir)
 
-    def _exec_cmd(self, cmd):
-        self.logger.debug(f'Executing system command: {cmd}')
-        return exec_os_cmd(cmd)
+    def _run_ffmpeg(self, args, desc='Muxing'):
+        '''
+        Run ffmpeg command (list of args) as a heavy job, showing its live progress
+        '''
+        theme = PRINT_THEMES['results'] if DISPLAY_COLORS else ''
+        progress_args = {
+            'desc': f'{desc} {self._get_display_prefix()}',
+            'total': round(self.duration) if self.duration else None,
+            'unit': 's',
+            'file': sys.stdout,
+            'ascii': '░▒█',
+            'leave': False,
+            'bar_format': theme + '{l_bar}{bar}' + theme + '{r_bar}'
+        }
+        with tqdm(**progress_args) as progress:
+            def _on_progress(status):
+                # out_time_ms is in microseconds as well (ffmpeg naming quirk)
+                out_time = int(status.get('out_time_us', status.get('out_time_ms', 0)) or 0) // 10**6
+                if out_time > progress.n: progress.update(out_time - progress.n)
+
+            args = args[:-1] + ['-progress', 'pipe:1', '-nostats', args[-1]]     # output file must be the last argument
+            return self.ffmpeg_runner.run(args, timeout=self.ffmpeg_timeout, on_progress=_on_progress)
 
     def _get_display_prefix(self):
         # shorten the name to show only ep number
@@ -130,53 +371,332 @@ class BaseDownloader():
 
         return display_prefix
 
-    def _create_chunk_header(self, start):
-        end = start + self.chunk_size - 1
+    def _create_chunk_header(self, start, end):
         return {'Range': f'bytes={start}-{end}'}
 
-    @retry()
-    def _download_chunk(self, chunk_details):
+    def _get_response_status(self, response):
+        return response.status if isinstance(response, http.client.HTTPResponse) else response.status_code
+
+    def _iter_response(self, response, block_size, url=None):
         '''
-        download chunk file from download link based on defined chunk size. Reuse if already downloaded.
+        Iterate through the response body in blocks of given size (within the bandwidth limits)
+        '''
+        host = get_host(url) if url else None
+        if isinstance(response, http.client.HTTPResponse):
+            while True:
+                chunk = response.read(block_size)
+                if not chunk:
+                    break
+                self.rate_limiter.consume(len(chunk), host)
+                yield chunk
+        else:
+            for chunk in response.iter_content(block_size):
+                if chunk:
+                    self.rate_limiter.consume(len(chunk), host)
+                    yield chunk
 
-        Returns: (download_status, progress_bar_increment)
+    def _report_progress(self, byte_range, done):
         '''
-        try:
-            dl_link, chunk_header, chunk_name = chunk_details
-            chunk_file = os.path.join(f'{self.temp_dir}', f'{chunk_name}')
-
-            # check if the chunk is already downloaded
-            if os.path.isfile(chunk_file) and os.path.getsize(chunk_file) > 0:
-                return (f'Chunk [{chunk_name}] already exists. Reusing.', os.path.getsize(chunk_file))
-
-            # get the data for the chunk size defined in the header
-            response = self._get_raw_stream_data(dl_link, False, chunk_header)
-
-            # capture the size to update progress bar
-            size = 0 
-            with open(chunk_file, 'wb') as f:
-                if isinstance(response, http.client.HTTPResponse):
-                    while True:
-                        chunk = response.read(self.chunk_size)
-                        if not chunk:
+        Update progress bar live with the bytes received for the range (ranges are too big to wait for completion)
+        '''
+        increment, byte_range.reported = done - byte_range.reported, done
+        if self.progress is not None and increment != 0:
+            with self.progress_lock:
+                self.progress.update(increment)
+
+    def _download_chunk(self, byte_range, source_url=None):
+        '''
+        download chunk file from download link (or mirror link in source_url) for the byte range. Reuse if already downloaded.
+        Partially downloaded chunks are resumed from the last written byte.
+
+        Returns: (download_status, progress_bar_increment). Raises exception on failure.
+        '''
+        chunk_name, start = byte_range.name, byte_range.start
+        chunk_file = os.path.join(f'{self.temp_dir}', f'{chunk_name}')
+
+        # check if the chunk is already downloaded
+        entry = self.journal.get(chunk_name)
+        if entry and entry['size'] == byte_range.size() and self.journal.is_complete(chunk_name, chunk_file):
+            byte_range.position = byte_range.end + 1
+            self._report_progress(byte_range, byte_range.size())
+            return (f'Chunk [{chunk_name}] already exists. Reusing.', 0)
+
+        # resume from the last written byte, if a partial chunk exists (journaled chunk not matching the journal is corrupt)
+        written = os.path.getsize(chunk_file) if os.path.isfile(chunk_file) and entry is None else 0
+        with byte_range.lock:
+            written = min(written, byte_range.size())
+            byte_range.position = start + written
+        if os.path.isfile(chunk_file) and os.path.getsize(chunk_file) > written:
+            with open(chunk_file, 'r+b') as f:
+                f.truncate(written)
+        crc = crc32_file(chunk_file, written) if written > 0 else 0
+        self._report_progress(byte_range, written)
+
+        if byte_range.remaining() > 0:
+            # get the data for the remaining range of the chunk
+            request_start, request_position = monotonic(), byte_range.position
+            response, request_url = self._open_stream(source_url or byte_range.url, self._create_chunk_header(byte_range.position, byte_range.end))
+            status = self._get_response_status(response)
+            if status != 206 and byte_range.position > 0:
+                response.close()
+                if start > 0:
+                    raise DownloadError(f'Range request not honored by server (response code: {status})', status)
+                # range not honored by server, so start over
+                written, crc, byte_range.position = 0, 0, start
+
+            byte_range.streaming = True
+            try:
+                with open(chunk_file, 'ab' if written > 0 else 'wb') as f:
+                    for chunk in self._iter_response(response, 64*1024, request_url):
+                        # end of range can shrink anytime, if it is split for another connection
+                        with byte_range.lock:
+                            chunk = chunk[:byte_range.remaining()]
+                            byte_range.position += len(chunk)
+                            finished = byte_range.remaining() <= 0
+                        crc = zlib.crc32(chunk, crc)
+                        f.write(chunk)
+                        self._report_progress(byte_range, byte_range.position - start)
+                        if finished:
                             break
-                        size += f.write(chunk)
-                else:
-                    for chunk in response.iter_content(self.chunk_size):
-                        if chunk:
-                            size += f.write(chunk)
+                    sync_file(f)
+            finally:
+                byte_range.streaming = False
+                response.close()
+            self._report_source_success(source_url or byte_range.url, byte_range.position - request_position, monotonic() - request_start)
+
+        with byte_range.lock:
+            size, remaining = byte_range.position - start, byte_range.remaining()
+        if remaining > 0:
+            raise ConnectionError(f'Incomplete chunk received ({size}/{size + remaining} bytes)')
+
+        self.journal.record(chunk_name, size, crc, start=start)
+        if written > 0:
+            return (f'Chunk [{chunk_name}] resumed from byte {written}', 0)
+
+        return (f'Chunk [{chunk_name}] downloaded', 0)
+
+    def _get_split_point(self, position, end):
+        '''
+        Return the (chunk aligned) middle of the remaining range, if both parts are big enough to split
+        '''
+        split_at = position + (end - position + 1) // 2
+        split_at -= split_at % self.chunk_size
+        if split_at - position < self.min_split_size or end - split_at + 1 < self.min_split_size:
+            return None
+
+        return split_at
+
+    def _split_largest_range(self, in_flight_ranges):
+        '''
+        Split the remaining part of the largest in-flight range into a new range, so that a free connection steals
+        work from the slowest one. Returns the new range or None if nothing is worth splitting.
+        '''
+        streaming_ranges = [ r for r in in_flight_ranges if r.streaming ]
+        if not self.range_support or not streaming_ranges:
+            return None
+
+        largest = max(streaming_ranges, key=lambda r: r.remaining())
+        with largest.lock:
+            split_at = self._get_split_point(largest.position, largest.end)
+            if split_at is None:
+                return None
+            new_range = ByteRange(largest.url, split_at, largest.end, f'{self.out_file}.chunk{split_at}')
+            largest.end = split_at - 1
+
+        self.logger.debug(f'Split [{largest.name}] at byte {split_at}. New range: {new_range.start}-{new_range.end}')
+        return new_range
+
+    def _get_file_details(self, dl_link):
+        '''
+        Return file size and if the server supports range requests
+        '''
+        response = self._get_raw_stream_data(dl_link, True, self._create_chunk_header(0, ''))
+        content_range = response.headers.get('content-range', '')
+        if self._get_response_status(response) == 206 and content_range.split('/')[-1].isdigit():
+            file_size, range_support = int(content_range.split('/')[-1]), True
+        else:
+            file_size, range_support = int(response.headers.get('content-length', 0)), False
+        response.close()
+
+        return file_size, range_support
+
+    def _setup_mirrors(self, dl_link, file_size):
+        '''
+        Validate mirror links (same file size and range support) and enable multi-mirror download
+        '''
+        sources = {dl_link: dl_link}
+        for mirror_link in self.mirror_links:
+            try:
+                mirror_size, mirror_range_support = self._get_file_details(mirror_link)
+                if mirror_size != file_size or not mirror_range_support:
+                    self.logger.debug(f'Skipping mirror [{mirror_link}]: size {mirror_size} / {file_size}, range support: {mirror_range_support}')
+                    continue
+                sources[mirror_link] = mirror_link
+            except Exception as e:
+                self.logger.warning(f'Skipping mirror [{mirror_link}] due to error: {e}')
+
+        if len(sources) > 1:
+            self._set_mirror_sources({dl_link: sources})
+
+    def _plan_ranges(self, dl_link, file_size):
+        '''
+        Plan the ranges to download: chunks completed in earlier attempts (from journal) are reused,
+        and the remaining gaps are split to start with one large range per connection.
+        '''
+        if not self.range_support:
+            return [ ByteRange(dl_link, 0, file_size - 1, f'{self.out_file}.chunk0') ]
+
+        chunk_prefix = f'{self.out_file}.chunk'
+        ranges, gaps, covered = [], [], 0
+        completed = sorted([ e for e in self.journal.entries.values() if e['name'].startswith(chunk_prefix) and 'start' in e ], key=lambda e: e['start'])
+        for entry in completed:
+            if entry['start'] < covered or entry['start'] + entry['size'] > file_size:
+                continue
+            if entry['start'] > covered:
+                gaps.append([covered, entry['start'] - 1])
+            ranges.append(ByteRange(dl_link, entry['start'], entry['start'] + entry['size'] - 1, entry['name']))
+            covered = entry['start'] + entry['size']
+        if covered < file_size:
+            gaps.append([covered, file_size - 1])
+
+        # split the largest gap till there is a range per connection
+        controller = self._get_concurrency_controller(dl_link)
+        connections = self.concurrency or controller.get_limit()
+        while gaps and len(gaps) < connections:
+            largest = max(gaps, key=lambda g: g[1] - g[0])
+            split_at = self._get_split_point(*largest)
+            if split_at is None:
+                break
+            gaps.append([split_at, largest[1]])
+            largest[1] = split_at - 1
+
+        ranges.extend(ByteRange(dl_link, start, end, f'{chunk_prefix}{start}') for start, end in gaps)
+
+        return sorted(ranges, key=lambda r: r.start)
+
+    def _get_item_name(self, item):
+        '''
+        Name of the segment/chunk to display (segments are urls, chunks are chunk details)
+        '''
+        return item.split('/')[-1] if isinstance(item, str) else item.name
+
+    def _get_item_url(self, item):
+        return item if isinstance(item, str) else item.url
+
+    def _set_mirror_sources(self, mirror_sources):
+        '''
+        Enable multi-mirror download. Accepts dict of item url -> {mirror: source url}
+        '''
+        mirrors = list(dict.fromkeys(m for sources in mirror_sources.values() for m in sources))
+        self.mirror_pool = MirrorPool(mirrors)
+        self.mirror_sources = mirror_sources
+        self.source_mirrors = { url: m for sources in mirror_sources.values() for m, url in sources.items() }
+        self.logger.info(f'Downloading from {len(mirrors)} mirrors: {mirrors}')
 
-            return (f'Chunk [{chunk_name}] downloaded', size)
+    def _get_source_url(self, item, exclude_url=None):
+        '''
+        Pick the mirror to fetch the item from. Returns None if there are no mirrors (i.e., use item url)
+        '''
+        sources = self.mirror_sources.get(self._get_item_url(item)) if self.mirror_pool else None
+        if not sources:
+            return None
+
+        exclude = set(self.failed_mirrors.get(self._get_item_name(item), ()))
+        if exclude_url in self.source_mirrors: exclude.add(self.source_mirrors[exclude_url])
+        return sources[self.mirror_pool.pick(sources.keys(), exclude)]
+
+    def _report_source_success(self, source_url, nbytes, seconds):
+        # bytes received from the network (reused segments/chunks are not counted), to measure the throughput
+        if self.transfer_host:
+            with _host_transfers_lock:
+                _host_transfers[self.transfer_host]['bytes'] += nbytes
+        mirror = self.source_mirrors.get(source_url)
+        if mirror: self.mirror_pool.report_success(mirror, nbytes, seconds)
+
+    def _report_source_failure(self, item, source_url):
+        '''
+        Record the failed mirror, so that the retry of the item goes to another mirror
+        '''
+        mirror = self.source_mirrors.get(source_url)
+        if mirror:
+            self.mirror_pool.report_failure(mirror)
+            self.failed_mirrors.setdefault(self._get_item_name(item), set()).add(mirror)
+
+    def _get_alternate_url(self, item, current_url=None):
+        '''
+        Source url for a hedged request of the item (another mirror, if available)
+        '''
+        return self._get_source_url(item, exclude_url=current_url) or self._get_item_url(item)
+
+    def _get_hedge_threshold(self, latencies, progress_ratio):
+        '''
+        Return the time (in secs) after which an in-flight request is considered a straggler, None if not enough data yet
+        '''
+        if len(latencies) < self.hedge_config['min_samples']:
+            return None
+
+        # at the tail of the download, duplicate anything slower than the median. Otherwise, only the outliers
+        percentile = 50 if progress_ratio >= self.hedge_config['after_progress'] else self.hedge_config['latency_percentile']
+        latency = latencies[min(len(latencies) - 1, len(latencies) * percentile // 100)]
+
+        return max(self.hedge_config['min_delay'], latency)
 
-        except Exception as e:
-            return (f'\nERROR: Chunk download failed [{chunk_name}] due to: {e}', 0)
+    def _get_retry_budget(self, items_count):
+        if self.retry_budget == 'auto':
+            return max(10, items_count // 5)
+        return self.retry_budget
+
+    def _start_transfer(self):
+        '''
+        Register a running transfer of the download. Returns the totals of its host at the start (if any)
+        '''
+        if not self.download_link:
+            return None
+        self.transfer_host = get_host(self.download_link)
+        with _host_transfers_lock:
+            now = monotonic()
+            meter = _host_transfers.setdefault(self.transfer_host, {'active': 0, 'since': now, 'busy': 0, 'bytes': 0})
+            if meter['active'] == 0: meter['since'] = now
+            meter['active'] += 1
+            return _get_host_totals(meter, now)
+
+    def _end_transfer(self, start_totals):
+        '''
+        Save the throughput of the host measured while the download ran, for the time budget of the resolution planner.
+        Bytes of all the parallel transfers from the host over the wall time they ran, so it is the throughput of the
+        batch. Saved once per download, short transfers are not a measurement
+        '''
+        if start_totals is None:
+            return
+        host, self.transfer_host = self.transfer_host, None
+        with _host_transfers_lock:
+            now = monotonic()
+            meter = _host_transfers[host]
+            end_totals = _get_host_totals(meter, now)
+            meter['active'] -= 1
+            if meter['active'] == 0: meter['busy'] += now - meter['since']
+
+        transferred, elapsed = end_totals[0] - start_totals[0], end_totals[1] - start_totals[1]
+        if transferred < 1024**2 or elapsed < 1:
+            return
+        self.logger.debug(f'[{self._get_display_prefix()}] Measured throughput of [{host}]: {transferred / elapsed / 1024**2:.2f} MB/s')
+        get_mirror_selector().record_download(host, transferred / elapsed)
 
     def _multi_threaded_download(self, download_func, urls, **metadata):
         reused_segments = 0
         failed_segments = 0
+        retried_segments = 0
+        hedged_segments = 0
         ep_no = self._get_display_prefix()
         type = metadata.pop('type')
-        self.logger.debug(f'[{ep_no}] Downloading {len(urls)} {type} using {self.concurrency} workers...')
+        # hedging requires download function to support source_url & cancel_event arguments
+        hedging = metadata.pop('hedge', False) and self.hedge_config['enabled']
+        # function to split in-flight work into a new item for a free worker (new items are appended to urls)
+        split_func = metadata.pop('split', None)
+        # with adaptive concurrency, pool size is the upper bound and the host controller decides in-flight requests
+        max_workers = self.concurrency or self.adaptive_concurrency.get('max_limit', 32)
+        retry_scheduler = RetryScheduler(self.retry_policy, self._get_retry_budget(len(urls)))
+        self.logger.debug(f'[{ep_no}] Downloading {len(urls)} {type} using {max_workers} workers (adaptive: {self.adaptive_concurrency is not None}, hedging: {hedging})...')
 
         theme = PRINT_THEMES['results'] if DISPLAY_COLORS else ''
         metadata.update({
@@ -187,131 +707,374 @@ class BaseDownloader():
             'bar_format': theme + '{l_bar}{bar}' + theme + '{r_bar}'
         })
 
+        ready = deque(range(len(urls)))
+        in_flight = {}          # future -> (item index, host controller, start time, source url)
+        attempts = {}           # item index -> in-flight requests (more than 1, if hedged)
+        cancel_events = {}      # item index -> event to cancel the slower duplicate request
+        finished = set()
+        hedged = set()
+        latencies = []          # sorted latencies of completed requests, to find stragglers
+
+        # parallelize download of segments/chunks using a threadpool
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=self.thread_name_prefix)
+
+        def _submit(idx, source_url=None):
+            source_url = source_url or self._get_source_url(urls[idx])
+            controller = self._get_concurrency_controller(source_url or self._get_item_url(urls[idx]))
+            if controller and not controller.try_acquire():
+                return False    # host limit reached, wait for a slot to free up
+
+            kwargs = {'cancel_event': cancel_events.setdefault(idx, threading.Event())} if hedging else {}
+            if source_url: kwargs['source_url'] = source_url
+            in_flight[executor.submit(download_func, urls[idx], **kwargs)] = (idx, controller, monotonic(), source_url)
+            attempts[idx] = attempts.get(idx, 0) + 1
+            return True
+
         # show progress of download using tqdm
-        with tqdm(**metadata) as progress:
-            # parallelize download of segments/chunks using a threadpool
-            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=self.thread_name_prefix) as executor:
-                results = [ executor.submit(download_func, ts_url) for ts_url in urls ]
-
-                for result in as_completed(results):
-                    status, size = result.result()
-                    if 'ERROR' in status:
-                        self._colprint('error', status)
-                        failed_segments += 1
-                    elif 'Reusing' in status:
-                        reused_segments += 1
-                        # update status only if segment is downloaded
-                        progress.update(size)
-                    else:
-                        progress.update(size)
-
-                    # add reused / failed segments/chunks status
-                    seg_status = f'R/F: {reused_segments}/{failed_segments}'
-                    progress.set_postfix_str(seg_status, refresh=True)
-
-        self.logger.info(f'[{ep_no}] {type.capitalize()} download status: Total: {len(urls)} | Reused: {reused_segments} | Failed: {failed_segments}')
+        transfer_start = self._start_transfer()
+        try:
+            with tqdm(**metadata) as progress:
+                self.progress = progress
+                while (ready or in_flight or retry_scheduler) and len(finished) + failed_segments < len(urls):
+                    # failed segments/chunks are re-queued only once their retry is due
+                    ready.extend(retry_scheduler.pop_ready())
+                    host_limited = False
+                    while ready and len(in_flight) < max_workers:
+                        if not _submit(ready[0]):
+                            host_limited = True
+                            break
+                        ready.popleft()
+
+                    # split in-flight work for the free workers, once there is nothing else to download
+                    while split_func and not ready and not host_limited and len(in_flight) < max_workers:
+                        new_item = split_func([ urls[idx] for idx, *_ in in_flight.values() ])
+                        if new_item is None:
+                            break
+                        urls.append(new_item)
+                        if not _submit(len(urls) - 1):
+                            ready.append(len(urls) - 1)
+                            break
+
+                    # speculatively duplicate the stragglers, once there is nothing else to download
+                    threshold = self._get_hedge_threshold(latencies, len(finished) / len(urls)) if hedging and not ready else None
+                    if threshold is not None:
+                        now = monotonic()
+                        for idx, _, started, current_url in list(in_flight.values()):
+                            if len(in_flight) >= max_workers:
+                                break
+                            if idx in hedged or now - started < threshold:
+                                continue
+                            source_url = self._get_alternate_url(urls[idx], current_url)
+                            if _submit(idx, source_url):
+                                hedged.add(idx)
+                                hedged_segments += 1
+                                self.logger.debug(f'[{ep_no}] Hedging [{self._get_item_name(urls[idx])}] after {now - started:.1f}s using {source_url}')
+
+                    # wait till any download completes or the next retry is due (or poll for a free slot/stragglers)
+                    timeout = retry_scheduler.time_to_next()
+                    if host_limited: timeout = min(timeout or 0.2, 0.2)
+                    if hedging: timeout = min(timeout or 0.5, 0.5)
+
+                    if not in_flight:
+                        sleep(timeout)
+                        continue
+
+                    done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+
+                    for result in done:
+                        idx, controller, started, source_url = in_flight.pop(result)
+                        attempts[idx] -= 1
+                        if controller: controller.release()
+                        if idx in finished:
+                            continue    # duplicate request lost the race
+
+                        try:
+                            status, size = result.result()
+                        except Exception as e:
+                            # a cancelled duplicate request is not a failure of the host
+                            if not isinstance(e, DownloadCancelled):
+                                if controller: controller.on_failure(self.retry_policy.classify(e))
+                                self._report_source_failure(urls[idx], source_url)
+                            if attempts[idx] > 0:
+                                continue    # duplicate request is still in progress
+                            item_name = self._get_item_name(urls[idx])
+                            delay = retry_scheduler.schedule(idx, e)
+                            if delay is None:
+                                self._colprint('error', f'\nERROR: {type.capitalize()} download failed [{item_name}] due to: {e}')
+                                failed_segments += 1
+                            else:
+                                self.logger.debug(f'[{ep_no}] Retrying [{item_name}] in {delay:.1f}s due to: {e}')
+                                retried_segments += 1
+                        else:
+                            finished.add(idx)
+                            # first response wins, cancel the duplicate request
+                            if idx in cancel_events: cancel_events[idx].set()
+                            if 'Reusing' in status:
+                                reused_segments += 1
+                            else:
+                                if controller: controller.on_success(size)
+                                bisect.insort(latencies, monotonic() - started)
+                            progress.update(size)
+
+                        # add reused / failed segments/chunks status
+                        seg_status = f'R/F: {reused_segments}/{failed_segments}'
+                        if retried_segments > 0: seg_status += f' | Retries: {retried_segments}'
+                        if hedged_segments > 0: seg_status += f' | Hedged: {hedged_segments}'
+                        progress.set_postfix_str(seg_status, refresh=True)
+
+        finally:
+            self.progress = None
+            # do not wait for the cancelled (or hung) duplicate requests
+            for event in cancel_events.values(): event.set()
+            for _, controller, *_ in in_flight.values():
+                if controller: controller.release()
+            executor.shutdown(wait=False, cancel_futures=True)
+            self._end_transfer(transfer_start)
+
+        self.logger.info(f'[{ep_no}] {type.capitalize()} download status: Total: {len(urls)} | Reused: {reused_segments} | Failed: {failed_segments} | Retries: {retried_segments} | Hedged: {hedged_segments}')
+        if self.mirror_pool: self.logger.info(f'[{ep_no}] Mirrors usage: {self.mirror_pool.summary()}')
         if failed_segments > 0:
             raise Exception(f'Failed to download {failed_segments} / {len(urls)} {type}')
 
-    def _merge_chunks(self, chunks_count):
+    def _validate_chunks(self, chunk_ranges):
+        '''
+        make sure the ranges (sorted by start) cover the whole file without any gaps
+        '''
+        for prev, cur in zip(chunk_ranges, chunk_ranges[1:]):
+            if prev.end + 1 != cur.start:
+                raise Exception(f'Chunks are not contiguous: [{prev.name}] ends at {prev.end}, [{cur.name}] starts at {cur.start}')
+
+    def _remove_files(self, files):
+        '''
+        remove files in one batch at the end of the merge
+        '''
+        for file in files:
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                pass
+
+    def _merge_chunks(self, chunk_ranges):
         out_file = os.path.join(f'{self.out_dir}', f'{self.out_file}')
+        # merge to a temp file first, so that an interrupted merge is never treated as a completed download
+        temp_out_file = os.path.join(f'{self.out_dir}', f'temp_{self.out_file}')
+        chunk_ranges = sorted(chunk_ranges, key=lambda r: r.start)
+        chunk_files = [ os.path.join(f"{self.temp_dir}", f"{r.name}") for r in chunk_ranges ]
 
-        with open(out_file, 'wb') as outfile:
-            # iterate through the downloaded chunks
-            for chunk_no in range(chunks_count):
-                chunk_file = os.path.join(f"{self.temp_dir}", f"{self.out_file}.chunk{chunk_no}")
-                # write the chunks to a single file
-                with open(chunk_file, 'rb') as s:
-                    outfile.write(s.read())
-                # remove the merged chunk
-                os.remove(chunk_file)
+        self._validate_chunks(chunk_ranges)
 
-    def _download_subtitles(self):
-        for sub_name in list(self.subtitles):
-            sub_link = self.subtitles[sub_name]
-            sub_file = os.path.join(self.temp_dir, sub_name.replace(' ', '_') + '_' + os.path.basename(sub_link.split('?')[0]))
-            # update the dictionary pointing to downloaded file
-            self.subtitles[sub_name] = sub_file
+        # chunks are copied kernel side (reflink/copy_file_range/sendfile) where possible
+        with FileMerger(temp_out_file, preallocate_size=self.file_size) as merger:
+            for chunk_file in chunk_files:
+                merger.append(chunk_file)
+
+        os.replace(temp_out_file, out_file)
+        # remove the merged chunks only after the merge is successful
+        self._remove_files(chunk_files)
+
+    def _get_subtitle_cache_file(self, sub_link):
+        '''
+        cache file of the subtitle, based on its url without query params (tokens in query change on every request)
+        '''
+        if not self.subtitles_cache_days:
+            return None
+
+        sub_url = sub_link.split('?')[0]
+        cache_key = hashlib.sha1(sub_url.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.subtitles_cache_dir, f'{cache_key}_{os.path.basename(sub_url)}')
+
+    def _prune_subtitles_cache(self):
+        '''
+        remove cached subtitles not used within the cache expiry. The cache is shared by the parallel downloads,
+        so files removed meanwhile by another download are skipped
+        '''
+        if not os.path.isdir(self.subtitles_cache_dir):
+            return
 
+        expiry = time() - (self.subtitles_cache_days or 0) * 86400
+        for cache_file in os.listdir(self.subtitles_cache_dir):
+            cache_file = os.path.join(self.subtitles_cache_dir, cache_file)
             try:
-                self.logger.debug(f'Downloading {sub_name} subtitle from {sub_link} to {sub_file}')
-                if os.path.isfile(sub_file):
-                    self.logger.debug('Subtitle file already exists. Skipping...')
-                    continue
-                sub_content = self._get_stream_data(sub_link)
-                # download the subtitle to local
-                with open(sub_file, 'wb') as f:
-                    f.write(sub_content)
+                if os.path.getmtime(cache_file) < expiry:
+                    os.remove(cache_file)
+            except FileNotFoundError:
+                continue
+
+    def _download_subtitle(self, sub_name, sub_link):
+        '''
+        download (and decrypt) the subtitle. Returns path of the local subtitle file
+        '''
+        cache_file = self._get_subtitle_cache_file(sub_link)
+        sub_file = cache_file or os.path.join(self.temp_dir, sub_name.replace(' ', '_') + '_' + os.path.basename(sub_link.split('?')[0]))
+
+        self.logger.debug(f'Downloading {sub_name} subtitle from {sub_link} to {sub_file}')
+        if os.path.isfile(sub_file):
+            self.logger.debug('Subtitle file already exists. Reusing...')
+            # expiry of a cached subtitle counts from its last use
+            if cache_file: os.utime(sub_file)
+            return sub_file
+
+        sub_content = self._get_stream_data(sub_link)
+        if self.encrypted_subs_details.get(sub_name):
+            self.logger.debug(f'Decrypting {sub_name} subtitle')
+            sub_content = self._decrypt_subtitle(sub_content.decode('utf-8'), **self.encrypted_subs_details[sub_name]).encode('utf-8')
+
+        # write to a temp file first, so that a partially written subtitle is never reused
+        os.makedirs(os.path.dirname(sub_file), exist_ok=True)
+        with open(f'{sub_file}.part', 'wb') as f:
+            f.write(sub_content)
+        os.replace(f'{sub_file}.part', sub_file)
 
-                if self.encrypted_subs_details.get(sub_name):
-                    self._decrypt_subtitle_file(sub_file, **self.encrypted_subs_details[sub_name])
+        return sub_file
 
+    def _download_subtitles(self):
+        '''
+        download all the subtitles concurrently and update the dictionary pointing to downloaded files
+        '''
+        with ThreadPoolExecutor(max_workers=min(8, len(self.subtitles)), thread_name_prefix=f'{self.thread_name_prefix}subs-') as executor:
+            futures = { sub_name: executor.submit(self._download_subtitle, sub_name, sub_link) for sub_name, sub_link in self.subtitles.items() }
+
+        for sub_name, future in futures.items():
+            try:
+                self.subtitles[sub_name] = future.result()
             except Exception as e:
                 self.logger.warning(f'Failed to download {sub_name} subtitle with error: {e}')
                 self.subtitles.pop(sub_name)
 
-    def _decrypt_subtitle_file(self, sub_file, **kwargs):
-        self.logger.debug(f'Decrypting subtitle file: {sub_file}')
-        decrypter = kwargs['decrypter']
+    def _decrypt_subtitle(self, sub_content, **kwargs):
+        '''
+        decrypt the text lines of the subtitle. Sequence numbers, timestamps and empty lines are kept as-is.
+        Uses batch_decrypter (all lines in one call) if available, else decrypter (line by line).
+        '''
         subs_key, subs_iv = kwargs['key'], kwargs['iv']
+        lines = sub_content.splitlines(keepends=True)
+        text_idxs = [ i for i, line in enumerate(lines) if line.strip() and not line.strip().isdigit() and "-->" not in line ]
 
-        with open(sub_file, 'r', encoding='utf-8') as file:
-            lines = file.readlines()
+        if kwargs.get('batch_decrypter'):
+            decrypted = kwargs['batch_decrypter']([ lines[i].strip() for i in text_idxs ], subs_key, subs_iv)
+        else:
+            decrypted = []
+            for i in text_idxs:
+                try:
+                    decrypted.append(kwargs['decrypter'](lines[i].strip(), subs_key, subs_iv))
+                except:
+                    decrypted.append(None)
 
         decryption_fail_count = 0
-        total_line_count = 0
-        with open(sub_file, 'w', encoding='utf-8') as file:
-            for line in lines:
-                if line.strip() and not line.strip().isdigit() and "-->" not in line:
-                    try:
-                        # decrypt and replace subtitle text lines
-                        file.write(decrypter(line.strip(), subs_key, subs_iv) + '\n')
-                        total_line_count += 1
-                    except:
-                        # write the line as-is if decryption fails
-                        file.write(line)
-                        decryption_fail_count += 1
-                else:
-                    # write sequence numbers, timestamps, and empty lines as-is
-                    file.write(line)
+        for i, text in zip(text_idxs, decrypted):
+            if text is None:
+                # keep the line as-is if decryption fails
+                decryption_fail_count += 1
+            else:
+                lines[i] = text + '\n'
+
         if decryption_fail_count > 0:
-            self.logger.warning(f'Failed to decrypt {decryption_fail_count}/{total_line_count} lines in the subtitle file')
+            self.logger.warning(f'Failed to decrypt {decryption_fail_count}/{len(text_idxs)} lines in the subtitle file')
+
+        return ''.join(lines)
+
+    def _get_mux_command(self, input_args, out_file):
+        '''
+        ffmpeg command to copy the video (input_args) into out_file, along with the subtitles (if any)
+        '''
+        command = ['ffmpeg', '-loglevel', 'warning'] + input_args
+        maps = ['-map', '0:v', '-map', '0:a'] if self.subtitles else []
+        metadata = []
+
+        # Prepare the command if subtitles are present
+        for i, (lang, url) in enumerate(self.subtitles.items(), start=1):
+            command.extend(['-i', url])
+            maps.extend(['-map', f'{i}'])
+            metadata.extend([f'-metadata:s:s:{i-1}', f'title={lang}'])
+
+        metadata.extend(['-c:v', 'copy', '-c:a', 'copy', '-c:s', 'mov_text', '-bsf:a', 'aac_adtstoasc', '-y', out_file])
+
+        return command + maps + metadata
 
     def _add_subtitles(self):
         # print(f'Converting {self.out_file} to mp4')
         out_file = os.path.join(f'{self.out_dir}', f'{self.out_file}')
         # ffmpeg can't do in-place conversion. So, create a temp file and replace the original file
         temp_out_file = os.path.join(f'{self.out_dir}', f'temp_{self.out_file}')
-        command = [f'ffmpeg -loglevel warning -i "{out_file}"']
-        maps = ['-map 0:v -map 0:a'] if self.subtitles else []
-        metadata = []
+        self._run_ffmpeg(self._get_mux_command(['-i', out_file], temp_out_file), desc='Adding subtitles to')
 
-        # Prepare the command if subtitles are present
-        for i, (lang, url) in enumerate(self.subtitles.items(), start=1):
-            command.append(f'-i "{url}"')
-            maps.append(f'-map {i}')
-            metadata.append(f'-metadata:s:s:{i-1} title="{lang}"')
+        # Replace original file with the new file
+        os.replace(temp_out_file, out_file)
 
-        metadata.append(f'-c:v copy -c:a copy -c:s mov_text -bsf:a aac_adtstoasc "{temp_out_file}"')
+    def _mux_chunks(self, chunk_ranges):
+        '''
+        Mux the chunks and subtitles into the final file in a single pass.
+        Chunks are fed to ffmpeg as one stream using the concat protocol, so the video is written only once.
+        Returns False if the chunks can't be passed to ffmpeg this way: a chunk path has '|' (the separator of the
+        concat protocol, which has no escaping) or the chunk list is over the command line limit of the OS.
+        Chunks are plain byte ranges, not valid files on their own, so the concat demuxer can't be used instead.
+        '''
+        out_file = os.path.join(f'{self.out_dir}', f'{self.out_file}')
+        temp_out_file = os.path.join(f'{self.out_dir}', f'temp_{self.out_file}')
+        chunk_ranges = sorted(chunk_ranges, key=lambda r: r.start)
+        chunk_files = [ os.path.join(f"{self.temp_dir}", f"{r.name}") for r in chunk_ranges ]
+        self._validate_chunks(chunk_ranges)
 
-        cmd = ' '.join(command + maps + metadata)
-        self._exec_cmd(cmd)
+        if any('|' in chunk_file for chunk_file in chunk_files):
+            self.logger.debug(f'Chunk paths have "|", which the concat protocol can\'t escape: {self.temp_dir}')
+            return False
+        concat_input = 'concat:' + '|'.join(chunk_files)
+        command = self._get_mux_command(['-i', concat_input], temp_out_file)
+        if sys.platform == 'win32':
+            too_long = len(subprocess.list2cmdline(command)) >= MAX_COMMAND_LINE
+        else:
+            too_long = len(os.fsencode(concat_input)) >= MAX_ARG_BYTES
+        if too_long:
+            self.logger.debug(f'Concat input of {len(chunk_files)} chunks is over the command line limit')
+            return False
 
-        # Replace original file with the new file
+        self._run_ffmpeg(command, desc='Muxing')
         os.replace(temp_out_file, out_file)
+        # remove the muxed chunks only after the mux is successful
+        self._remove_files(chunk_files)
 
-    def start_download(self, dl_link):
-        # set chunk size to 1MiB
+        return True
+
+    def _start_subtitles_download(self):
+        '''
+        Download subtitles in background, while the video is being downloaded
+        '''
+        if self.subtitles:
+            self.logger.debug('Downloading subtitles in background')
+            self.subtitles_thread = threading.Thread(target=self._download_subtitles, name=f'{self.thread_name_prefix}subs', daemon=True)
+            self.subtitles_thread.start()
+
+    def _wait_for_subtitles(self):
+        if self.subtitles_thread is not None:
+            self.subtitles_thread.join()
+            self.logger.debug(f'Subtitles downloaded: {list(self.subtitles)}')
+
+    def download(self, dl_link):
+        '''
+        Download stage: fetch all the chunks (and subtitles) of the file. Returns (status, message).
+        Merging & muxing is left to post_process, which can run outside the download slot.
+        '''
+        # set chunk size to 1MiB (ranges are split at chunk boundaries)
         self.chunk_size = 1024*1024
         # create output directory
         self._create_out_dirs()
 
         self.logger.debug('Fetching stream data')
-        dl_data = self._get_raw_stream_data(dl_link, True)
-        file_size = int(dl_data.headers.get('content-length', 0))
+        file_size, self.range_support = self._get_file_details(dl_link)
+        if file_size == 0:
+            raise Exception('Unable to fetch the file size')
+        self.dl_link, self.file_size = dl_link, file_size
+        self._reserve_disk_space(file_size)
+
+        # spread the ranges across the mirrors serving the same file
+        if self.mirror_links and self.range_support:
+            self._setup_mirrors(dl_link, file_size)
+
+        # start with one large range per connection. Ranges are split further as connections free up
+        chunk_ranges = self._plan_ranges(dl_link, file_size)
+        self.logger.debug(f'Planned {len(chunk_ranges)} ranges for {file_size} bytes (range requests supported: {self.range_support})')
 
-        chunks = range(0, file_size, self.chunk_size)
-        chunk_urls = [[dl_link, self._create_chunk_header(chunk), f'{self.out_file}.chunk{chunk_no}'] for chunk_no, chunk in enumerate(chunks)] 
+        self._start_subtitles_download()
 
         self.logger.debug('Downloading chunks')
         metadata = {
@@ -319,21 +1082,39 @@ class BaseDownloader():
             'total': file_size,
             'unit': 'iB',
             'unit_scale': True,
-            'unit_divisor': 1024
+            'unit_divisor': 1024,
+            'split': self._split_largest_range
         }
-        self._multi_threaded_download(self._download_chunk, chunk_urls, **metadata)
+        self._multi_threaded_download(self._download_chunk, chunk_ranges, **metadata)
+        self.chunk_ranges = chunk_ranges
+        self._wait_for_subtitles()
 
-        self.logger.debug('Merging chunks to single file')
-        self._merge_chunks(len(chunks))
+        return (0, None)
 
+    def post_process(self):
+        '''
+        Post-processing stage: merge the downloaded chunks and add subtitles. Returns (status, message).
+        '''
         if self.subtitles:
-            self.logger.debug('Downloading subtitles')
-            self._download_subtitles()
-            self.logger.debug('Adding subtitles to the video')
-            self._add_subtitles()
+            self.logger.debug('Muxing chunks & subtitles to single file')
+            muxed = self._mux_chunks(self.chunk_ranges)
+            if not muxed:
+                self.logger.debug('Chunks can\'t be muxed in single pass. Merging chunks and adding subtitles separately')
+                self._merge_chunks(self.chunk_ranges)
+                self._add_subtitles()
+        else:
+            self.logger.debug('Merging chunks to single file')
+            self._merge_chunks(self.chunk_ranges)
 
         # remove temp dir once completed and dir is empty
         self.logger.debug('Removing temporary directories')
         self._remove_out_dirs()
 
-        return (0, None)
\ No newline at end of file
+        return (0, None)
+
+    def start_download(self, dl_link):
+        '''
+        Download and post-process the file in the same thread
+        '''
+        self.download(dl_link)
+        return self.post_process()
\ No newline at end of file
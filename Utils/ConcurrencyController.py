@@ -0,0 +1,127 @@
+import logging
+import threading
+from time import monotonic
+from urllib.parse import urlparse
+
+
+class AIMDController():
+    '''
+    Adaptive concurrency controller for a host using AIMD (additive increase, multiplicative decrease).
+
+    The in-flight request limit is re-evaluated after every window of completed requests (window = current limit):
+    - decrease multiplicatively if the host throttled us (429), errored or time-to-first-byte inflated (host is queueing)
+    - increase additively otherwise
+    The limit is shared by all downloads using the host.
+    '''
+    def __init__(self, host, initial=8, min_limit=2, max_limit=32, increase_step=1, decrease_factor=0.5,
+                 latency_tolerance=2.0, error_tolerance=0.1):
+        self.logger = logging.getLogger()
+        self.host = host
+        self.limit = float(max(min_limit, min(initial, max_limit)))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.error_tolerance = error_tolerance
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        # latency (time-to-first-byte) stats
+        self.latency_ewma = None
+        self.base_latency = None
+        # stats of the current window
+        self._reset_window()
+
+    def _reset_window(self):
+        self.window_start = monotonic()
+        self.window_completed = 0
+        self.window_errors = 0
+        self.window_throttled = 0
+        self.window_units = 0
+
+    def get_limit(self):
+        return int(self.limit)
+
+    def try_acquire(self):
+        '''
+        Reserve a slot for a request, if the host limit allows it
+        '''
+        with self.lock:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.in_flight = max(0, self.in_flight - 1)
+
+    def on_response(self, latency):
+        '''
+        Record time-to-first-byte of a response
+        '''
+        with self.lock:
+            self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+            # baseline slowly forgets the best latency seen, as the host conditions change through the day
+            self.base_latency = self.latency_ewma if self.base_latency is None else min(self.base_latency * 1.01, self.latency_ewma)
+
+    def on_success(self, units=0):
+        with self.lock:
+            self.window_completed += 1
+            self.window_units += units
+            self._evaluate()
+
+    def on_failure(self, error_class):
+        with self.lock:
+            self.window_completed += 1
+            self.window_errors += 1
+            if error_class == 'throttled':
+                self.window_throttled += 1
+            self._evaluate()
+
+    def _evaluate(self):
+        '''
+        Adjust the limit at the end of the window (should be called with lock held)
+        '''
+        if self.window_completed < max(int(self.limit), self.min_limit):
+            return
+
+        elapsed = max(monotonic() - self.window_start, 1e-6)
+        error_rate = self.window_errors / self.window_completed
+        latency_inflated = self.latency_ewma is not None and self.base_latency and self.latency_ewma > self.latency_tolerance * self.base_latency
+        old_limit = self.limit
+
+        if self.window_throttled > 0 or error_rate > self.error_tolerance:
+            self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+            reason = f'throttled: {self.window_throttled}, errors: {self.window_errors}/{self.window_completed}'
+        elif latency_inflated:
+            self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+            reason = f'latency inflated: {self.latency_ewma:.2f}s vs base {self.base_latency:.2f}s'
+        else:
+            self.limit = min(self.max_limit, self.limit + self.increase_step)
+            reason = 'healthy'
+
+        if int(old_limit) != int(self.limit):
+            latency = f'{self.latency_ewma:.2f}s' if self.latency_ewma is not None else 'NA'
+            self.logger.info(f'[AIMD {self.host}] Limit {int(old_limit)} -> {int(self.limit)} ({reason}) | '
+                             f'Latency: {latency} | Throughput: {self.window_units / elapsed:.1f} units/s | In-flight: {self.in_flight}')
+
+        self._reset_window()
+
+
+# controllers are shared across all downloads in the process, so that the learned limit of a host is reused
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+def get_host(url):
+    return urlparse(url).netloc
+
+def get_controller(url, **settings):
+    '''
+    Get (or create) the concurrency controller for the host of the url
+    '''
+    host = get_host(url)
+    with _controllers_lock:
+        if host not in _controllers:
+            _controllers[host] = AIMDController(host, **settings)
+        return _controllers[host]
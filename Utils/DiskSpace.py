@@ -0,0 +1,155 @@
+import errno
+import logging
+import os
+import shutil
+import threading
+
+
+class DiskSpace():
+    '''
+    Disk space accounting for the downloads, per filesystem.
+
+    A download needs its size twice: once for the temp files (segments/chunks in the temp dir) and once for the
+    final output, as both exist while merging/muxing. When the dirs are on the same filesystem, both count there.
+    - plan: preflight of a batch, before any download starts (finals add up, temp files of only the parallel
+      downloads exist at once)
+    - reserve/release: space of a download is reserved when it starts and released when it ends, so that
+      parallel downloads don't count on the same free space. min_free_mb is always kept free.
+      Bytes a download has written (its temp files & output) already lowered the free space, so only the
+      outstanding part of its reservation (reserved less written) is held back.
+    '''
+    def __init__(self, min_free_mb=500):
+        self.logger = logging.getLogger()
+        self.min_free = int(min_free_mb * 1024**2)
+        self.lock = threading.Lock()
+        self.reservations = {}      # key -> {'needs': {device: bytes}, 'paths': files/dirs written by the download}
+
+    def _get_fs(self, path):
+        '''
+        Returns (device id, existing path) of the filesystem the path is on (dirs may not be created yet)
+        '''
+        path = os.path.abspath(path)
+        while not os.path.exists(path) and os.path.dirname(path) != path:
+            path = os.path.dirname(path)
+        return os.stat(path).st_dev, path
+
+    def _get_written(self, paths):
+        '''
+        Returns dict of device -> bytes on disk under the paths (files or dirs). Allocated blocks are counted, as
+        preallocated/sparse files take only the space written
+        '''
+        written = {}
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            files = [path] if os.path.isfile(path) else [ os.path.join(root, f) for root, _, names in os.walk(path) for f in names ]
+            size = 0
+            for file in files:
+                try:
+                    stat = os.stat(file)
+                except OSError:
+                    continue    # removed meanwhile
+                size += stat.st_blocks * 512 if hasattr(stat, 'st_blocks') else stat.st_size
+            device = self._get_fs(path)[0]
+            written[device] = written.get(device, 0) + size
+        return written
+
+    def _get_reserved(self, device, exclude=None):
+        '''
+        Space held back on the device for the running downloads: the part of their reservations not written yet
+        '''
+        reserved = 0
+        for key, reservation in self.reservations.items():
+            if key == exclude or device not in reservation['needs']:
+                continue
+            written = self._get_written(reservation['paths']).get(device, 0)
+            reserved += max(reservation['needs'][device] - written, 0)
+        return reserved
+
+    def get_needs(self, size, out_dir, temp_dir):
+        '''
+        Returns dict of device -> (path on the filesystem, bytes needed by a download of the size)
+        '''
+        needs = {}
+        for device, path in (self._get_fs(out_dir), self._get_fs(temp_dir)):
+            needs[device] = (path, needs.get(device, (path, 0))[1] + size)
+        return needs
+
+    def plan(self, downloads, max_parallel=1):
+        '''
+        Check if the downloads fit in the free space (less the space reserved by running downloads).
+        downloads: list of (key, size in bytes or None if unknown, out dir, temp dir), in download order.
+        Returns (keys that fit, keys that don't fit, dict of path -> {'free', 'needed'} per filesystem).
+        Downloads that don't fit are skipped, so the ones after them may still fit.
+        '''
+        fit, skipped = [], []
+        finals, temps, paths = {}, {}, {}
+        with self.lock:
+            free = {}
+            for key, size, out_dir, temp_dir in downloads:
+                if not size:
+                    fit.append(key)
+                    continue
+
+                (out_dev, out_path), (temp_dev, temp_path) = self._get_fs(out_dir), self._get_fs(temp_dir)
+                for device, path in ((out_dev, out_path), (temp_dev, temp_path)):
+                    if device not in free:
+                        free[device] = shutil.disk_usage(path).free - self._get_reserved(device) - self.min_free
+                        paths[device] = path
+
+                new_finals = dict(finals)
+                new_finals[out_dev] = new_finals.get(out_dev, 0) + size
+                new_temps = { device: list(sizes) for device, sizes in temps.items() }
+                new_temps.setdefault(temp_dev, []).append(size)
+                # final files add up, temp files of only the largest parallel downloads exist at once
+                needed = lambda device: new_finals.get(device, 0) + sum(sorted(new_temps.get(device, []), reverse=True)[:max_parallel])
+
+                if all(needed(device) <= free[device] for device in (out_dev, temp_dev)):
+                    finals, temps = new_finals, new_temps
+                    fit.append(key)
+                else:
+                    skipped.append(key)
+
+        report = {}
+        for device, path in paths.items():
+            needed = finals.get(device, 0) + sum(sorted(temps.get(device, []), reverse=True)[:max_parallel])
+            report[path] = {'free': free[device] + self.min_free, 'needed': needed}
+
+        return fit, skipped, report
+
+    def reserve(self, key, size, out_dir, temp_dir, paths=()):
+        '''
+        Reserve the space of a download. paths: files/dirs the download writes to (e.g., its temp dir), whose
+        existing bytes (of a resumed download) are not needed again.
+        Raises OSError (ENOSPC) if it doesn't fit in the free space
+        '''
+        needs = self.get_needs(size, out_dir, temp_dir)
+        with self.lock:
+            written = self._get_written(paths)
+            for device, (path, needed) in needs.items():
+                available = shutil.disk_usage(path).free - self._get_reserved(device, exclude=key) - self.min_free
+                needed = max(needed - written.get(device, 0), 0)
+                if needed > available:
+                    raise OSError(errno.ENOSPC, f'Not enough disk space on [{path}]: {needed / 1024**2:.0f} MB needed, '
+                                                f'{max(available, 0) / 1024**2:.0f} MB available')
+            self.reservations[key] = {'needs': { device: needed for device, (_, needed) in needs.items() }, 'paths': list(paths)}
+            self.logger.debug(f'Reserved disk space for [{key}]: {needs}')
+
+    def release(self, key):
+        with self.lock:
+            self.reservations.pop(key, None)
+
+
+# accounting is shared across the process, so that it covers all the parallel downloads
+_disk_space = None
+_disk_space_lock = threading.Lock()
+
+def get_disk_space(min_free_mb=500):
+    '''
+    Get the process-wide disk space accounting (created with the settings of the first caller)
+    '''
+    global _disk_space
+    with _disk_space_lock:
+        if _disk_space is None:
+            _disk_space = DiskSpace(min_free_mb)
+        return _disk_space
@@ -0,0 +1,92 @@
+import json
+import os
+import threading
+import zlib
+
+
+def crc32_file(file_path, length=None, block_size=1024*1024):
+    '''
+    Calculate crc32 of a file (or of its first `length` bytes)
+    '''
+    crc, remaining = 0, length
+    with open(file_path, 'rb') as f:
+        while remaining is None or remaining > 0:
+            data = f.read(block_size if remaining is None else min(block_size, remaining))
+            if not data:
+                break
+            crc = zlib.crc32(data, crc)
+            if remaining is not None: remaining -= len(data)
+
+    return crc
+
+
+def sync_file(f):
+    '''
+    Flush the file object (or file descriptor) to disk, before its data is journaled
+    '''
+    if isinstance(f, int):
+        os.fsync(f)
+    else:
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class DownloadJournal():
+    '''
+    Append-only journal of completed segments/chunks for an episode.
+
+    Every completed entry is written as a json line with its byte length and crc32 checksum, after its data is
+    synced to disk. A truncated last line (process killed mid-write) is cut off on reload, so the journal
+    only ever reports entries that were completely written to disk, and new entries start on a line of their own.
+    '''
+    def __init__(self, journal_file):
+        self.journal_file = journal_file
+        self.entries = {}
+        self.lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.isfile(self.journal_file):
+            return
+
+        with open(self.journal_file, 'rb') as f:
+            content = f.read()
+        if content and not content.endswith(b'\n'):
+            # cut off the partially written last entry, else the next entry is appended to it
+            content = content[:content.rfind(b'\n') + 1]
+            with open(self.journal_file, 'r+b') as f:
+                f.truncate(len(content))
+
+        for line in content.decode('utf-8', errors='replace').splitlines():
+            try:
+                entry = json.loads(line)
+                self.entries[entry['name']] = entry
+            except (ValueError, KeyError):
+                continue    # skip corrupt entries
+
+    def get(self, name):
+        return self.entries.get(name)
+
+    def is_complete(self, name, file_path, verify=True):
+        '''
+        Check if the entry is journaled and the file on disk still matches it
+        '''
+        entry = self.entries.get(name)
+        if entry is None or not os.path.isfile(file_path):
+            return False
+
+        if os.path.getsize(file_path) != entry['size']:
+            return False
+
+        return not verify or crc32_file(file_path) == entry['crc']
+
+    def record(self, name, size, crc, **extra):
+        '''
+        Append a completed entry to the journal. Its data must be synced to disk first (see sync_file)
+        '''
+        entry = {'name': name, 'size': size, 'crc': crc, **extra}
+        with self.lock:
+            with open(self.journal_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + '\n')
+                f.flush()
+            self.entries[name] = entry
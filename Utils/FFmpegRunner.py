@@ -0,0 +1,121 @@
+import logging
+import os
+import subprocess
+import threading
+from collections import deque
+from time import monotonic, sleep
+
+from Utils.commons import DownloadCancelled
+
+
+class FFmpegRunner():
+    '''
+    Runs ffmpeg/ffprobe jobs as argv lists (no shell).
+    - heavy jobs (muxing/conversion) are capped to max_heavy_jobs running at once
+    - live progress is parsed from `-progress pipe:1` output and passed to the on_progress callback
+    - jobs are killed on timeout or when their cancel event is set
+    - wall & cpu time of every job is logged and kept in `jobs`
+    '''
+    def __init__(self, max_heavy_jobs=None, poll_interval=0.1):
+        self.logger = logging.getLogger()
+        self.max_heavy_jobs = max_heavy_jobs or os.cpu_count() or 1
+        self.heavy_jobs = threading.BoundedSemaphore(self.max_heavy_jobs)
+        self.poll_interval = poll_interval
+        self.jobs = []
+
+    def _read_progress(self, stream, output, on_progress):
+        '''
+        Read stdout of the job. Progress is reported as blocks of key=value lines, ending with progress=continue|end
+        '''
+        progress = {}
+        for line in iter(stream.readline, b''):
+            line = line.decode('utf-8', errors='replace')
+            output.append(line)
+            if on_progress is None or '=' not in line:
+                continue
+            key, value = line.strip().split('=', 1)
+            progress[key] = value
+            if key == 'progress':
+                try:
+                    on_progress(progress)
+                except Exception as e:
+                    self.logger.debug(f'Progress callback failed with error: {e}')
+                progress = {}
+
+    def _wait(self, proc, timeout, cancel_event):
+        '''
+        Wait for the process to exit. Returns cpu time of the process (None if not available on the platform).
+        Kills the process on timeout or cancellation.
+        '''
+        deadline = monotonic() + timeout if timeout else None
+        while True:
+            if hasattr(os, 'wait4'):
+                # reap the process ourselves to get its resource usage
+                pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+                if pid:
+                    proc.returncode = os.waitstatus_to_exitcode(status)
+                    return rusage.ru_utime + rusage.ru_stime
+            elif proc.poll() is not None:
+                return None
+
+            if cancel_event is not None and cancel_event.is_set():
+                proc.kill(); proc.wait()
+                raise DownloadCancelled('ffmpeg job cancelled')
+            if deadline is not None and monotonic() > deadline:
+                proc.kill(); proc.wait()
+                raise TimeoutError(f'ffmpeg job timed out after {timeout}s')
+
+            sleep(self.poll_interval)
+
+    def run(self, args, timeout=None, heavy=True, on_progress=None, cancel_event=None):
+        '''
+        Run the command (list of args) and return its stdout. Raises exception on failure.
+        - heavy: wait for a free heavy job slot before starting
+        - on_progress: callback receiving the progress dict (requires `-progress pipe:1` in args)
+        '''
+        if heavy: self.heavy_jobs.acquire()
+        try:
+            self.logger.debug(f'Executing command: {subprocess.list2cmdline(args)}')
+            start = monotonic()
+            proc = subprocess.Popen(args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            # drain both pipes in background, so that the process never blocks on a full pipe
+            output, errors = [], deque(maxlen=50)
+            readers = [
+                threading.Thread(target=self._read_progress, args=(proc.stdout, output, on_progress), daemon=True),
+                threading.Thread(target=lambda: errors.extend(proc.stderr.read().decode('utf-8', errors='replace').splitlines()), daemon=True)
+            ]
+            for reader in readers: reader.start()
+            try:
+                cpu_time = self._wait(proc, timeout, cancel_event)
+            finally:
+                for reader in readers: reader.join()
+                proc.stdout.close(); proc.stderr.close()
+            wall_time = monotonic() - start
+        finally:
+            if heavy: self.heavy_jobs.release()
+
+        job = {'cmd': os.path.basename(args[0]), 'returncode': proc.returncode, 'wall_time': round(wall_time, 2),
+               'cpu_time': round(cpu_time, 2) if cpu_time is not None else None}
+        self.jobs.append(job)
+        (self.logger.info if heavy else self.logger.debug)(f"{job['cmd']} job completed with return code {job['returncode']} | "
+                                                          f"Wall time: {job['wall_time']}s | CPU time: {job['cpu_time']}s")
+
+        if proc.returncode != 0:
+            raise Exception(f'Error occured: {os.linesep.join(errors)}')
+
+        return ''.join(output)
+
+
+# runner is shared across the process, so that the limit applies to all the ffmpeg jobs
+_runner = None
+_runner_lock = threading.Lock()
+
+def get_runner(max_heavy_jobs=None):
+    '''
+    Get the process-wide ffmpeg job runner (created with the settings of the first caller)
+    '''
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = FFmpegRunner(max_heavy_jobs)
+        return _runner
@@ -0,0 +1,142 @@
+import errno
+import logging
+import os
+import struct
+import sys
+
+# ioctl to clone (reflink) a range of a file into another file on btrfs/XFS (Linux)
+FICLONERANGE = 0x4020940d
+# errors meaning that the copy method is not supported for these files, so the next method should be tried
+UNSUPPORTED_ERRORS = (errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTTY, errno.EBADF, errno.ETXTBSY)
+
+
+class FileMerger():
+    '''
+    Append files to an output file using the cheapest copy the platform & filesystem supports:
+    reflink (FICLONERANGE) -> os.copy_file_range -> os.sendfile -> buffered copy.
+    Kernel side copies avoid pulling the data through python memory. An unsupported method is
+    not tried again for the rest of the files.
+    If the size of the output is known, it is preallocated (posix_fallocate) to keep it contiguous on disk
+    and to fail early if the disk is full. Unused preallocated space is truncated at the end.
+    '''
+    def __init__(self, out_file, block_size=1024*1024, preallocate_size=None):
+        self.logger = logging.getLogger()
+        self.out_file = out_file
+        self.block_size = block_size
+        self.methods = [ m for m, supported in [
+            ('reflink', sys.platform.startswith('linux')),
+            ('copy_file_range', hasattr(os, 'copy_file_range')),
+            ('sendfile', sys.platform.startswith('linux') and hasattr(os, 'sendfile')),
+            ('buffered', True)
+        ] if supported ]
+        self.used_methods = {}
+        self.offset = 0
+        self.out_fd = None
+        self.preallocate_size = preallocate_size
+        self.preallocated = False
+
+    def __enter__(self):
+        self.out_fd = os.open(self.out_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+        if self.preallocate_size:
+            self._preallocate(self.preallocate_size)
+        return self
+
+    def __exit__(self, *args):
+        if self.preallocated:
+            os.ftruncate(self.out_fd, self.offset)
+        os.close(self.out_fd)
+        self.logger.debug(f'Merged {self.offset} bytes into [{self.out_file}] using {self.used_methods}')
+
+    def _preallocate(self, size):
+        if not hasattr(os, 'posix_fallocate'):
+            return
+        try:
+            os.posix_fallocate(self.out_fd, 0, size)
+            self.preallocated = True
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                # a failed preallocation may keep the blocks allocated till then
+                os.ftruncate(self.out_fd, 0)
+                os.close(self.out_fd)
+                os.remove(self.out_file)
+                raise
+            self.logger.debug(f'Preallocation is not supported for [{self.out_file}] ({e})')
+
+    def _reflink(self, src_fd, src_offset, length):
+        import fcntl
+        # reflink needs block aligned offsets, so files can be cloned only till the first unaligned one
+        if self.offset % 4096 != 0 or src_offset % 4096 != 0:
+            raise OSError(errno.EINVAL, 'Unaligned offset for reflink')
+        fcntl.ioctl(self.out_fd, FICLONERANGE, struct.pack('qQQQ', src_fd, src_offset, length, self.offset))
+        return length
+
+    def _copy_file_range(self, src_fd, src_offset, length):
+        copied = 0
+        while copied < length:
+            n = os.copy_file_range(src_fd, self.out_fd, length - copied, src_offset + copied, self.offset + copied)
+            if n == 0:
+                break
+            copied += n
+        return copied
+
+    def _sendfile(self, src_fd, src_offset, length):
+        copied = 0
+        os.lseek(self.out_fd, self.offset, os.SEEK_SET)
+        while copied < length:
+            n = os.sendfile(self.out_fd, src_fd, src_offset + copied, length - copied)
+            if n == 0:
+                break
+            copied += n
+        return copied
+
+    def _buffered(self, src_fd, src_offset, length):
+        copied = 0
+        os.lseek(self.out_fd, self.offset, os.SEEK_SET)
+        os.lseek(src_fd, src_offset, os.SEEK_SET)
+        with open(src_fd, 'rb', buffering=0, closefd=False) as src:
+            buffer = bytearray(self.block_size)
+            view = memoryview(buffer)
+            while copied < length:
+                n = src.readinto(view[:min(self.block_size, length - copied)])
+                if not n:
+                    break
+                os.write(self.out_fd, view[:n])
+                copied += n
+        return copied
+
+    def append(self, src_file, src_offset=0, length=None):
+        '''
+        Append the file (or length bytes of it from src_offset) at the end of the output file
+        '''
+        length = os.path.getsize(src_file) - src_offset if length is None else length
+        src_fd = os.open(src_file, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        try:
+            for method in list(self.methods):
+                try:
+                    copied = getattr(self, f'_{method}')(src_fd, src_offset, length)
+                except OSError as e:
+                    if e.errno not in UNSUPPORTED_ERRORS or method == 'buffered':
+                        raise
+                    self.logger.debug(f'{method} is not supported for [{self.out_file}] ({e}). Falling back to next method')
+                    self.methods.remove(method)
+                    continue
+
+                if copied != length:
+                    raise OSError(errno.EIO, f'Copied {copied}/{length} bytes of [{src_file}]')
+                self.used_methods[method] = self.used_methods.get(method, 0) + 1
+                break
+        finally:
+            os.close(src_fd)
+
+        self.offset += length
+
+    def write(self, data):
+        '''
+        Append data at the end of the output file (for data that is transformed in memory, e.g. decrypted)
+        '''
+        os.lseek(self.out_fd, self.offset, os.SEEK_SET)
+        view = memoryview(data)
+        while view:
+            n = os.write(self.out_fd, view)
+            view = view[n:]
+        self.offset += len(data)
@@ -1,8 +1,15 @@
 import os
 import re
+from shutil import copyfile
+import threading
+import zlib
+from time import monotonic
 
-from Utils.commons import retry
+from Utils.commons import retry, DownloadCancelled
 from Utils.BaseDownloader import BaseDownloader
+from Utils.DownloadJournal import sync_file
+from Utils.FileMerger import FileMerger
+from Utils.SegmentStore import SegmentStore
 
 
 class HLSDownloader(BaseDownloader):
@@ -15,7 +22,18 @@ class HLSDownloader(BaseDownloader):
         super().__init__(dl_config, ep_details, session)
         # initialize HLS specific configuration
         self.m3u8_file = os.path.join(f'{self.temp_dir}', 'uwu.m3u8')
+        # ts: concatenate the segments into a .ts file without ffmpeg, mp4: convert with ffmpeg, auto: ts if there are no subtitles to mux
+        self.output_container = dl_config.get('output_container', 'mp4')
+        self.ts_out_file = os.path.splitext(self.out_file)[0] + '.ts'
+        # files: a file per segment, container: all segments in a single data file (indexed by the journal)
+        self.segment_store_type = dl_config.get('segment_store', 'files')
+        self.segment_store = None
+        self.key_uri = None
+        self.ts_urls = []
         self.thread_name_prefix = 'scraper-hls-'
+        # segments claimed by a completed request (a hedged duplicate may complete later)
+        self.claimed_segments = set()
+        self.claim_lock = threading.Lock()
 
     def _has_uri(self, m3u8_data):
         method = re.search('URI=(.*)', m3u8_data)
@@ -42,33 +60,138 @@ class HLSDownloader(BaseDownloader):
         # Improved regex to handle all cases. (get all lines except those starting with #)
         base_url = '/'.join(m3u8_link.split('/')[:-1])
         normalize_url = lambda url, base_url: (url if url.startswith('http') else 'https:' + url if url.startswith('//') else base_url + '/' + url)
-        # Some m3u8 files have duplicate urls, so using set to remove duplicates
-        urls = list(set( normalize_url(url.group(0), base_url) for url in re.finditer("^(?!#).+$", m3u8_data, re.MULTILINE) ))
+        # Some m3u8 files have duplicate urls, so remove duplicates (preserving the playlist order)
+        urls = list(dict.fromkeys( normalize_url(url.group(0), base_url) for url in re.finditer("^(?!#).+$", m3u8_data, re.MULTILINE) ))
 
         return urls
 
-    @retry()
-    def _download_segment(self, ts_url):
+    def _download_segment(self, ts_url, source_url=None, cancel_event=None, to_store=True, report_latency=True):
         '''
         download segment file from url. Reuse if already downloaded.
+        - source_url: fetch the segment from an alternative url (e.g., mirror for hedged request)
+        - cancel_event: abort the download once set (e.g., duplicate request completed first)
+        - to_store: write the segment to the segment store (if enabled), instead of its own file
+        - report_latency: report time-to-first-byte to the concurrency controller of the host (not for key/map files)
 
-        Returns: (download_status, progress_bar_increment)
+        Returns: (download_status, progress_bar_increment). Raises exception on failure.
         '''
+        segment_file_nm = ts_url.split('/')[-1]
+        segment_file = os.path.join(f"{self.temp_dir}", f"{segment_file_nm}")
+        segment_store = self.segment_store if to_store else None
+
+        # check if the segment is already downloaded
+        if segment_store.is_complete(segment_file_nm) if segment_store else self.journal.is_complete(segment_file_nm, segment_file):
+            return (f'Segment file [{segment_file_nm}] already exists. Reusing.', 1)
+
+        request_start = monotonic()
+        response, request_url = self._open_stream(source_url or ts_url, report_latency=report_latency)
+        segment_data = bytearray()
+        for chunk in self._iter_response(response, 64*1024, request_url):
+            if cancel_event and cancel_event.is_set():
+                response.close()
+                raise DownloadCancelled(f'Segment [{segment_file_nm}] download cancelled')
+            segment_data += chunk
+        self._report_source_success(source_url or ts_url, len(segment_data), monotonic() - request_start)
+
+        # only the first completed request writes the segment
+        with self.claim_lock:
+            if segment_file_nm in self.claimed_segments:
+                raise DownloadCancelled(f'Segment [{segment_file_nm}] already downloaded by another request')
+            self.claimed_segments.add(segment_file_nm)
+
         try:
-            segment_file_nm = ts_url.split('/')[-1]
-            segment_file = os.path.join(f"{self.temp_dir}", f"{segment_file_nm}")
+            if segment_store:
+                segment_store.add(segment_file_nm, segment_data)
+            else:
+                with open(segment_file, "wb") as ts_file:
+                    ts_file.write(segment_data)
+                    sync_file(ts_file)
+                # journal the segment only after it is completely written
+                self.journal.record(segment_file_nm, len(segment_data), zlib.crc32(segment_data))
+        except Exception:
+            with self.claim_lock:
+                self.claimed_segments.discard(segment_file_nm)
+            raise
+
+        return (f'Segment file [{segment_file_nm}] downloaded', 1)
 
-            # check if the segment is already downloaded
-            if os.path.isfile(segment_file) and os.path.getsize(segment_file) > 0:
-                return (f'Segment file [{segment_file_nm}] already exists. Reusing.', 1)
+    @retry()
+    def _download_key(self, key_uri):
+        '''
+        download key/map file of the stream (retried in place, as nothing else can progress without it)
+        '''
+        return self._download_segment(key_uri, to_store=False, report_latency=False)
 
-            with open(segment_file, "wb") as ts_file:
-                ts_file.write(self._get_stream_data(ts_url))
+    def _get_segment_durations(self, m3u8_data):
+        return re.findall('#EXTINF:([0-9.]+)', m3u8_data)
 
-            return (f'Segment file [{segment_file_nm}] downloaded', 1)
+    def _setup_mirrors(self, m3u8_link, m3u8_data, ts_urls):
+        '''
+        Validate mirror playlists against the primary one and enable multi-mirror download.
+        A mirror is used only if it has the same segments (count & durations) and the same key.
+        '''
+        durations = self._get_segment_durations(m3u8_data)
+        key_data = None
+        if self._has_uri(m3u8_data):
+            key_data = self._get_stream_data(self._collect_uri_iv(m3u8_data)[0])
+
+        sources = { ts_url: {m3u8_link: ts_url} for ts_url in ts_urls }
+        for mirror_link in self.mirror_links:
+            try:
+                mirror_data = self._get_stream_data(mirror_link, True)
+                mirror_urls = self._collect_ts_urls(mirror_link, mirror_data)
+                if len(mirror_urls) != len(ts_urls) or self._get_segment_durations(mirror_data) != durations:
+                    self.logger.debug(f'Skipping mirror [{mirror_link}]: segments do not match the primary stream')
+                    continue
+                if key_data is not None and (not self._has_uri(mirror_data) or self._get_stream_data(self._collect_uri_iv(mirror_data)[0]) != key_data):
+                    self.logger.debug(f'Skipping mirror [{mirror_link}]: encryption key does not match the primary stream')
+                    continue
+            except Exception as e:
+                self.logger.warning(f'Skipping mirror [{mirror_link}] due to error: {e}')
+                continue
+
+            # segments are mapped by their index in the playlist
+            for ts_url, mirror_url in zip(ts_urls, mirror_urls):
+                sources[ts_url][mirror_link] = mirror_url
+
+        if self.mirror_links and len(sources[ts_urls[0]]) > 1:
+            self._set_mirror_sources(sources)
+
+    def _is_link_url(self, url):
+        return url == self.key_uri or url in self.ts_urls
+
+    def _refresh_sources(self, m3u8_link):
+        '''
+        Map the segment (and key) urls being downloaded to the ones of the newly resolved playlist.
+        Segments are mapped by their index in the playlist, so the segments already downloaded are kept as is.
+        '''
+        m3u8_data = self._get_stream_data(m3u8_link, True)
+        ts_urls = self._collect_ts_urls(m3u8_link, m3u8_data)
+        if len(ts_urls) != len(self.ts_urls) or self._get_segment_durations(m3u8_data) != self._get_segment_durations(self.m3u8_data):
+            raise Exception('Segments of the resolved playlist do not match the ones being downloaded')
 
-        except Exception as e:
-            return (f'\nERROR: Segment download failed [{segment_file_nm}] due to: {e}', 0)
+        self.refreshed_urls.update(zip(self.ts_urls, ts_urls))
+        if self.key_uri and self._has_uri(m3u8_data):
+            self.refreshed_urls[self.key_uri] = self._collect_uri_iv(m3u8_data)[0]
+
+    def _rewrite_m3u8_file_for_store(self, m3u8_data):
+        '''
+        Rewrite m3u8 file to read the segments from the segment store by their byte ranges
+        '''
+        # ffmpeg doesn't accept backward slash in key file irrespective of platform
+        key_temp_dir = self.temp_dir.replace('\\', '/')
+        m3u8_content = re.sub('URI=(.*)/', f'URI="{key_temp_dir}/', m3u8_data, count=1)
+
+        lines = []
+        for line in m3u8_content.splitlines():
+            if line.strip() and not line.startswith('#'):
+                offset, size = self.segment_store.get_range(line.strip().split('/')[-1])
+                lines.extend([f'#EXT-X-BYTERANGE:{size}@{offset}', self.segment_store.data_file])
+            elif not line.startswith('#EXT-X-BYTERANGE'):
+                lines.append(line)
+
+        with open(self.m3u8_file, 'w', encoding='utf-8') as m3u8_f:
+            m3u8_f.write('\n'.join(lines) + '\n')
 
     def _rewrite_m3u8_file(self, m3u8_data):
         # regex safe temp dir path
@@ -84,63 +207,185 @@ class HLSDownloader(BaseDownloader):
             m3u8_content = re.sub(r'^(?!#).+$', rf'{seg_temp_dir}{regex_safe}\g<0>', m3u8_content, flags=re.MULTILINE)
             m3u8_f.write(m3u8_content)
 
-    def _convert_to_mp4(self):
-        # print(f'Converting {self.out_file} to mp4')
-        out_file = os.path.join(f'{self.out_dir}', f'{self.out_file}')
-        command = [f'ffmpeg -loglevel warning -allowed_extensions ALL -i "{self.m3u8_file}"']
-        maps = ['-map 0:v -map 0:a'] if self.subtitles else []
-        metadata = []
+    def get_out_files(self):
+        '''
+        Possible output files of the download. The container is decided only after fetching the stream (auto depends
+        on the subtitles, ts on the playlist), so both .ts & .mp4 are candidates unless the output is always mp4
+        '''
+        out_files = super().get_out_files()
+        if self.output_container != 'mp4':
+            out_files.insert(0, os.path.join(f'{self.out_dir}', f'{self.ts_out_file}'))
 
-        # Prepare the command if subtitles are present
-        for i, (lang, url) in enumerate(self.subtitles.items(), start=1):
-            command.append(f'-i "{url}"')
-            maps.append(f'-map {i}')
-            metadata.append(f'-metadata:s:s:{i-1} title="{lang}"')
+        return out_files
 
-        metadata.append(f'-c:v copy -c:a copy -c:s mov_text -bsf:a aac_adtstoasc "{out_file}"')
+    def _can_concat_segments(self, m3u8_data):
+        '''
+        Check if the segments can be concatenated into a .ts file directly (MPEG-TS segments, no or AES-128 encryption)
+        '''
+        if self.output_container == 'mp4' or (self.output_container == 'auto' and self.subtitles):
+            return False
+
+        reason = None
+        key_methods = re.findall('#EXT-X-KEY:METHOD=([A-Z0-9-]+)', m3u8_data)
+        if '#EXT-X-MAP' in m3u8_data:
+            reason = 'stream has fragmented mp4 segments'
+        elif any(method not in ('NONE', 'AES-128') for method in key_methods):
+            reason = f'unsupported encryption method {key_methods}'
+        elif len(set(re.findall('#EXT-X-KEY:.*', m3u8_data))) > 1:
+            reason = 'stream uses multiple keys'
+
+        if reason:
+            self.logger.warning(f'Cannot concatenate segments to .ts ({reason}). Converting to mp4 using ffmpeg')
+            return False
+
+        return True
+
+    def _get_segment_ivs(self, m3u8_data):
+        '''
+        IV of every segment (by segment file name) for AES-128 decryption: the explicit IV of the key if there is one,
+        else the media sequence number of the segment (from its position in the playlist, duplicates included)
+        '''
+        sequence = re.search(r'#EXT-X-MEDIA-SEQUENCE:(\d+)', m3u8_data)
+        media_sequence = int(sequence.group(1)) if sequence else 0
+        ivs, explicit_iv, position = {}, None, 0
+        for line in m3u8_data.splitlines():
+            line = line.strip()
+            if line.startswith('#EXT-X-KEY'):
+                iv = re.search(r'IV=0[xX]([0-9a-fA-F]{1,32})', line)
+                explicit_iv = bytes.fromhex(iv.group(1).zfill(32)) if iv else None
+            elif line and not line.startswith('#'):
+                # duplicate urls are downloaded once, as their first occurrence
+                ivs.setdefault(line.split('/')[-1], explicit_iv or (media_sequence + position).to_bytes(16, 'big'))
+                position += 1
+
+        return ivs
+
+    def _concat_segments(self, m3u8_data, ts_urls):
+        '''
+        Concatenate the (decrypted) segments in playlist order into a single .ts file
+        '''
+        out_file = os.path.join(f'{self.out_dir}', f'{self.ts_out_file}')
+        # write to a temp file first, so that an interrupted concatenation is never treated as a completed download
+        temp_out_file = os.path.join(f'{self.out_dir}', f'temp_{self.ts_out_file}')
+
+        cipher_key, segment_ivs = None, {}
+        if 'METHOD=AES-128' in m3u8_data:
+            from Cryptodome.Cipher import AES
+            key_uri, _ = self._collect_uri_iv(m3u8_data)
+            with open(os.path.join(f'{self.temp_dir}', key_uri.split('/')[-1]), 'rb') as key_file:
+                cipher_key = key_file.read()
+            segment_ivs = self._get_segment_ivs(m3u8_data)
+
+        # output is at most the size of the segments (decryption only removes the padding)
+        segment_names = [ ts_url.split('/')[-1] for ts_url in ts_urls ]
+        total_size = sum(self.segment_store.get_range(name)[1] if self.segment_store else os.path.getsize(os.path.join(f'{self.temp_dir}', name))
+                         for name in segment_names)
+
+        with FileMerger(temp_out_file, preallocate_size=total_size) as merger:
+            for ts_url in ts_urls:
+                segment_file_nm = ts_url.split('/')[-1]
+                segment_file = os.path.join(f'{self.temp_dir}', segment_file_nm)
+                if not cipher_key:
+                    # plain segments are copied kernel side (reflink/copy_file_range/sendfile) where possible
+                    if self.segment_store:
+                        merger.append(self.segment_store.data_file, *self.segment_store.get_range(segment_file_nm))
+                    else:
+                        merger.append(segment_file)
+                    continue
+
+                if self.segment_store:
+                    segment_data = self.segment_store.read(segment_file_nm)
+                else:
+                    with open(segment_file, 'rb') as ts_file:
+                        segment_data = ts_file.read()
+                segment_data = AES.new(cipher_key, AES.MODE_CBC, segment_ivs[segment_file_nm]).decrypt(segment_data)
+                merger.write(segment_data[:-segment_data[-1]])     # remove PKCS#7 padding
+
+        os.replace(temp_out_file, out_file)
+
+        # subtitles can't be muxed without ffmpeg, so keep them next to the video
+        for lang, sub_file in self.subtitles.items():
+            sidecar_file = os.path.join(f'{self.out_dir}', f"{os.path.splitext(self.ts_out_file)[0]}.{lang.replace(' ', '_')}{os.path.splitext(sub_file)[1]}")
+            copyfile(sub_file, sidecar_file)
 
-        cmd = ' '.join(command + maps + metadata)
-        self._exec_cmd(cmd)
+    def _convert_to_mp4(self):
+        # print(f'Converting {self.out_file} to mp4')
+        out_file = os.path.join(f'{self.out_dir}', f'{self.out_file}')
+        # convert to a temp file first, so that an interrupted conversion is never treated as a completed download
+        temp_out_file = os.path.join(f'{self.out_dir}', f'temp_{self.out_file}')
+        command = self._get_mux_command(['-allowed_extensions', 'ALL', '-i', self.m3u8_file], temp_out_file)
+        self._run_ffmpeg(command, desc='Converting')
+        os.replace(temp_out_file, out_file)
 
-    def start_download(self, m3u8_link):
+    def download(self, m3u8_link):
+        '''
+        Download stage: fetch key, segments (and subtitles) of the stream. Returns (status, message).
+        Conversion to mp4 is left to post_process, which can run outside the download slot.
+        '''
         # create output directory
         self._create_out_dirs()
+        # exact size is not known before downloading the segments, so the estimate of the client is used (if any)
+        self._reserve_disk_space(self.size_estimate)
+        if self.segment_store_type == 'container':
+            self.segment_store = SegmentStore(os.path.join(f'{self.temp_dir}', 'segments.dat'), self.journal)
 
-        iv = None
         self.logger.debug('Fetching stream data')
         m3u8_data = self._get_stream_data(m3u8_link, True)
 
+        self.logger.debug('Collect m3u8 segment urls')
+        ts_urls = self._collect_ts_urls(m3u8_link, m3u8_data)
+        # kept to map the urls to a newly resolved playlist, if the link expires while downloading
+        self.m3u8_data, self.ts_urls = m3u8_data, ts_urls
+
         self.logger.debug('Check if stream is encrypted/mapped')
         if self._has_uri(m3u8_data):
             self.logger.debug('Stream is encrypted/mapped. Collect iv data and download key')
-            key_uri, iv = self._collect_uri_iv(m3u8_data)
-            status = self._download_segment(key_uri)
-            if status[1] == 0: self.logger.error(f'Failed to download key/map file with error: {status[0]}')
+            self.key_uri, _ = self._collect_uri_iv(m3u8_data)
+            try:
+                self._download_key(self.key_uri)
+            except Exception as e:
+                self.logger.error(f'Failed to download key/map file with error: {e}')
 
-        # did not run into HLS with IV during development, so skipping it
-        if iv:
-            raise Exception("Current code cannot decode IV links")
+        self.duration = sum(float(d) for d in self._get_segment_durations(m3u8_data))
 
-        self.logger.debug('Collect m3u8 segment urls')
-        ts_urls = self._collect_ts_urls(m3u8_link, m3u8_data)
+        if self.mirror_links and ts_urls:
+            self.logger.debug('Validating mirror links')
+            self._setup_mirrors(m3u8_link, m3u8_data, ts_urls)
+
+        self._start_subtitles_download()
 
         self.logger.debug('Downloading collected segments')
         metadata = {
             'type': 'segments',
             'total': len(ts_urls),
-            'unit': 'seg'
+            'unit': 'seg',
+            'hedge': True
         }
         self._multi_threaded_download(self._download_segment, ts_urls, **metadata)
 
         self.logger.debug('Rewrite m3u8 file with downloaded segments paths')
-        self._rewrite_m3u8_file(m3u8_data)
+        if self.segment_store:
+            self._rewrite_m3u8_file_for_store(m3u8_data)
+        else:
+            self._rewrite_m3u8_file(m3u8_data)
+
+        self._wait_for_subtitles()
 
-        if self.subtitles:
-            self.logger.debug('Downloading subtitles')
-            self._download_subtitles()
+        return (0, None)
 
-        self.logger.debug('Converting m3u8 segments to .mp4')
-        self._convert_to_mp4()
+    def post_process(self):
+        '''
+        Post-processing stage: concatenate the downloaded segments to .ts, or convert them to mp4 (with subtitles).
+        Returns (status, message).
+        '''
+        if self._can_concat_segments(self.m3u8_data):
+            self.logger.debug('Concatenating m3u8 segments to .ts')
+            self._concat_segments(self.m3u8_data, self.ts_urls)
+        else:
+            self.logger.debug('Converting m3u8 segments to .mp4')
+            self._convert_to_mp4()
+
+        if self.segment_store: self.segment_store.close()
 
         # remove temp dir once completed and dir is empty
         self.logger.debug('Removing temporary directories')
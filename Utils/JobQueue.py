@@ -0,0 +1,121 @@
+import json
+import logging
+import sqlite3
+import threading
+from time import time
+
+
+class JobQueue():
+    '''
+    Persistent queue of download jobs (series specs) and the state of their episodes, in a local SQLite database.
+
+    Job states: pending -> running -> completed | failed
+    Episode states: pending -> downloading -> completed | failed
+
+    State is committed on every change, so a crashed run resumes where it stopped: completed episodes are skipped
+    and episodes left in downloading state are downloaded again (reusing the segments/chunks in their temp dir).
+    '''
+    def __init__(self, db_file):
+        self.logger = logging.getLogger()
+        self.db_file = db_file
+        # episodes are updated from the download threads
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                spec TEXT NOT NULL UNIQUE,
+                state TEXT NOT NULL DEFAULT 'pending',
+                error TEXT,
+                created_at REAL,
+                updated_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS episodes (
+                job_id INTEGER NOT NULL REFERENCES jobs(id),
+                episode TEXT NOT NULL,
+                name TEXT,
+                state TEXT NOT NULL DEFAULT 'pending',
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL,
+                PRIMARY KEY (job_id, episode)
+            );
+        ''')
+
+    def _execute(self, query, params=()):
+        with self.lock:
+            return self.conn.execute(query, params).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+    def add_job(self, spec):
+        '''
+        Add the job, if the same spec is not queued already. Returns id of the job
+        '''
+        spec = json.dumps(spec, sort_keys=True)
+        now = time()
+        self._execute('INSERT OR IGNORE INTO jobs (spec, created_at, updated_at) VALUES (?, ?, ?)', (spec, now, now))
+        return self._execute('SELECT id FROM jobs WHERE spec = ?', (spec,))[0]['id']
+
+    def get_jobs(self, states=('pending', 'running', 'failed')):
+        '''
+        Jobs in the given states, in the order they were added. Returns list of (job id, spec)
+        '''
+        rows = self._execute(f'SELECT id, spec FROM jobs WHERE state IN ({",".join("?" * len(states))}) ORDER BY id', states)
+        return [ (row['id'], json.loads(row['spec'])) for row in rows ]
+
+    def set_job_state(self, job_id, state, error=None):
+        self._execute('UPDATE jobs SET state = ?, error = ?, updated_at = ? WHERE id = ?', (state, error, time(), job_id))
+
+    def get_episode_states(self, job_id):
+        '''
+        Returns dict of episode -> state
+        '''
+        return { row['episode']: row['state'] for row in self._execute('SELECT episode, state FROM episodes WHERE job_id = ?', (job_id,)) }
+
+    def set_episode_state(self, job_id, episode, state, name=None, error=None):
+        attempt = 1 if state == 'downloading' else 0
+        self._execute('''
+            INSERT INTO episodes (job_id, episode, name, state, error, attempts, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (job_id, episode) DO UPDATE SET
+                name = COALESCE(excluded.name, name), state = excluded.state, error = excluded.error,
+                attempts = attempts + excluded.attempts, updated_at = excluded.updated_at
+        ''', (job_id, str(episode), name, state, error, attempt, time()))
+
+    def finish_job(self, job_id):
+        '''
+        Set final state of the job from the state of its episodes
+        '''
+        states = self.get_episode_states(job_id)
+        failed = [ ep for ep, state in states.items() if state != 'completed' ]
+        if failed:
+            self.set_job_state(job_id, 'failed', f'{len(failed)} episode(s) not completed: {", ".join(failed)}')
+        else:
+            self.set_job_state(job_id, 'completed')
+
+    def recover(self):
+        '''
+        Reset jobs & episodes left in progress by an interrupted run. Returns number of episodes reset
+        '''
+        episodes = self._execute("SELECT COUNT(*) AS count FROM episodes WHERE state = 'downloading'")[0]['count']
+        self._execute("UPDATE episodes SET state = 'pending' WHERE state = 'downloading'")
+        self._execute("UPDATE jobs SET state = 'pending' WHERE state = 'running'")
+        if episodes > 0:
+            self.logger.info(f'Resuming {episodes} episode(s) interrupted in the previous run')
+
+        return episodes
+
+    def summary(self):
+        '''
+        Returns dict of job id -> {series name, job state, episode counts per state}
+        '''
+        summary = {}
+        for row in self._execute('SELECT id, spec, state FROM jobs ORDER BY id'):
+            summary[row['id']] = {'series': json.loads(row['spec']).get('series_name'), 'state': row['state']}
+        for row in self._execute('SELECT job_id, state, COUNT(*) AS count FROM episodes GROUP BY job_id, state'):
+            summary[row['job_id']][row['state']] = row['count']
+
+        return summary
@@ -0,0 +1,147 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+from time import time
+
+# output file name: "<series> [Episode|Movie] [<episode no>] - <resolution>P.<ext>"
+FILE_NAME_RE = re.compile(r'^(?P<name>.*?)(?: (?P<episode>\d+(?:\.\d+)?))? - (?P<resolution>\d+)P\.(?:mp4|ts|mkv)$')
+
+
+def get_episode_key(episode):
+    '''
+    Episode number as stored in the index (5, 5.0 & '5' are the same episode)
+    '''
+    try:
+        return f'{float(episode):g}'
+    except (TypeError, ValueError):
+        return str(episode)
+
+
+def parse_file_name(file_name):
+    '''
+    Returns (episode key, resolution) of the downloaded file ('' as episode for movies), None if not a downloaded video
+    '''
+    file_name = os.path.basename(file_name)
+    # temp_ files are left by an interrupted merge/conversion, not completed downloads
+    match = None if file_name.startswith('temp_') else FILE_NAME_RE.match(file_name)
+    if match is None:
+        return None
+
+    episode = match.group('episode')
+    return (get_episode_key(episode) if episode else '', match.group('resolution'))
+
+
+class LibraryIndex():
+    '''
+    Index of the completed downloads of a download dir, in a local SQLite database.
+
+    Downloads are keyed by client, series id (on the site), episode & resolution, so that the episodes already
+    downloaded are dropped before their links are resolved. Episode & resolution are parsed from the output file name,
+    so the index is rebuilt any time by scanning the series dirs (downloads whose files are gone are removed).
+    '''
+    def __init__(self, db_file):
+        self.logger = logging.getLogger()
+        self.db_file = db_file
+        # downloads are recorded from the download threads
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS series (
+                client TEXT NOT NULL,
+                series_id TEXT NOT NULL,
+                series_dir TEXT NOT NULL,
+                PRIMARY KEY (client, series_id)
+            );
+            CREATE TABLE IF NOT EXISTS downloads (
+                client TEXT NOT NULL,
+                series_id TEXT NOT NULL,
+                episode TEXT NOT NULL,
+                resolution TEXT NOT NULL,
+                file TEXT NOT NULL,
+                size INTEGER,
+                completed_at REAL,
+                PRIMARY KEY (client, series_id, episode, resolution)
+            );
+        ''')
+
+    def _execute(self, query, params=()):
+        with self.lock:
+            return self.conn.execute(query, params).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+    def add_file(self, client, series_id, file):
+        '''
+        Record the downloaded file of the series. Returns False if the file name is not of a downloaded episode
+        '''
+        parsed = parse_file_name(file)
+        if parsed is None or not os.path.isfile(file) or os.path.getsize(file) == 0:
+            return False
+
+        episode, resolution = parsed
+        self._execute('INSERT OR REPLACE INTO downloads VALUES (?, ?, ?, ?, ?, ?, ?)',
+                      (client, str(series_id), episode, resolution, os.path.abspath(file), os.path.getsize(file), time()))
+        return True
+
+    def scan_series(self, client, series_id, series_dir):
+        '''
+        Register the dir of the series and record the files already in it (incl. season dirs). Returns number of files
+        '''
+        self._execute('INSERT OR REPLACE INTO series VALUES (?, ?, ?)', (client, str(series_id), os.path.abspath(series_dir)))
+        count = 0
+        for root, _, files in os.walk(series_dir):
+            count += sum(self.add_file(client, series_id, os.path.join(root, file)) for file in files)
+
+        return count
+
+    def get_completed(self, client, series_id, resolution=None):
+        '''
+        Episode keys of the series downloaded (in the resolution, if given). Downloads whose files are gone are removed
+        '''
+        query, params = 'SELECT episode, resolution, file FROM downloads WHERE client = ? AND series_id = ?', [client, str(series_id)]
+        if resolution is not None:
+            query, params = f'{query} AND resolution = ?', params + [str(resolution)]
+
+        completed = set()
+        for row in self._execute(query, params):
+            if os.path.isfile(row['file']):
+                completed.add(row['episode'])
+            else:
+                self.logger.debug(f'Removing [{row["file"]}] from library index as it no longer exists')
+                self._execute('DELETE FROM downloads WHERE client = ? AND series_id = ? AND episode = ? AND resolution = ?',
+                              (client, str(series_id), row['episode'], row['resolution']))
+
+        return completed
+
+    def rebuild(self):
+        '''
+        Rebuild the index by scanning the dirs of all the registered series. Returns number of files indexed
+        '''
+        self._execute('DELETE FROM downloads')
+        count = 0
+        for row in self._execute('SELECT client, series_id, series_dir FROM series'):
+            if os.path.isdir(row['series_dir']):
+                count += self.scan_series(row['client'], row['series_id'], row['series_dir'])
+            else:
+                self._execute('DELETE FROM series WHERE client = ? AND series_id = ?', (row['client'], row['series_id']))
+
+        return count
+
+
+# index is shared across the process (one per download dir)
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_library_index(db_file):
+    '''
+    Get the process-wide library index stored in the db file
+    '''
+    with _indexes_lock:
+        if db_file not in _indexes:
+            _indexes[db_file] = LibraryIndex(db_file)
+        return _indexes[db_file]
@@ -0,0 +1,59 @@
+import logging
+import random
+import threading
+from time import monotonic
+
+
+class MirrorPool():
+    '''
+    Pool of mirrors serving the same stream.
+
+    Every request picks a mirror at random, weighted by the throughput observed on that mirror,
+    so that the faster mirrors get more requests while all of them contribute bandwidth.
+    Mirrors failing repeatedly are benched for a while (failover to the remaining mirrors).
+    '''
+    def __init__(self, mirrors, failure_threshold=3, cooldown=30):
+        self.logger = logging.getLogger()
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.stats = { m: {'throughput': None, 'failures': 0, 'benched_until': 0, 'requests': 0, 'bytes': 0} for m in mirrors }
+
+    def pick(self, candidates=None, exclude=()):
+        '''
+        Pick a mirror from candidates (default: all mirrors), avoiding the excluded ones if possible
+        '''
+        candidates = [ m for m in (candidates or self.stats) if m in self.stats ]
+        candidates = [ m for m in candidates if m not in exclude ] or candidates
+        now = monotonic()
+        with self.lock:
+            healthy = [ m for m in candidates if self.stats[m]['benched_until'] <= now ] or candidates
+            # unmeasured mirrors are assumed to be as fast as the fastest one, so that they get sampled
+            measured = [ self.stats[m]['throughput'] for m in healthy if self.stats[m]['throughput'] ]
+            default = max(measured) if measured else 1.0
+            weights = [ self.stats[m]['throughput'] or default for m in healthy ]
+
+        return random.choices(healthy, weights=weights)[0]
+
+    def report_success(self, mirror, nbytes, seconds):
+        with self.lock:
+            stats = self.stats[mirror]
+            throughput = nbytes / max(seconds, 1e-3)
+            stats['throughput'] = throughput if stats['throughput'] is None else 0.7 * stats['throughput'] + 0.3 * throughput
+            stats['failures'] = 0
+            stats['requests'] += 1
+            stats['bytes'] += nbytes
+
+    def report_failure(self, mirror):
+        with self.lock:
+            stats = self.stats[mirror]
+            stats['failures'] += 1
+            if stats['failures'] >= self.failure_threshold:
+                stats['benched_until'] = monotonic() + self.cooldown
+                stats['failures'] = 0
+                self.logger.warning(f'Mirror [{mirror}] failed {self.failure_threshold} times in a row. Benching it for {self.cooldown}s')
+
+    def summary(self):
+        with self.lock:
+            return ' | '.join(f"{m}: {s['requests']} requests, {s['bytes'] / 1024**2:.1f} MiB, {(s['throughput'] or 0) / 1024**2:.2f} MiB/s"
+                              for m, s in self.stats.items())
@@ -0,0 +1,135 @@
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+from urllib.parse import urlparse
+
+# scores of the download hosts, shared by all the clients & downloaders of the process
+DEFAULT_SCORES_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Clients', '.scraper_mirror_scores.json')
+
+class MirrorSelector():
+    '''
+    Rank download links by racing them against each other.
+
+    All candidate links are probed concurrently (time-to-first-byte + a short throughput sample).
+    Probe results are blended into per-host health & speed scores, which are persisted to disk,
+    so that the next session starts with the ordering learned so far.
+    '''
+    def __init__(self, scores_file, sample_size=1024**2, max_age_days=30):
+        self.logger = logging.getLogger()
+        self.scores_file = scores_file
+        self.sample_size = sample_size          # size of a typical segment, used to estimate fetch time
+        self.max_age = max_age_days * 86400     # scores not updated for this long are dropped
+        self.lock = threading.Lock()
+        self.scores = self._load()
+
+    def _load(self):
+        if not os.path.isfile(self.scores_file):
+            return {}
+
+        try:
+            with open(self.scores_file) as f:
+                scores = json.loads(f.read())
+        except (OSError, ValueError) as e:
+            self.logger.warning(f'Failed to load mirror scores from [{self.scores_file}]. Error: {e}')
+            return {}
+
+        return { host: s for host, s in scores.items() if time() - s.get('updated', 0) < self.max_age }
+
+    def _save(self):
+        '''
+        Write the scores to a temp file and move it in place, so that a crash (or another writer) never leaves a partial file
+        '''
+        temp_file = f'{self.scores_file}.tmp'
+        with self.lock:
+            try:
+                with open(temp_file, 'w') as f:
+                    json.dump(self.scores, f, indent=2)
+                os.replace(temp_file, self.scores_file)
+            except OSError as e:
+                self.logger.warning(f'Failed to save mirror scores to [{self.scores_file}]. Error: {e}')
+
+    def _update(self, host, ttfb=None, throughput=None):
+        '''
+        Blend a probe result into the host scores (failed probe if ttfb is None)
+        '''
+        ewma = lambda old, new: new if old is None else 0.6 * old + 0.4 * new
+        with self.lock:
+            score = self.scores.setdefault(host, {'ttfb': None, 'throughput': None, 'successes': 0, 'failures': 0})
+            if ttfb is None:
+                score['failures'] += 1
+            else:
+                score['successes'] += 1
+                score['ttfb'] = ewma(score['ttfb'], ttfb)
+                if throughput: score['throughput'] = ewma(score['throughput'], throughput)
+            score['updated'] = time()
+
+    def record_download(self, host, throughput):
+        '''
+        Blend the throughput (bytes/sec) measured by a completed download from the host into its scores
+        '''
+        with self.lock:
+            score = self.scores.setdefault(host, {'ttfb': None, 'throughput': None, 'successes': 0, 'failures': 0})
+            previous = score.get('download_throughput')
+            score['download_throughput'] = throughput if previous is None else 0.6 * previous + 0.4 * throughput
+            score['updated'] = time()
+        self._save()
+
+    def _get_cost(self, host):
+        '''
+        Estimated seconds to fetch a sample sized segment from the host, inflated by its failure rate.
+        Hosts without history are ranked after the measured healthy ones.
+        '''
+        score = self.scores.get(host)
+        if score is None or score['ttfb'] is None:
+            return float('inf')
+
+        fetch_time = score['ttfb'] + (self.sample_size / score['throughput'] if score['throughput'] else 0)
+        health = (score['successes'] + 1) / (score['successes'] + score['failures'] + 2)
+
+        return fetch_time / health
+
+    def rank(self, links, probe_func, get_url=lambda x: x):
+        '''
+        Probe all links concurrently and return them ordered from the fastest to the slowest (failed ones last).
+        - probe_func(url): returns (ttfb, throughput in bytes/sec or None). Raises exception on failure.
+        - get_url: returns url of a link item
+        '''
+        failed = set()
+
+        def _probe(link):
+            url = get_url(link)
+            try:
+                ttfb, throughput = probe_func(url)
+                self._update(urlparse(url).netloc, ttfb, throughput)
+                self.logger.debug(f'Mirror probe [{url}]: ttfb {ttfb:.2f}s, throughput {(throughput or 0) / 1024**2:.2f} MiB/s')
+            except Exception as e:
+                failed.add(url)
+                self._update(urlparse(url).netloc)
+                self.logger.debug(f'Mirror probe [{url}] failed with error: {e}')
+
+        if len(links) > 1:
+            with ThreadPoolExecutor(max_workers=len(links), thread_name_prefix='scraper-probe-') as executor:
+                list(executor.map(_probe, links))
+            self._save()
+
+        # sort is stable, so links with equal cost keep their original order
+        ranked = sorted(links, key=lambda link: (get_url(link) in failed, self._get_cost(urlparse(get_url(link)).netloc)))
+        self.logger.debug(f'Mirrors ranked by probe: {[ get_url(link) for link in ranked ]}')
+
+        return ranked
+
+
+_selectors = {}
+_selectors_lock = threading.Lock()
+
+def get_mirror_selector(scores_file=DEFAULT_SCORES_FILE):
+    '''
+    Get (or create) the mirror selector of the scores file, so that all the clients update the same scores
+    '''
+    with _selectors_lock:
+        if scores_file not in _selectors:
+            _selectors[scores_file] = MirrorSelector(scores_file)
+        return _selectors[scores_file]
@@ -0,0 +1,56 @@
+import logging
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tqdm.auto import tqdm
+
+from Utils.commons import PRINT_THEMES, DISPLAY_COLORS
+
+
+class PostProcessQueue():
+    '''
+    Worker pool for the post-processing stage of downloads (merging, muxing with ffmpeg, cleanup).
+
+    Downloads hand over their post-processing here once all the bytes are in, so that the
+    CPU bound ffmpeg work does not hold a download slot and the next download starts right away.
+    Pool is sized to the CPU cores by default.
+    '''
+    def __init__(self, max_workers=None):
+        self.logger = logging.getLogger()
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='scraper-mux-')
+        self.lock = threading.Lock()
+        self.progress = None
+        self.logger.debug(f'Post-processing queue created with {self.max_workers} workers')
+
+    def _update_progress(self, submitted=0, completed=0):
+        with self.lock:
+            if self.progress is None:
+                theme = PRINT_THEMES['results'] if DISPLAY_COLORS else ''
+                self.progress = tqdm(total=0, desc='Post-processing', unit='ep', file=sys.stdout, ascii='░▒█', leave=True,
+                                     bar_format=theme + '{l_bar}{bar}' + theme + '{r_bar}')
+            self.progress.total += submitted
+            self.progress.update(completed)
+            self.progress.refresh()
+
+    def submit(self, name, func, *args, **kwargs):
+        '''
+        Queue post-processing function of a download. Returns future with the result of the function.
+        '''
+        def _run():
+            self.logger.info(f'Post-processing started for {name}')
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.logger.info(f'Post-processing finished for {name}')
+                self._update_progress(completed=1)
+
+        self._update_progress(submitted=1)
+        return self.executor.submit(_run)
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+        if self.progress is not None:
+            self.progress.close()
+            self.progress = None
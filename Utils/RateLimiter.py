@@ -0,0 +1,117 @@
+import logging
+import threading
+from datetime import datetime
+from time import monotonic, sleep
+
+
+class TokenBucket():
+    '''
+    Token bucket with reservations: a reader takes the tokens it needs right away (the bucket can go into debt)
+    and sleeps for the time it takes to refill the debt. Readers never poll, and with the debt shared
+    across readers, every connection keeps reading at its share of the rate instead of bursting and idling.
+    '''
+    def __init__(self, rate, burst_secs=0.25, min_burst=256*1024):
+        self.lock = threading.Lock()
+        self.burst_secs = burst_secs
+        self.min_burst = min_burst
+        self.set_rate(rate)
+        self.tokens = self.burst
+        self.last_refill = monotonic()
+
+    def set_rate(self, rate):
+        '''
+        Set rate in bytes/sec (None or 0 disables the limit)
+        '''
+        self.rate = rate or None
+        self.burst = max(self.min_burst, (rate or 0) * self.burst_secs)
+
+    def reserve(self, nbytes):
+        '''
+        Take tokens for nbytes and return the seconds to wait before using them
+        '''
+        if self.rate is None:
+            return 0
+
+        with self.lock:
+            now = monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            self.tokens -= nbytes
+
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+
+class BandwidthLimiter():
+    '''
+    Process-wide bandwidth limiter shared by all the downloads.
+    - max_rate_mb: overall limit in MiB/s
+    - per_host: limits in MiB/s for specific hosts (applied on top of the overall limit)
+    - schedule: overall limit by time of day, e.g. [{from: '01:00', to: '07:00', max_rate_mb: 0}] (0 = unlimited)
+    '''
+    def __init__(self, max_rate_mb=None, per_host=None, schedule=None):
+        self.logger = logging.getLogger()
+        self.max_rate_mb = max_rate_mb
+        self.schedule = schedule or []
+        self.bucket = TokenBucket(self._to_bytes(max_rate_mb))
+        self.host_buckets = { host: TokenBucket(self._to_bytes(rate)) for host, rate in (per_host or {}).items() }
+        # schedule is checked periodically, not on every read
+        self.next_schedule_check = 0
+        self.active_rate_mb = max_rate_mb
+        self.enabled = bool(max_rate_mb or self.host_buckets or self.schedule)
+
+    def _to_bytes(self, rate_mb):
+        return rate_mb * 1024 * 1024 if rate_mb else None
+
+    def _get_scheduled_rate(self):
+        '''
+        Overall limit for the current time of day (max_rate_mb if no schedule window matches)
+        '''
+        now = datetime.now().strftime('%H:%M')
+        for window in self.schedule:
+            start, end = window['from'], window['to']
+            # window can wrap around midnight
+            if (start <= now < end) if start <= end else (now >= start or now < end):
+                return window.get('max_rate_mb')
+
+        return self.max_rate_mb
+
+    def _check_schedule(self):
+        now = monotonic()
+        if not self.schedule or now < self.next_schedule_check:
+            return
+
+        self.next_schedule_check = now + 30
+        rate_mb = self._get_scheduled_rate()
+        if rate_mb != self.active_rate_mb:
+            self.logger.info(f'Bandwidth limit changed by schedule: {self.active_rate_mb or "unlimited"} -> {rate_mb or "unlimited"} MiB/s')
+            self.active_rate_mb = rate_mb
+            self.bucket.set_rate(self._to_bytes(rate_mb))
+
+    def consume(self, nbytes, host=None):
+        '''
+        Block until nbytes can be used within the limits of the host and the overall limit
+        '''
+        if not self.enabled:
+            return
+
+        self._check_schedule()
+        wait = self.bucket.reserve(nbytes)
+        if host in self.host_buckets:
+            wait = max(wait, self.host_buckets[host].reserve(nbytes))
+        if wait > 0:
+            sleep(wait)
+
+
+# limiter is shared across all downloads in the process, so that the limit applies to the total bandwidth
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def get_limiter(settings=None):
+    '''
+    Get the process-wide bandwidth limiter (created with the settings of the first caller)
+    '''
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = BandwidthLimiter(**(settings or {}))
+        return _limiter
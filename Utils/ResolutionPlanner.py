@@ -0,0 +1,123 @@
+import logging
+import re
+import statistics
+from datetime import datetime, timedelta
+
+
+def get_seconds(duration):
+    '''
+    Seconds of a duration like '01:23:45', '23:45', '2h30m', '90m' or '45s'. Returns None if not a valid duration
+    '''
+    duration = str(duration or '').strip().lower()
+    if re.fullmatch(r'\d+(:\d{1,2}){1,2}', duration):
+        seconds = 0
+        for part in duration.split(':'):
+            seconds = seconds * 60 + int(part)
+        return seconds
+
+    match = re.fullmatch(r'(?:(\d+(?:\.\d+)?)h)?\s*(?:(\d+(?:\.\d+)?)m)?\s*(?:(\d+(?:\.\d+)?)s)?', duration)
+    if not duration or match is None:
+        return None
+    h, m, s = ( float(x or 0) for x in match.groups() )
+    return round(h * 3600 + m * 60 + s)
+
+
+def get_seconds_until(deadline, now=None):
+    '''
+    Seconds till the deadline: time of day 'HH:MM' (next occurrence) or a duration from now, e.g. '2h30m'
+    '''
+    now = now or datetime.now()
+    if re.fullmatch(r'\d{1,2}:\d{2}', str(deadline).strip()):
+        end = datetime.combine(now.date(), datetime.strptime(str(deadline).strip(), '%H:%M').time())
+        if end <= now:
+            end += timedelta(days=1)
+        return int((end - now).total_seconds())
+
+    seconds = get_seconds(deadline)
+    if seconds is None:
+        raise ValueError(f'Invalid deadline [{deadline}]. Use time of day (HH:MM) or a duration (e.g. 2h30m)')
+    return seconds
+
+
+class ResolutionPlanner():
+    '''
+    Per episode resolution selection within a size budget for the whole batch (a time budget is a size budget at the
+    expected throughput).
+
+    Every episode starts at its lowest resolution and the episodes are raised one resolution level at a time, the
+    cheapest upgrades first, while the total fits the budget. So the quality is spread evenly across the episodes:
+    no episode gets 1080P while others could still be raised to 720P. Resolutions above the requested resolution are
+    not used. If even the lowest resolutions don't fit, the last episodes are left out of the plan.
+    '''
+    def __init__(self, max_resolution):
+        self.logger = logging.getLogger()
+        self.max_resolution = int(max_resolution)
+
+    def _fill_missing_sizes(self, episodes):
+        '''
+        Estimate the sizes missing from the site: from the MB per second of the other episodes at the same resolution
+        (if the duration is known), else the median size at the resolution. Resolutions without any size are dropped.
+        '''
+        known = {}
+        for ep in episodes.values():
+            for res, size in ep['sizes'].items():
+                if size: known.setdefault(res, []).append((size, ep['duration']))
+
+        filled = {}
+        for key, ep in episodes.items():
+            sizes = {}
+            for res, size in ep['sizes'].items():
+                if size:
+                    sizes[res] = size
+                elif res in known:
+                    rates = [ s / d for s, d in known[res] if d ]
+                    sizes[res] = statistics.median(rates) * ep['duration'] if rates and ep['duration'] else statistics.median(s for s, _ in known[res])
+                    self.logger.debug(f'Estimated size of episode {key} at {res}P: {sizes[res]:.1f} MB')
+            filled[key] = sizes
+
+        return filled
+
+    def plan(self, episodes, budget_mb):
+        '''
+        episodes: dict of episode -> {'sizes': {resolution: size in MB or None}, 'duration': seconds or None}, in order.
+        Returns (dict of episode -> resolution, with None for the episodes not in the budget, dict of episode -> size in MB).
+        Episodes without any size are not planned (not in the returned dict)
+        '''
+        candidates = {}
+        for ep, sizes in self._fill_missing_sizes(episodes).items():
+            allowed = { res: size for res, size in sizes.items() if int(res) <= self.max_resolution }
+            if not allowed and sizes:
+                # nothing at or below the requested resolution: lowest available is the only option
+                lowest = min(sizes, key=int)
+                allowed = {lowest: sizes[lowest]}
+            if allowed:
+                candidates[ep] = sorted(allowed.items(), key=lambda x: int(x[0]))
+
+        # start with the lowest resolutions, leaving out the last episodes if even those don't fit
+        plan, total = {}, 0
+        for ep, options in candidates.items():
+            res, size = options[0]
+            if total + size <= budget_mb and None not in plan.values():
+                plan[ep] = res
+                total += size
+            else:
+                plan[ep] = None
+
+        sizes = { ep: dict(options) for ep, options in candidates.items() }
+        levels = sorted({ int(res) for options in candidates.values() for res, _ in options })
+        for level in levels:
+            upgrades = []
+            for ep, res in plan.items():
+                if res is None:
+                    continue
+                best = max(( r for r, _ in candidates[ep] if int(r) <= level ), key=int)
+                if int(best) > int(res):
+                    upgrades.append((sizes[ep][best] - sizes[ep][res], ep, best))
+
+            for extra, ep, best in sorted(upgrades, key=lambda x: x[0]):
+                if total + extra <= budget_mb:
+                    plan[ep] = best
+                    total += extra
+
+        self.logger.debug(f'Resolution plan for {budget_mb:.0f} MB: {plan} ({total:.0f} MB)')
+        return plan, { ep: sizes[ep][res] for ep, res in plan.items() if res is not None }
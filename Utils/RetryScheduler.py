@@ -0,0 +1,137 @@
+import heapq
+import http.client
+import itertools
+import random
+import requests
+from email.utils import parsedate_to_datetime
+from time import monotonic, time
+
+
+class RetryPolicy():
+    '''
+    Retry policy per error class. Decides if a failed request should be retried and after how long.
+
+    Error classes:
+    - timeout: request/read timed out
+    - network: connection reset/refused, incomplete reads
+    - throttled: 429 (honours Retry-After header)
+    - server: 5xx and 408
+    - client: other 4xx (not retried by default)
+    - other: any other error
+    '''
+    DEFAULT_POLICIES = {
+        'timeout':   {'retries': 5, 'base_delay': 1, 'max_delay': 30},
+        'network':   {'retries': 5, 'base_delay': 1, 'max_delay': 30},
+        'throttled': {'retries': 8, 'base_delay': 5, 'max_delay': 120},
+        'server':    {'retries': 5, 'base_delay': 2, 'max_delay': 60},
+        'client':    {'retries': 0, 'base_delay': 2, 'max_delay': 10},
+        'other':     {'retries': 3, 'base_delay': 2, 'max_delay': 30},
+    }
+
+    def __init__(self, policies=None):
+        self.policies = {k: dict(v) for k, v in self.DEFAULT_POLICIES.items()}
+        # override default policies from configuration
+        for error_class, policy in (policies or {}).items():
+            self.policies.setdefault(error_class, {}).update(policy)
+
+    def classify(self, error):
+        status = getattr(error, 'status', None)
+        if status == 429:
+            return 'throttled'
+        elif status is not None and (status >= 500 or status == 408):
+            return 'server'
+        elif status is not None and status >= 400:
+            return 'client'
+        elif isinstance(error, (requests.exceptions.Timeout, TimeoutError)):
+            return 'timeout'
+        elif isinstance(error, (requests.exceptions.ConnectionError, ConnectionError, http.client.HTTPException)):
+            return 'network'
+
+        return 'other'
+
+    def _parse_retry_after(self, retry_after):
+        '''
+        Retry-After header can be either delay in seconds or a http date
+        '''
+        try:
+            return max(0, float(retry_after))
+        except (TypeError, ValueError):
+            pass
+
+        try:
+            return max(0, parsedate_to_datetime(retry_after).timestamp() - time())
+        except (TypeError, ValueError):
+            return None
+
+    def get_delay(self, error, attempt):
+        '''
+        Return delay in seconds before the next attempt, or None if it should not be retried.
+        Uses exponential backoff with jitter, so that retries from all workers are spread out.
+        '''
+        policy = self.policies[self.classify(error)]
+        if attempt > policy['retries']:
+            return None
+
+        delay = min(policy['max_delay'], policy['base_delay'] * 2 ** (attempt - 1))
+        delay = random.uniform(delay / 2, delay)
+
+        # honour delay requested by the server
+        retry_after = self._parse_retry_after(getattr(error, 'retry_after', None))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, policy['max_delay']))
+
+        return delay
+
+
+class RetryScheduler():
+    '''
+    Delayed queue holding failed items until their retry is due.
+    Items wait here instead of sleeping inside the worker threads, so workers keep downloading other items.
+    '''
+    def __init__(self, policy, retry_budget=None):
+        self.policy = policy
+        self.retry_budget = retry_budget        # max retries allowed across all items of a download
+        self.retries = 0
+        self.attempts = {}
+        self.delayed = []
+        self.counter = itertools.count()
+
+    def __len__(self):
+        return len(self.delayed)
+
+    def schedule(self, key, error):
+        '''
+        Schedule the item for retry. Returns the delay, or None if it should not be retried anymore.
+        '''
+        if self.retry_budget is not None and self.retries >= self.retry_budget:
+            return None
+
+        attempt = self.attempts.get(key, 0) + 1
+        delay = self.policy.get_delay(error, attempt)
+        if delay is None:
+            return None
+
+        self.attempts[key] = attempt
+        self.retries += 1
+        heapq.heappush(self.delayed, (monotonic() + delay, next(self.counter), key))
+
+        return delay
+
+    def pop_ready(self):
+        '''
+        Return the items whose retry is due
+        '''
+        ready, now = [], monotonic()
+        while self.delayed and self.delayed[0][0] <= now:
+            ready.append(heapq.heappop(self.delayed)[2])
+
+        return ready
+
+    def time_to_next(self):
+        '''
+        Seconds till the next retry is due (None if nothing is waiting)
+        '''
+        if not self.delayed:
+            return None
+
+        return max(0, self.delayed[0][0] - monotonic())
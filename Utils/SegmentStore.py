@@ -0,0 +1,75 @@
+import os
+import threading
+import zlib
+
+from Utils.DownloadJournal import sync_file
+
+
+class SegmentStore():
+    '''
+    Single data file holding all the segments of an episode, instead of a file per segment.
+
+    Space for a segment is reserved at the end of the data file and the segment is written at that offset,
+    so parallel downloads never wait for each other. The download journal is the index of the store:
+    a segment is recorded with its offset only after it is completely written, so resume works from the journal.
+    '''
+    def __init__(self, data_file, journal):
+        self.data_file = data_file
+        self.journal = journal
+        self.lock = threading.Lock()
+        # never reuse the space after the last byte on disk (it may hold a partially written segment)
+        self.size = os.path.getsize(data_file) if os.path.isfile(data_file) else 0
+        self.fd = os.open(data_file, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def _pwrite(self, data, offset):
+        if hasattr(os, 'pwrite'):
+            view = memoryview(data)
+            while view:
+                n = os.pwrite(self.fd, view, offset)
+                view, offset = view[n:], offset + n
+        else:
+            with self.lock:
+                os.lseek(self.fd, offset, os.SEEK_SET)
+                os.write(self.fd, data)
+
+    def read(self, name):
+        entry = self.journal.get(name)
+        if hasattr(os, 'pread'):
+            return os.pread(self.fd, entry['size'], entry['offset'])
+        with self.lock:
+            os.lseek(self.fd, entry['offset'], os.SEEK_SET)
+            return os.read(self.fd, entry['size'])
+
+    def get_range(self, name):
+        '''
+        Returns (offset, size) of the segment in the data file
+        '''
+        entry = self.journal.get(name)
+        return entry['offset'], entry['size']
+
+    def is_complete(self, name, verify=True):
+        '''
+        Check if the segment is journaled and its bytes in the data file still match it
+        '''
+        entry = self.journal.get(name)
+        if entry is None or 'offset' not in entry or entry['offset'] + entry['size'] > self.size:
+            return False
+
+        return not verify or zlib.crc32(self.read(name)) == entry['crc']
+
+    def add(self, name, data):
+        '''
+        Write the segment to the data file and record it in the journal
+        '''
+        with self.lock:
+            offset = self.size
+            self.size += len(data)
+
+        self._pwrite(data, offset)
+        sync_file(self.fd)
+        self.journal.record(name, len(data), zlib.crc32(data), offset=offset)
@@ -0,0 +1,74 @@
+import json
+import logging
+import sqlite3
+import threading
+from time import time
+
+
+class Watchlist():
+    '''
+    Followed series and their sync state, in a local SQLite database.
+
+    The selected series (search result) is kept after the first sync, so the series is not searched again, and
+    last_episode is the episode till which all the episodes are downloaded. A sync asks only for the episodes
+    released after it. Series states: watching -> finished (once the series has ended & all its episodes are in)
+    '''
+    def __init__(self, db_file):
+        self.logger = logging.getLogger()
+        self.db_file = db_file
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS watchlist (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                spec TEXT NOT NULL UNIQUE,
+                target TEXT,
+                last_episode TEXT,
+                state TEXT NOT NULL DEFAULT 'watching',
+                error TEXT,
+                synced_at REAL
+            )
+        ''')
+
+    def _execute(self, query, params=()):
+        with self.lock:
+            return self.conn.execute(query, params).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+    def add_series(self, spec):
+        '''
+        Follow the series, if the same spec is not followed already. Returns id of the series
+        '''
+        spec = json.dumps(spec, sort_keys=True)
+        self._execute('INSERT OR IGNORE INTO watchlist (spec) VALUES (?)', (spec,))
+        return self._execute('SELECT id FROM watchlist WHERE spec = ?', (spec,))[0]['id']
+
+    def get_series(self, states=('watching',)):
+        '''
+        Series in the given states. Returns list of dicts with id, spec, target (None before the first sync) & last episode
+        '''
+        rows = self._execute(f'SELECT * FROM watchlist WHERE state IN ({",".join("?" * len(states))}) ORDER BY id', states)
+        return [ {'id': row['id'], 'spec': json.loads(row['spec']), 'target': json.loads(row['target']) if row['target'] else None,
+                  'lastEpisode': row['last_episode'], 'state': row['state']} for row in rows ]
+
+    def set_target(self, watch_id, target):
+        self._execute('UPDATE watchlist SET target = ? WHERE id = ?', (json.dumps(target), watch_id))
+
+    def set_synced(self, watch_id, last_episode, state='watching', error=None):
+        self._execute('UPDATE watchlist SET last_episode = ?, state = ?, error = ?, synced_at = ? WHERE id = ?',
+                      (last_episode, state, error, time(), watch_id))
+
+    def set_error(self, watch_id, error):
+        self._execute('UPDATE watchlist SET error = ?, synced_at = ? WHERE id = ?', (error, time(), watch_id))
+
+    def summary(self):
+        '''
+        Returns dict of id -> {series name, state, last episode, error}
+        '''
+        return { row['id']: {'series': json.loads(row['spec']).get('series_name'), 'state': row['state'],
+                             'lastEpisode': row['last_episode'], 'error': row['error']}
+                 for row in self._execute('SELECT * FROM watchlist ORDER BY id') }
@@ -1,5 +1,6 @@
 import logging
 import os
+import random
 import re
 import requests
 import sys
@@ -9,7 +10,6 @@ from datetime import datetime
 from functools import wraps
 from time import sleep
 from logging.handlers import RotatingFileHandler
-from subprocess import Popen, PIPE
 
 
 # color themes
@@ -38,20 +38,21 @@ class ExitException(Exception):
     '''
     pass
 
-def exec_os_cmd(cmd):
+class DownloadError(Exception):
     '''
-    Execute any OS commands
-    Args: command to be executed
-    Returns: output of executed command
+    Exception raised for failed http responses while downloading.
+    Carries the response status and Retry-After header (if any) to decide on retries.
     '''
-    proc = Popen(cmd, stdout=PIPE, stderr=PIPE, shell=True)
-    # print stdout to console
-    msg = proc.communicate()[0].decode("utf-8")
-    std_err = proc.communicate()[1].decode("utf-8")
-    rc = proc.returncode
-    if rc != 0:
-        raise Exception(f"Error occured: {std_err}")
-    return msg
+    def __init__(self, msg, status=None, retry_after=None):
+        super().__init__(msg)
+        self.status = status
+        self.retry_after = retry_after
+
+class DownloadCancelled(Exception):
+    '''
+    Exception raised when a download request is cancelled (e.g., duplicate request lost the race)
+    '''
+    pass
 
 # display seconds in hh mm ss format
 def pretty_time(sec: int, fmt='hh:mm:ss'):
@@ -128,7 +129,9 @@ def retry(exceptions=(Exception,), tries=3, delay=2, backoff=2, print_errors=Fal
     """
     Retry Decorator
     Retries the wrapped function/method `times` times if the exceptions listed
-    in ``exceptions`` are thrown
+    in ``exceptions`` are thrown. Delay between attempts is jittered to avoid
+    retrying in lock-step with other threads. Last exception is raised once
+    all the attempts are exhausted.
     :param Exceptions: Lists of exceptions that trigger a retry attempt
     :type Exceptions: Tuple of Exceptions
     """
@@ -136,20 +139,18 @@ def retry(exceptions=(Exception,), tries=3, delay=2, backoff=2, print_errors=Fal
         @wraps(func)
         def wrapper(*args, **kwargs):
             attempt, mdelay = 0, delay
-            while attempt < tries:
+            while True:
                 try:
-                    return_status = func(*args, **kwargs)
-                    if type(return_status) == tuple and return_status[1] == 0:
-                        raise Exception(return_status)
-                    return return_status
+                    return func(*args, **kwargs)
                 except exceptions as e:
                     # colprint('error', f'{e} | Attempt: {attempt} / {tries}')
-                    sleep(mdelay)
                     attempt += 1
+                    if attempt >= tries:
+                        if print_errors:
+                            colprint('error', f'{e} | Final Attempt: {attempt} / {tries}')
+                        raise
+                    sleep(random.uniform(mdelay / 2, mdelay))
                     mdelay *= backoff
-                    if attempt >= tries and print_errors:
-                        colprint('error', f'{e} | Final Attempt: {attempt} / {tries}')
-            return func(*args, **kwargs)
         return wrapper
     return decorator
 
@@ -0,0 +1,106 @@
+'''
+Cold start benchmark for scraper.py and the client modules.
+
+Every module is imported in a fresh interpreter with `python -X importtime` and the median cumulative import time
+is compared with its budget in startup_budget.json. Heavy dependencies listed in the budget (browser automation,
+html parser, crypto, js engine) must not be imported at startup at all, they are imported by the functions using them.
+
+Exits with code 1 if any module is over its budget or imports a heavy dependency, so it can be used as a check.
+
+Usage:
+    python benchmarks/startup_time.py               # check against the budget
+    python benchmarks/startup_time.py -n 10 -v      # more runs, show the slowest imports
+    python benchmarks/startup_time.py --update      # set the budget from this machine (measured time + headroom)
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'startup_budget.json')
+
+
+def measure(module):
+    '''
+    Import the module in a new interpreter. Returns (total import time in ms, dict of imported module -> cumulative ms)
+    '''
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f'Failed to import {module}: {result.stderr.strip().splitlines()[-1]}')
+
+    total, imports = 0, {}
+    # format: "import time: self [us] | cumulative | imported package" (nested imports are indented)
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        name = name[1:]
+        imports[name.strip()] = int(cumulative) / 1000
+        if not name.startswith(' '):
+            total += int(cumulative) / 1000
+
+    return total, imports
+
+
+def run(budget, runs, verbose=False):
+    '''
+    Measure all the modules in the budget. Returns dict of module -> {median ms, heavy modules imported, slowest imports}
+    '''
+    results = {}
+    for module in budget['modules']:
+        measure(module)     # warm-up run, to compile the .pyc files
+        timings, imports = [], {}
+        for _ in range(runs):
+            total, imports = measure(module)
+            timings.append(total)
+
+        heavy = sorted({ name for name in imports if name.split('.')[0] in budget['forbidden'] })
+        slowest = sorted(imports.items(), key=lambda i: i[1], reverse=True)[:10] if verbose else []
+        results[module] = {'median': statistics.median(timings), 'heavy': heavy, 'slowest': slowest}
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the import time of scraper.py & client modules against a budget.')
+    parser.add_argument('-n', '--runs', type=int, help='number of runs per module (default: from the budget file)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='show the slowest imports of every module')
+    parser.add_argument('--update', action='store_true', help='update the budget with the measured times (plus headroom)')
+    args = parser.parse_args()
+
+    with open(BUDGET_FILE) as f:
+        budget = json.load(f)
+
+    results = run(budget, args.runs or budget.get('runs', 5), args.verbose)
+
+    if args.update:
+        for module, result in results.items():
+            budget['modules'][module] = round(result['median'] * budget.get('headroom', 1.5))
+        with open(BUDGET_FILE, 'w') as f:
+            json.dump(budget, f, indent=2)
+            f.write('\n')
+        print(f'Budget updated: {budget["modules"]}')
+        return 0
+
+    failed = False
+    print(f'{"Module":<30} {"Median (ms)":>12} {"Budget (ms)":>12}  Status')
+    for module, result in results.items():
+        status = 'OK'
+        if result['heavy']:
+            status = f'FAIL (imports {", ".join(result["heavy"])})'
+        elif result['median'] > budget['modules'][module]:
+            status = 'FAIL (over budget)'
+        failed = failed or status != 'OK'
+        print(f'{module:<30} {result["median"]:>12.1f} {budget["modules"][module]:>12}  {status}')
+        for name, cumulative in result['slowest']:
+            print(f'    {cumulative:>8.1f} ms  {name}')
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,10 @@
 import argparse
 from datetime import datetime
-import os, sys
-from time import time
+from itertools import chain
+import os
+import shutil
+import threading
+from time import monotonic, sleep, time
 import traceback
 
 # Note: For optimization, custom modules are imported as required
@@ -10,24 +13,233 @@ from Utils.commons import create_logger, load_yaml, pretty_time, strip_ansi, thr
 
 ACTIVE_CLIENTS = ['Anime', 'Movies & Shows']
 get_current_time = lambda fmt='%F %T': datetime.now().strftime(fmt)
+# clients are created once per series type and kept warm (session, cookies, site tokens) for the whole process
+warm_clients = {}
+warm_clients_lock = threading.Lock()
 
-def get_client():
-    '''Return a client instance'''
+def get_client(client_type=None):
+    '''Return a client instance (for the selected series type by default)'''
+    client_type = client_type or series_type
     # add hls_size_accuracy parameter passed from cli
-    config.setdefault(series_type, {}).update({'hls_size_accuracy': hls_size_accuracy})
+    config.setdefault(client_type, {}).update({'hls_size_accuracy': hls_size_accuracy})
     # Load required Client based on user selection, to avoid unnecessary imports
-    if series_type == 'Anime':
+    if client_type == 'Anime':
         logger.debug('Creating Anime Client for AnimePahe site')
         from Clients.AnimePaheClient import AnimePaheClient
         return AnimePaheClient(config['Anime'])
-    elif series_type == 'Movies & Shows':
+    elif client_type == 'Movies & Shows':
         logger.debug('Creating KissKh Client for Movies & Shows')
         from Clients.KissKhClient import KissKhClient
         return KissKhClient(config['Movies & Shows'], series_type='Movies & Shows')
     else:
-        logger.error(f'Unknown series type: {series_type}')
+        logger.error(f'Unknown series type: {client_type}')
         raise ExitException(1)
 
+def get_warm_client(client_type):
+    '''Return a client for a new series of the type, cloned from the warm client of the type'''
+    with warm_clients_lock:
+        if client_type not in warm_clients:
+            warm_clients[client_type] = get_client(client_type)
+        return warm_clients[client_type].clone()
+
+def get_download_config(client_type):
+    '''Return a copy of download configuration with the settings specific to the series type'''
+    dl_config = dict(config['DownloaderConfig'])
+
+    # set client specific download configurations
+    if client_type == 'Movies & Shows':  # KissKh client
+        dl_config['use_http_client'] = True
+
+    # set respective download dir if present
+    if 'download_dir' in config.get(client_type, {}):
+        logger.debug(f'Setting download dir to [{config[client_type]["download_dir"]}] from series specific configuration')
+        dl_config['download_dir'] = config[client_type]['download_dir']
+
+    # modify path based on the platform OS
+    dl_config['download_dir'] = get_os_safe_path(dl_config['download_dir'])
+    # check if download path exists
+    check_if_exists(dl_config['download_dir'])
+
+    # index of the completed downloads of the download dir
+    if dl_config.get('library_index', True):
+        dl_config['library_file'] = os.path.join(dl_config['download_dir'], '.scraper_library.db')
+    # subtitles cache is shared by all the series of the download dir (kept outside their temp dirs)
+    dl_config['subtitles_cache_dir'] = os.path.join(dl_config['download_dir'], '.scraper_subtitles_cache')
+
+    return dl_config
+
+def skip_downloaded_episodes(client, target_series, episodes, dl_config, resolution=None):
+    '''
+    Drop the episodes of the series already downloaded (in the resolution, if given) as per the library index,
+    so that their links are not resolved again. dl_config must have the download dir of the series.
+    '''
+    if not dl_config.get('library_file'):
+        return episodes
+
+    from Utils.LibraryIndex import get_library_index, get_episode_key
+    library = get_library_index(dl_config['library_file'])
+    # completed downloads are recorded against the series by the downloader
+    dl_config['library_key'] = (type(client).__name__, str(client.get_series_id(target_series)))
+    # pick up the files downloaded before the index existed (or by other means)
+    library.scan_series(*dl_config['library_key'], dl_config['download_dir'])
+    completed = library.get_completed(*dl_config['library_key'], resolution)
+
+    # movies have no episode number in the file name
+    if '' in completed and len(episodes) == 1:
+        return []
+
+    remaining = [ episode for episode in episodes if get_episode_key(episode.get('episode')) not in completed ]
+    if len(remaining) < len(episodes):
+        logger.debug(f'Episodes in library index: {sorted(completed)}')
+        msg = f'{len(episodes) - len(remaining)} episode(s) of the series are already downloaded and will be skipped'
+        logger.info(msg); colprint('predefined', f'\n{msg}')
+
+    return remaining
+
+def check_disk_space(dl_links, dl_config):
+    '''
+    Preflight: total the expected temp & final footprint of the episodes (from the size estimates of the client) against
+    the free space of the download & temp dirs. Episodes that don't fit are skipped (disk_space_check: trim), or the
+    download is stopped (refuse). Returns the download links
+    '''
+    mode = dl_config.get('disk_space_check', 'trim')
+    if mode == 'off':
+        return dl_links
+
+    from Utils.DiskSpace import get_disk_space
+    temp_dir = os.path.join(dl_config['download_dir'], 'temp_dir') if dl_config.get('temp_download_dir', 'auto') == 'auto' else dl_config['temp_download_dir']
+    downloads = [ (ep, int(ep_details['filesizeMb'] * 1024**2) if ep_details.get('filesizeMb') else None, dl_config['download_dir'], temp_dir)
+                  for ep, ep_details in dl_links.items() if ep_details.get('downloadLink') ]
+    fit, skipped, report = get_disk_space(dl_config.get('min_free_space_mb', 500)).plan(downloads, max_parallel_downloads)
+
+    unknown = len([ download for download in downloads if download[1] is None ])
+    for path, usage in report.items():
+        msg = f"Disk space needed on [{path}]: {usage['needed'] / 1024**3:.2f} GB of {usage['free'] / 1024**3:.2f} GB free"
+        if unknown: msg += f' (size not known for {unknown} episode(s))'
+        logger.info(msg); colprint('results', f'\n{msg}', end='')
+    if report: print()
+
+    if skipped:
+        msg = f'Not enough disk space for {len(skipped)}/{len(downloads)} episode(s): {", ".join(str(ep) for ep in skipped)}'
+        if mode == 'refuse':
+            logger.error(f'{msg}. Free up some space or select fewer episodes')
+            raise ExitException(1)
+        logger.warning(f'{msg}. Skipping them')
+        for ep in skipped:
+            dl_links[ep].pop('downloadLink')
+            dl_links[ep]['error'] = 'Not enough disk space'
+
+    return dl_links
+
+def get_expected_throughput(client, target_ep_links, dl_config, throughput_mb='auto'):
+    '''
+    Expected download throughput of the batch in MB/s, capped by the bandwidth limit. None if not known:
+    - throughput_mb, if set
+    - else the throughput measured by the earlier downloads from the download hosts (all hosts if the hosts of the
+      links were not downloaded from yet)
+    - else the throughput of the hosts measured by the mirror probes (per connection), for max_parallel_downloads episodes at once
+    '''
+    if throughput_mb not in (None, 'auto'):
+        return float(throughput_mb)
+
+    from urllib.parse import urlparse
+    from Utils.MirrorSelector import get_mirror_selector
+    scores = get_mirror_selector(client.mirror_scores_file).scores
+    hosts = { urlparse(res_dict['downloadLink']).netloc for links in target_ep_links.values()
+              for res_dict in links.values() if isinstance(res_dict, dict) and res_dict.get('downloadLink') }
+    _get_measured = lambda key: [ scores[host][key] for host in hosts if scores.get(host, {}).get(key) ] or \
+                                [ score[key] for score in scores.values() if score.get(key) ]
+    _median = lambda values: sorted(values)[len(values) // 2] / 1024**2
+
+    if _get_measured('download_throughput'):
+        throughput = _median(_get_measured('download_throughput'))
+        logger.info(f'Expected throughput {throughput:.2f} MB/s, as measured by the earlier downloads')
+    elif _get_measured('throughput'):
+        throughput = _median(_get_measured('throughput')) * max_parallel_downloads
+        logger.info(f'Expected throughput {throughput:.2f} MB/s, from the mirror probes ({max_parallel_downloads} parallel downloads)')
+    else:
+        return None
+
+    max_rate_mb = (dl_config.get('bandwidth_limit') or {}).get('max_rate_mb')
+    return min(throughput, max_rate_mb) if max_rate_mb else throughput
+
+def plan_resolutions(client, target_ep_links, resolution, dl_config):
+    '''
+    Select the resolution of every episode to get the best quality within the size budget (max_size_gb) and/or the
+    time budget (deadline, at the expected throughput) of resolution_budget. The requested resolution is the highest used.
+    Prints the plan and returns dict of episode -> resolution (None = not in the budget), None if there is no budget
+    '''
+    budget = dict(dl_config.get('resolution_budget') or {})
+    if size_budget_predef: budget['max_size_gb'] = size_budget_predef
+    if deadline_predef: budget['deadline'] = deadline_predef
+    if not budget.get('max_size_gb') and not budget.get('deadline'):
+        return None
+
+    from Utils.ResolutionPlanner import ResolutionPlanner, get_seconds_until
+    budgets, throughput = [], None
+    if budget.get('max_size_gb'):
+        budgets.append((float(budget['max_size_gb']) * 1024, f"size budget of {float(budget['max_size_gb']):g} GB"))
+    if budget.get('deadline'):
+        seconds = get_seconds_until(budget['deadline'])
+        throughput = get_expected_throughput(client, target_ep_links, dl_config, budget.get('throughput_mb', 'auto'))
+        if throughput is None:
+            msg = 'Deadline is not applied: download throughput is not measured yet (no earlier downloads or mirror probes). Set throughput_mb of resolution_budget to use it'
+            logger.warning(msg); colprint('error', msg)
+        else:
+            budgets.append((throughput * seconds, f"deadline {budget['deadline']} ({pretty_time(seconds, fmt='')} at ~{throughput:.2f} MB/s)"))
+    if not budgets:
+        return None
+    budget_mb, budget_desc = min(budgets)
+
+    episodes = {}
+    for ep, links in target_ep_links.items():
+        res_links = { res: res_dict for res, res_dict in links.items() if str(res).isdigit() and isinstance(res_dict, dict) }
+        if 'error' in links or not res_links:
+            continue
+        durations = [ duration for duration in map(client.get_duration, res_links.values()) if duration ]
+        episodes[ep] = {'sizes': { res: client.get_filesize_mb(res_dict) for res, res_dict in res_links.items() },
+                        'duration': durations[0] if durations else None}
+
+    plan, sizes = ResolutionPlanner(resolution).plan(episodes, budget_mb)
+    if not plan:
+        msg = 'Resolution budget is not applied: file sizes of the episodes are not known, so the resolutions are selected as usual'
+        logger.warning(msg); colprint('error', msg)
+        return None
+
+    logger.info(f'Resolution plan within {budget_desc}: {plan}')
+    colprint('header', f'\nResolution plan within {budget_desc}:')
+    for ep, res in plan.items():
+        colprint('results', f'Episode: {ep} | {res}P | ~{sizes[ep]:.0f} MB' if res else f'Episode: {ep} | Skipped (not in the budget)')
+
+    total = sum(sizes.values())
+    msg = f'Planned {total / 1024:.2f} GB of {budget_mb / 1024:.2f} GB'
+    if throughput: msg += f', expected download time {pretty_time(round(total / throughput), fmt="")}'
+    unplanned = len(episodes) - len(plan)
+    if unplanned: msg += f' (size not known for {unplanned} episode(s), their resolution is selected as usual)'
+    logger.info(msg); colprint('results', msg)
+
+    return plan
+
+def rebuild_library():
+    '''Rebuild the library index of the download dirs by scanning the dirs of the series downloaded earlier'''
+    from Utils.LibraryIndex import get_library_index
+    library_files = { get_download_config(client_type).get('library_file') for client_type in ACTIVE_CLIENTS } - {None}
+    for library_file in library_files:
+        count = get_library_index(library_file).rebuild()
+        logger.info(f'Library index [{library_file}] rebuilt with {count} download(s)')
+        colprint('results', f'\nLibrary index [{library_file}] rebuilt with {count} download(s)')
+
+def record_download(dl_config, out_files):
+    '''Record the downloaded file (first existing of the output files) in the library index'''
+    if not dl_config.get('library_key'):
+        return
+    from Utils.LibraryIndex import get_library_index
+    try:
+        out_file = next(f for f in out_files if os.path.isfile(f))
+        get_library_index(dl_config['library_file']).add_file(*dl_config['library_key'], out_file)
+    except Exception as e:
+        logger.warning(f'Failed to record download in library index: {e}')
+
 def get_os_safe_path(tmp_path):
     '''Returns OS corrected path with expanded home directory'''
     # First expand the home directory if path starts with ~
@@ -126,6 +338,20 @@ def get_resolutions(items):
     for item in items:
         yield [ i for i in item.keys() if i not in ('error', 'original') ]
 
+def select_resolution(ep_links, predefined_input=None):
+    '''
+    Get download resolution from user. Resolutions of the first non-empty episode are shown as options
+    '''
+    if predefined_input:
+        colprint('predefined', f'\nUsing Predefined Input for resolution: {predefined_input}')
+        return predefined_input
+
+    # get the resolutions from the first non-empty episode (set to default if empty)
+    valid_resolutions = next((res for res in get_resolutions(ep_links) if len(res) > 0), ['360','480','720','1080'])
+    logger.debug(f'{valid_resolutions = }')
+
+    return str(colprint('user_input', f"\nEnter download resolution ({'|'.join(valid_resolutions)}) [default=720]: ", input_type='recurring', input_dtype='int')) or "720"
+
 def get_ep_range(default_ep_range, mode='Enter', _episodes_predef=None, type='episodes'):
     '''
     Get the seasons/episodes range from user input.
@@ -187,10 +413,12 @@ def get_ep_range_multiple(season_ep_ranges):
 
     return selected_eps
 
-def downloader(ep_details, dl_config):
+def downloader(ep_details, dl_config, post_process_queue=None):
     '''
     Download function where Download Client initialization and download happens.
     Accepts two dicts: download config, episode details. Returns download status.
+    If post_process_queue is passed, post-processing (merge/mux) is queued there once the download completes,
+    and a future with the download status is returned instead.
     '''
     # load color themes
     error_clr = PRINT_THEMES['error'] if not disable_colors else ''
@@ -207,11 +435,6 @@ def downloader(ep_details, dl_config):
         return f'{error_clr}[{start}] Download skipped for {out_file}, due to error: {ep_details.get("error", "Unknown")}{reset_clr}'
 
     download_type = ep_details['downloadType']
-    # set output directory based on series type
-    out_dir = dl_config['download_dir']
-    if ep_details.get('type', '') == 'tv':
-        out_dir = f"{out_dir}{os.sep}Season-{ep_details['season']}"     # add extra folder for season
-
     # create download client for the episode based on type
     logger.debug(f'Creating download client with {ep_details = }, {dl_config = }')
 
@@ -230,38 +453,70 @@ def downloader(ep_details, dl_config):
 
     logger.info(f'Download started for {out_file}...')
 
-    if os.path.isfile(os.path.join(f'{out_dir}', f'{out_file}')) and os.path.getsize(os.path.join(f'{out_dir}', f'{out_file}')) > 0:
-        # skip file if already exists
+    if any(os.path.isfile(f) and os.path.getsize(f) > 0 for f in dlClient.get_out_files()):
+        # skip file if already exists (in any of the output containers)
+        record_download(dl_config, dlClient.get_out_files())
         return f'{skipped_clr}[{start}] Download skipped for {out_file}. File already exists!{reset_clr}'
     else:
         try:
-            # main function where HLS download happens
-            status, msg = dlClient.start_download(ep_details['downloadLink'])
+            # main function where HLS download happens (link is resolved again, if it is too old to be still valid)
+            status, msg = dlClient.download(dlClient.get_download_link())
         except Exception as e:
             status, msg = 1, str(e)
 
-        # remove target dirs if no files are downloaded
-        dlClient._cleanup_out_dirs()
-
-        end = get_current_time()
         if status != 0:
-            return f'{error_clr}[{end}] Download failed for {out_file}, with error: {msg}{reset_clr}'
+            # remove target dirs if no files are downloaded
+            dlClient._cleanup_out_dirs()
+            return f'{error_clr}[{get_current_time()}] Download failed for {out_file}, with error: {msg}{reset_clr}'
+
+        def post_process():
+            try:
+                # merge/convert the downloaded files to the final video
+                status, msg = dlClient.post_process()
+            except Exception as e:
+                status, msg = 1, str(e)
+
+            # remove target dirs if no files are downloaded
+            dlClient._cleanup_out_dirs()
+
+            end = get_current_time()
+            if status != 0:
+                return f'{error_clr}[{end}] Download failed for {out_file}, with error: {msg}{reset_clr}'
 
-        end_epoch = int(time())
-        download_time = pretty_time(end_epoch-start_epoch, fmt='h m s')
-        return f'{success_clr}[{end}] Download completed for {out_file} in {download_time}!{reset_clr}'
+            record_download(dl_config, dlClient.get_out_files())
+            end_epoch = int(time())
+            download_time = pretty_time(end_epoch-start_epoch, fmt='h m s')
+            return f'{success_clr}[{end}] Download completed for {out_file} in {download_time}!{reset_clr}'
+
+        if post_process_queue is None:
+            return post_process()
+
+        # free up the download slot for the next episode while this one is post-processed
+        return post_process_queue.submit(out_file, post_process)
 
 def batch_downloader(download_fn, links, dl_config, max_parallel_downloads):
+    from concurrent.futures import Future
+    from Utils.PostProcessQueue import PostProcessQueue
+
+    # post-processing (merge/mux) runs on its own pool, so it doesn't hold the download slots
+    post_process_workers = dl_config.get('max_parallel_post_processing', 'auto')
+    post_process_queue = PostProcessQueue(None if post_process_workers == 'auto' else post_process_workers)
 
     @threaded(max_parallel=max_parallel_downloads, thread_name_prefix='scraper-', print_status=False)
     def call_downloader(link, dl_config):
-        return download_fn(link, dl_config)
+        return download_fn(link, dl_config, post_process_queue)
 
-    dl_status = call_downloader(links.values(), dl_config)
+    try:
+        # links can also be an iterator of episodes, which are queued for download as soon as they are resolved
+        dl_status = call_downloader(links.values() if isinstance(links, dict) else links, dl_config)
+        # wait for the queued post-processing to complete
+        dl_status = [ status.result() if isinstance(status, Future) else status for status in dl_status ]
+    finally:
+        post_process_queue.shutdown()
 
     # show download status at the end, so that progress bars are not disturbed
     print("\033[K") # Clear to the end of line
-    width = os.get_terminal_size().columns
+    width = shutil.get_terminal_size().columns
     header_clr = PRINT_THEMES['header'] if not disable_colors else ''
     reset_clr = PRINT_THEMES['reset'] if not disable_colors else ''
 
@@ -273,6 +528,529 @@ def batch_downloader(download_fn, links, dl_config, max_parallel_downloads):
     logger.info(strip_ansi(status_str))
     colprint('header', '' * width)
 
+def select_job_series(job_client, job):
+    '''
+    Search the series of the job. Picks the search result at `pick` position if set, else the first one with
+    exactly the same title (or the first result)
+    '''
+    search_results = job_client.search(job['series_name'])
+    if not search_results:
+        raise Exception(f'No matches found for [{job["series_name"]}]')
+
+    if job.get('pick'):
+        return search_results[int(job['pick'])]
+
+    return next((v for v in search_results.values() if v.get('title', '').lower() == job['series_name'].lower()), search_results[1])
+
+def get_job_client_type(job):
+    '''Series type of the job (name or its number in the menu)'''
+    if job.get('series_type') in ACTIVE_CLIENTS:
+        return job['series_type']
+    try:
+        return ACTIVE_CLIENTS[int(job.get('series_type')) - 1]
+    except (TypeError, ValueError, IndexError):
+        raise ValueError(f'Unknown series type: {job.get("series_type")}')
+
+def prepare_job(job):
+    '''
+    Search the series of the job and select its episodes.
+    Returns dict with the client, download config, episodes & selected range, resolution and episode prefix of the job
+    '''
+    client_type = get_job_client_type(job)
+    # clients keep state of the series being resolved, so every job gets its own (warm) client
+    job_client = get_warm_client(client_type)
+    job_dl_config = get_download_config(client_type)
+
+    target_series = select_job_series(job_client, job)
+    logger.info(f'Selected series for job [{job["series_name"]}]: {target_series}')
+    episodes = job_client.fetch_episodes_list(target_series)
+    if len(episodes) == 0:
+        raise Exception('No episodes found in selected series')
+
+    default_ep_range = f"{episodes[0]['episode']}-{episodes[-1]['episode']}"
+    selected_eps = get_ep_range(default_ep_range, 'Enter', str(job.get('episodes') or default_ep_range))
+    series_title, episode_prefix = job_client.set_out_names(target_series)
+    job_dl_config['download_dir'] = os.path.join(f"{job_dl_config['download_dir']}", f"{series_title}")
+    resolution = str(job.get('resolution', '720'))
+    # episodes already downloaded are not resolved again
+    episodes = skip_downloaded_episodes(job_client, target_series, episodes, job_dl_config, resolution)
+
+    return {'client': job_client, 'dlConfig': job_dl_config, 'episodes': episodes, 'selectedEps': selected_eps,
+            'resolution': resolution, 'episodePrefix': episode_prefix}
+
+def iter_pending_jobs(job_queue):
+    '''
+    Pending jobs of the queue, one at a time (including the jobs added while the earlier ones are running)
+    '''
+    while True:
+        jobs = job_queue.get_jobs(('pending',))
+        if not jobs:
+            return
+        yield jobs[0]
+
+def iter_job_episodes(job_queue, jobs, clients):
+    '''
+    Resolve the episodes of the jobs one by one, skipping the completed ones.
+    Yields each episode (with its job & download config) as soon as its download link is found
+    '''
+    for job_id, job in jobs:
+        logger.info(f'Processing job {job_id}: {job}')
+        colprint('header', f"\nJob {job_id}: {job['series_name']}")
+        job_queue.set_job_state(job_id, 'running')
+        try:
+            prepared = prepare_job(job)
+            job_client = clients[job_id] = prepared['client']
+            job_dl_config = prepared['dlConfig']
+            # episodes completed in an earlier run are not resolved again
+            episode_states = job_queue.get_episode_states(job_id)
+            episodes = [ episode for episode in prepared['episodes'] if episode_states.get(str(episode['episode'])) != 'completed' ]
+
+        except Exception as e:
+            logger.error(f'Job {job_id} failed with error: {e}')
+            job_queue.set_job_state(job_id, 'failed', str(e))
+            continue
+
+        resolution, episode_prefix = prepared['resolution'], prepared['episodePrefix']
+        for episode, links in job_client.iter_episode_links(episodes, prepared['selectedEps']):
+            ep_details = next(job_client.iter_download_links([(episode, links)], resolution, episode_prefix))
+            job_queue.set_episode_state(job_id, episode['episode'], 'pending', ep_details.get('episodeName'))
+            yield {'jobId': job_id, 'episode': episode['episode'], 'epDetails': ep_details, 'dlConfig': job_dl_config}
+
+def is_download_completed(status):
+    '''Check if the download status returned by the downloader is of a completed (or already existing) download'''
+    return 'Download completed' in status or 'File already exists' in status
+
+def job_downloader(job_episode, dl_config, post_process_queue=None):
+    '''
+    Download the episode of a job (with the download config of the job) and record its state in the job queue
+    '''
+    from concurrent.futures import Future
+
+    job_id, episode = job_episode['jobId'], job_episode['episode']
+    job_queue.set_episode_state(job_id, episode, 'downloading')
+
+    def _record_status(status):
+        completed = is_download_completed(status)
+        job_queue.set_episode_state(job_id, episode, 'completed' if completed else 'failed', error=None if completed else strip_ansi(status))
+
+    status = downloader(job_episode['epDetails'], job_episode['dlConfig'], post_process_queue)
+    if isinstance(status, Future):
+        status.add_done_callback(lambda future: _record_status(future.result()))
+    else:
+        _record_status(status)
+
+    return status
+
+def add_jobs_from_file(job_queue, jobs_file):
+    '''Add the jobs of the yaml file to the job queue (jobs already in the queue are not added again)'''
+    jobs_spec = load_yaml(jobs_file)
+    jobs_spec = jobs_spec.get('jobs', []) if isinstance(jobs_spec, dict) else (jobs_spec or [])
+    for job in jobs_spec:
+        if not job.get('series_name') or not job.get('series_type'):
+            logger.error(f'Skipping invalid job (series_type & series_name are required): {job}')
+            continue
+        job_queue.add_job(job)
+
+def run_jobs(jobs_file):
+    '''
+    Headless mode: queue the jobs of the file in a persistent job queue (next to the jobs file) and download all the
+    unfinished jobs. Episodes of all the jobs go through a single download pipeline.
+    '''
+    global job_queue
+    from Utils.JobQueue import JobQueue
+
+    job_queue = JobQueue(os.path.splitext(jobs_file)[0] + '.db')
+    clients = {}
+    try:
+        job_queue.recover()
+        add_jobs_from_file(job_queue, jobs_file)
+
+        jobs = job_queue.get_jobs()
+        logger.info(f'Running {len(jobs)} unfinished job(s) from [{job_queue.db_file}]')
+        colprint('header', f'\nRunning {len(jobs)} unfinished job(s)...')
+        if jobs:
+            batch_downloader(job_downloader, iter_job_episodes(job_queue, jobs, clients), config['DownloaderConfig'], max_parallel_downloads)
+
+        for job_id, _ in jobs:
+            if job_id in clients: job_queue.finish_job(job_id)
+
+        for job_id, details in job_queue.summary().items():
+            logger.info(f'Job {job_id}: {details}')
+    finally:
+        for job_client in clients.values(): job_client.cleanup()
+        job_queue.close()
+
+def iter_watchlist_episodes(watchlist, series_list, syncs):
+    '''
+    Fetch the episodes of the followed series released after their last sync, skipping the ones already downloaded.
+    Yields each new episode (with its series & download config) as soon as its download link is found.
+    syncs is filled with the new episodes of every series, to advance its last episode once they are downloaded.
+    '''
+    from Utils.LibraryIndex import get_episode_key
+
+    for series in series_list:
+        spec, target, last_episode = series['spec'], series['target'], series['lastEpisode']
+        logger.info(f'Syncing watchlist series {series["id"]}: {spec} (last episode: {last_episode})')
+        colprint('header', f"\nWatchlist: {spec['series_name']}", end=' ')
+        try:
+            client_type = get_job_client_type(spec)
+            watch_client = get_warm_client(client_type)
+            watch_dl_config = get_download_config(client_type)
+            try:
+                # series is searched only on the first sync
+                target = target or select_job_series(watch_client, spec)
+                episodes = watch_client.fetch_new_episodes(target, last_episode)
+            except Exception as e:
+                if series['target'] is None: raise
+                # ids of the series on the site may change over time, so search the series again
+                logger.warning(f'Failed to fetch new episodes of [{spec["series_name"]}] with error: {e}. Searching the series again')
+                target = select_job_series(watch_client, spec)
+                episodes = watch_client.fetch_new_episodes(target, last_episode)
+            watchlist.set_target(series['id'], target)
+
+            if last_episode is None and spec.get('episodes') and episodes:
+                # episodes range applies only to the first sync
+                ep_range = get_ep_range(f"{episodes[0]['episode']}-{episodes[-1]['episode']}", 'Enter', str(spec['episodes']))
+                episodes = [ episode for episode in episodes if ep_range['start'] <= float(episode['episode']) <= ep_range['end']
+                             or float(episode['episode']) in ep_range['specific_no'] ]
+
+            series_title, episode_prefix = watch_client.set_out_names(target)
+            watch_dl_config['download_dir'] = os.path.join(f"{watch_dl_config['download_dir']}", f"{series_title}")
+            resolution = str(spec.get('resolution', '720'))
+            colprint('results', f'{len(episodes)} new episode(s)')
+            pending_episodes = skip_downloaded_episodes(watch_client, target, episodes, watch_dl_config, resolution)
+
+        except Exception as e:
+            logger.error(f'Sync of [{spec["series_name"]}] failed with error: {e}')
+            watchlist.set_error(series['id'], str(e))
+            continue
+
+        pending_keys = { get_episode_key(episode['episode']) for episode in pending_episodes }
+        syncs[series['id']] = {'client': watch_client, 'target': target, 'lastEpisode': last_episode,
+                               'episodes': [ get_episode_key(episode['episode']) for episode in episodes ],
+                               'completed': { get_episode_key(episode['episode']) for episode in episodes } - pending_keys}
+
+        all_episodes = {'start': float('-inf'), 'end': float('inf'), 'specific_no': []}
+        for episode, links in watch_client.iter_episode_links(pending_episodes, all_episodes):
+            ep_details = next(watch_client.iter_download_links([(episode, links)], resolution, episode_prefix))
+            yield {'watchId': series['id'], 'episode': get_episode_key(episode['episode']), 'epDetails': ep_details, 'dlConfig': watch_dl_config}
+
+def watchlist_downloader(watch_episode, dl_config, post_process_queue=None):
+    '''
+    Download the new episode of a followed series (with the download config of the series) and record it, if completed
+    '''
+    from concurrent.futures import Future
+
+    completed = watchlist_syncs[watch_episode['watchId']]['completed']
+    def _record_status(status):
+        if is_download_completed(status): completed.add(watch_episode['episode'])
+
+    status = downloader(watch_episode['epDetails'], watch_episode['dlConfig'], post_process_queue)
+    if isinstance(status, Future):
+        status.add_done_callback(lambda future: _record_status(future.result()))
+    else:
+        _record_status(status)
+
+    return status
+
+def run_watchlist(watchlist_file):
+    '''
+    Watchlist mode (non-interactive, e.g. for cron): download the episodes of the followed series released since
+    the last run. Sync state of the series is kept in a .db file next to the watchlist file.
+    '''
+    global watchlist_syncs
+    from Utils.Watchlist import Watchlist
+
+    watchlist = Watchlist(os.path.splitext(watchlist_file)[0] + '.db')
+    watchlist_syncs = {}
+    try:
+        watchlist_spec = load_yaml(watchlist_file)
+        watchlist_spec = watchlist_spec.get('watchlist', []) if isinstance(watchlist_spec, dict) else (watchlist_spec or [])
+        for spec in watchlist_spec:
+            if not spec.get('series_name') or not spec.get('series_type'):
+                logger.error(f'Skipping invalid watchlist entry (series_type & series_name are required): {spec}')
+                continue
+            watchlist.add_series(spec)
+
+        series_list = watchlist.get_series()
+        logger.info(f'Syncing {len(series_list)} series from [{watchlist.db_file}]')
+        colprint('header', f'\nSyncing {len(series_list)} series of the watchlist...')
+        batch_downloader(watchlist_downloader, iter_watchlist_episodes(watchlist, series_list, watchlist_syncs), config['DownloaderConfig'], max_parallel_downloads)
+
+        for watch_id, sync in watchlist_syncs.items():
+            # last episode moves only over the episodes downloaded, so a failed episode is fetched again in the next run
+            last_episode = sync['lastEpisode']
+            for episode in sorted(sync['episodes'], key=float):
+                if episode not in sync['completed']: break
+                last_episode = episode
+            up_to_date = sync['completed'].issuperset(sync['episodes'])
+            state = 'finished' if up_to_date and not sync['client'].is_airing(sync['target']) else 'watching'
+            watchlist.set_synced(watch_id, last_episode, state, None if up_to_date else 'Some of the new episodes are not downloaded')
+
+        for watch_id, details in watchlist.summary().items():
+            logger.info(f'Watchlist series {watch_id}: {details}')
+    finally:
+        for sync in watchlist_syncs.values(): sync['client'].cleanup()
+        watchlist.close()
+
+def serve(address, jobs_file=None):
+    '''
+    Daemon mode: serve a local HTTP/JSON API to search, resolve and queue downloads, with the clients kept warm.
+    Queued jobs are downloaded in background by a single download pipeline (see README for the endpoints).
+    Jobs of the jobs file (if any) are queued at start, and its .db file is used as the job queue.
+    '''
+    global job_queue
+    from Utils.ApiServer import ApiServer, ApiError
+    from Utils.JobQueue import JobQueue
+
+    if jobs_file:
+        jobs_db = os.path.splitext(jobs_file)[0] + '.db'
+    else:
+        # state of the daemon is kept in the download dir, independent of the dir it is started from
+        state_dir = get_os_safe_path(config['DownloaderConfig']['download_dir'])
+        check_if_exists(state_dir)
+        jobs_db = os.path.join(state_dir, '.scraper_jobs.db')
+    job_queue = JobQueue(jobs_db)
+    job_queue.recover()
+    if jobs_file: add_jobs_from_file(job_queue, jobs_file)
+    new_jobs = threading.Event()
+    new_jobs.set()      # run the jobs left by an earlier run
+
+    def _get_job(params):
+        job = { k: params[k] for k in ('series_type', 'series_name', 'episodes', 'resolution', 'pick') if params.get(k) is not None }
+        if not job.get('series_name'):
+            raise ApiError('series_name is required')
+        get_job_client_type(job)    # validate series type
+        return job
+
+    def _search(params):
+        if not params.get('q'):
+            raise ApiError('q (search keyword) is required')
+        return get_warm_client(get_job_client_type(params)).search(params['q']) or {}
+
+    def _resolve(params):
+        job = _get_job(params)
+        def _iter_links():
+            prepared = prepare_job(job)
+            job_client = prepared['client']
+            ep_links = job_client.iter_episode_links(prepared['episodes'], prepared['selectedEps'])
+            for ep_details in job_client.iter_download_links(ep_links, prepared['resolution'], prepared['episodePrefix']):
+                yield { k: v for k, v in ep_details.items() if k != 'resolver' }
+        return _iter_links()
+
+    def _add_job(params):
+        job_id = job_queue.add_job(_get_job(params))
+        # a job added again (e.g., for new episodes of an ongoing series) runs again
+        job_queue.set_job_state(job_id, 'pending')
+        new_jobs.set()
+        return {'jobId': job_id}
+
+    def _progress(params):
+        '''
+        Stream the states of the jobs (job_ids, else the jobs active now) whenever they change, till all of them are
+        completed/failed. The states are repeated every heartbeat secs, so a closed connection is noticed
+        '''
+        interval = float(params.get('interval', 1))
+        heartbeat = float(params.get('heartbeat', 15))
+        job_ids = params.get('job_ids')
+        if job_ids:
+            job_ids = { int(job_id) for job_id in (job_ids.split(',') if isinstance(job_ids, str) else job_ids) }
+            unknown = job_ids - set(job_queue.summary())
+            if unknown:
+                raise ApiError(f'Unknown job ids: {sorted(unknown)}', status=404)
+        else:
+            job_ids = { job_id for job_id, _ in job_queue.get_jobs(('pending', 'running')) }
+
+        def _iter_progress():
+            last, last_sent = None, 0
+            while True:
+                summary = { job_id: details for job_id, details in job_queue.summary().items() if job_id in job_ids }
+                if summary != last or monotonic() - last_sent >= heartbeat:
+                    yield {'time': get_current_time(), 'jobs': summary}
+                    last, last_sent = summary, monotonic()
+                if all(details['state'] not in ('pending', 'running') for details in summary.values()):
+                    return
+                sleep(interval)
+        return _iter_progress()
+
+    routes = {
+        ('GET', '/status'): lambda params: {'clients': list(warm_clients), 'jobs': job_queue.summary()},
+        ('GET', '/search'): _search,
+        ('POST', '/resolve'): _resolve,
+        ('GET', '/jobs'): lambda params: job_queue.summary(),
+        ('POST', '/jobs'): _add_job,
+        ('GET', '/progress'): _progress,
+    }
+    host, _, port = address.rpartition(':')
+    server = ApiServer(host or '127.0.0.1', int(port), routes)
+    server.start()
+    colprint('header', f'\nAPI server listening on {server.address}. Press Ctrl+C to stop.')
+
+    try:
+        # download worker: runs the pending jobs, and sleeps till new jobs are added
+        while True:
+            new_jobs.wait()
+            new_jobs.clear()
+            if not job_queue.get_jobs(('pending',)):
+                continue
+            clients = {}
+            batch_downloader(job_downloader, iter_job_episodes(job_queue, iter_pending_jobs(job_queue), clients), config['DownloaderConfig'], max_parallel_downloads)
+            for job_id in clients: job_queue.finish_job(job_id)
+    finally:
+        server.shutdown()
+        job_queue.close()
+
+def run_session():
+    '''
+    One download session: series type -> search -> episodes -> resolution -> download.
+    Predefined inputs from cli (if any) are used for the choices.
+    '''
+    global series_type, client, episodes
+
+    # get series type
+    series_type = get_series_type(ACTIVE_CLIENTS, series_type_predef)
+    logger.info(f'Selected Series type: {series_type}')
+
+    # create client (cloned from the client of the previous sessions of the same type, if any)
+    client = get_warm_client(series_type)
+    logger.info(f'Client: {client}')
+
+    # set client specific download configurations
+    downloader_config = get_download_config(series_type)
+
+    # search in an infinite loop till you get your series
+    target_series = search_and_select_series(series_name_predef)
+    logger.info(f'Selected series: {target_series}')
+
+    # fetch episode links
+    logger.info(f'Fetching episodes list')
+    colprint('header', f'\nAvailable Episodes Details:', end=' ')
+    episodes = client.fetch_episodes_list(target_series)
+    colprint('results', f'{len(episodes)} episodes found.')
+
+    if len(episodes) == 0:
+        logger.error('No episodes found in selected series!')
+        raise ExitException(1)
+
+    logger.info(f'Displaying episodes list')
+    client.show_episode_results(episodes, seasons_predef, episodes_predef)
+
+    # get user input for episodes range and parse start and end number
+    if episodes[0].get('type') == 'tv':
+        selected_eps = get_ep_range_multiple(client.get_season_ep_ranges(episodes))
+    else:
+        selected_eps = get_ep_range(f"{episodes[0]['episode']}-{episodes[-1]['episode']}", 'Enter', episodes_predef)
+
+    # set output names & make it windows safe
+    logger.debug(f'Set output names based on {target_series}')
+    series_title, episode_prefix = client.set_out_names(target_series)
+    logger.debug(f'{series_title = }, {episode_prefix = }')
+
+    # set target output dir
+    downloader_config['download_dir'] = os.path.join(f"{downloader_config['download_dir']}", f"{series_title}")
+    logger.debug(f"Final download dir: {downloader_config['download_dir']}")
+
+    # episodes already downloaded are not resolved again
+    pending_episodes = skip_downloaded_episodes(client, target_series, episodes, downloader_config, resolution_predef)
+    if len(pending_episodes) == 0:
+        logger.info('All the episodes are already downloaded!')
+        colprint('results', '\nAll the episodes are already downloaded!')
+        raise ExitException(1)
+
+    # with a size/time budget, all the episodes are resolved first, to plan their resolutions together
+    budget_set = size_budget_predef or deadline_predef or any((downloader_config.get('resolution_budget') or {}).get(key) for key in ('max_size_gb', 'deadline'))
+    if start_download_predef and episodes_predef and budget_set:
+        msg = 'Resolution budget is set, so all the episodes are resolved before downloading (to plan them together), instead of downloading each one as soon as it is resolved'
+        logger.info(msg); colprint('results', msg)
+    if start_download_predef and episodes_predef and not budget_set:
+        # non-interactive mode: each episode is queued for download as soon as its link is resolved,
+        # instead of waiting for all the episodes to be resolved
+        logger.info(f'Fetching & downloading episodes based on {selected_eps = }')
+        colprint('header', "\nFetching Episodes & Available Resolutions:")
+        ep_links_iter = client.iter_episode_links(pending_episodes, selected_eps)
+        first_ep_links = next(ep_links_iter, None)
+        if first_ep_links is None:
+            logger.error("No episodes are available for download!")
+            raise ExitException(1)
+
+        resolution = select_resolution([first_ep_links[1]], resolution_predef)
+        logger.info(f'Selected download resolution: {resolution}')
+
+        colprint('header', '\nFetching Episode links:')
+        target_dl_links = client.iter_download_links(chain([first_ep_links], ep_links_iter), resolution, episode_prefix)
+
+    else:
+        # filter required episode links and print
+        logger.info(f'Fetching episodes based on {selected_eps = }')
+        colprint('header', "\nFetching Episodes & Available Resolutions:")
+        target_ep_links = client.fetch_episode_links(pending_episodes, selected_eps)
+        logger.debug(f'Fetched episodes: {target_ep_links}')
+
+        if len(target_ep_links) == 0:
+            logger.error("No episodes are available for download!")
+            raise ExitException(1)
+
+        # get valid resolution from user
+        resolution = select_resolution(target_ep_links.values(), resolution_predef)
+        logger.info(f'Selected download resolution: {resolution}')
+
+        # resolution of every episode within the size/time budget (if any), episodes not in the budget are dropped
+        resolution_plan = plan_resolutions(client, target_ep_links, resolution, downloader_config) or {}
+        target_ep_links = { ep: links for ep, links in target_ep_links.items() if resolution_plan.get(ep, True) }
+
+        # get m3u8 link for the specified resolution
+        logger.info('Fetching m3u8 links for selected episodes')
+        colprint('header', '\nFetching Episode links:')
+        target_dl_links = client.fetch_m3u8_links(target_ep_links, resolution, episode_prefix, resolution_plan)
+
+        if len(target_dl_links) == 0:
+            logger.error('No episodes available to download! Exiting.')
+            raise ExitException(1)
+
+        # let the downloader resolve the links again, if they expire before/while downloading
+        episodes_by_key = { episode.get('episode'): episode for episode in episodes }
+        for ep, ep_details in target_dl_links.items():
+            if ep in episodes_by_key: client.add_resolver(ep_details, episodes_by_key[ep], resolution_plan.get(ep) or resolution, episode_prefix)
+
+        # check that the episodes fit on the disk before starting
+        target_dl_links = check_disk_space(target_dl_links, downloader_config)
+        available_dl_count = len([ k for k, v in target_dl_links.items() if v.get('downloadLink') is not None ])
+        logger.debug(f'{target_dl_links = }, {available_dl_count = }')
+
+        msg = f'Episodes available for download [{available_dl_count}/{len(target_dl_links)}].'
+        colprint('header', f'\n{msg}', end=' ')
+        if available_dl_count == 0:
+            logger.error('\nNo episodes available to download! Exiting.')
+            raise ExitException(1)
+        elif start_download_predef:
+            colprint('predefined', f'Using Predefined Input for start download: {start_download_predef}')
+            proceed = 'y'
+        else:
+            proceed = colprint('user_input', f"Proceed to download (y|n)? ", input_type='recurring', input_options=['y', 'n', 'Y', 'N', 'e']).lower() or 'y'
+
+        logger.info(f'{msg} Proceed to download? {proceed}')
+
+        if proceed == 'y':
+            pass
+        elif proceed == 'e':
+            # option for user to edit his choices
+            new_selected_eps = get_ep_range(f"{selected_eps['start']}-{selected_eps['end']}", 'Edit')
+            new_ep_start, new_ep_end = new_selected_eps['start'], new_selected_eps['end']
+            # filter target download links based on new range
+            target_dl_links = { k:v for k,v in target_dl_links.items() if (k >= new_ep_start and k <= new_ep_end) or k in new_selected_eps['specific_no'] }
+            logger.debug(f'Edited {target_dl_links = }')
+            colprint('yellow', f'Proceeding to download as per edited range [{new_ep_start} - {new_ep_end}]...')
+        else:
+            logger.error("Download halted on user input")
+            raise ExitException(1)
+
+    # start downloading...
+    msg = f"Downloading episode(s) to {downloader_config['download_dir']}..."
+    logger.info(msg); colprint('header', f"\n{msg}")
+    # invoke downloader using a threadpool
+    logger.info(f'Invoking batch downloader with {max_parallel_downloads = }')
+    batch_downloader(downloader, target_dl_links, downloader_config, max_parallel_downloads)
+
 def close_handlers():
     '''
     Close handlers properly to ensure rotation works without issues
@@ -290,7 +1068,6 @@ if __name__ == '__main__':
     try:
         # Initialize required variables
         client = None
-        skip_restart = False
 
         # parse cli arguments
         parser = argparse.ArgumentParser(description='Media scraper and downloader for anime, drama, movies and TV shows.')
@@ -303,10 +1080,17 @@ if __name__ == '__main__':
         parser.add_argument('-e', '--episodes', action='append', help='episodes number to download')
         parser.add_argument('-r', '--resolution', type=str, help='resolution to download the episodes')
         parser.add_argument('-d', '--start-download', action='store_true', help='start download immediately or not')
+        parser.add_argument('--max-size', type=float, metavar='GB', help='size budget for all the selected episodes. Resolution of every episode is selected to fit it (the selected resolution is the highest used)')
+        parser.add_argument('--deadline', metavar='HH:MM|DURATION', help='time budget: resolution of every episode is selected to finish downloading by this time of day (or in this duration, e.g. 3h) at the measured throughput')
         parser.add_argument('-dc', '--disable-colors', default=False, action='store_true', help='disable colored output')
         parser.add_argument('-hsa', '--hls-size-accuracy', default=0, type=int, choices=range(0, 101), metavar='[0-100]',
                          help='accuracy to display the file size of hls files. Use 0 to disable. Please enable only if required as it is slow')
         parser.add_argument('-dl', '--disable-looping', default=False, action='store_true', help='disable auto-restart')
+        parser.add_argument('-j', '--jobs', help='yaml file with download jobs to run headless (queue & state are kept in a .db file next to it)')
+        parser.add_argument('-w', '--watchlist', help='yaml file with the series to follow. Downloads the episodes released since the last run (non-interactive)')
+        parser.add_argument('--serve', nargs='?', const='127.0.0.1:8765', metavar='HOST:PORT',
+                         help='run as a daemon serving a local HTTP/JSON API (default: 127.0.0.1:8765)')
+        parser.add_argument('--rebuild-library', action='store_true', help='rebuild the index of downloaded episodes by scanning the download dirs')
 
         args = parser.parse_args()
         config_file = args.conf
@@ -322,6 +1106,8 @@ if __name__ == '__main__':
         resolution_predef = args.resolution
         # convert bool to y/n
         start_download_predef = 'y' if args.start_download else None
+        size_budget_predef = args.max_size
+        deadline_predef = args.deadline
         disable_colors = args.disable_colors
         hls_size_accuracy = args.hls_size_accuracy
         disable_looping = args.disable_looping
@@ -351,165 +1137,77 @@ if __name__ == '__main__':
         # remove older log files
         delete_old_logs(config['LoggerConfig']['log_dir'], config['LoggerConfig'].get('log_retention_days', 7), config['LoggerConfig'].get('log_backup_count', 3))
 
-        # get series type
-        series_type = get_series_type(ACTIVE_CLIENTS, series_type_predef)
-        logger.info(f'Selected Series type: {series_type}')
-
-        # create client
-        client = get_client()
-        logger.info(f'Client: {client}')
-
-        # set client specific download configurations
-        if series_type == 'Movies & Shows':  # KissKh client
-            downloader_config['use_http_client'] = True
-
-        # set respective download dir if present
-        if 'download_dir' in config[series_type]:
-            logger.debug(f'Setting download dir to [{config[series_type]["download_dir"]}] from series specific configuration')
-            downloader_config['download_dir'] = config[series_type]['download_dir']
-
-        # modify path based on the platform OS
-        downloader_config['download_dir'] = get_os_safe_path(downloader_config['download_dir'])
-        # check if download path exists
-        check_if_exists(downloader_config['download_dir'])
-
-        # search in an infinite loop till you get your series
-        target_series = search_and_select_series(series_name_predef)
-        logger.info(f'Selected series: {target_series}')
-
-        # fetch episode links
-        logger.info(f'Fetching episodes list')
-        colprint('header', f'\nAvailable Episodes Details:', end=' ')
-        episodes = client.fetch_episodes_list(target_series)
-        colprint('results', f'{len(episodes)} episodes found.')
-
-        if len(episodes) == 0:
-            logger.error('No episodes found in selected series!')
-            raise ExitException(1)
-
-        logger.info(f'Displaying episodes list')
-        client.show_episode_results(episodes, seasons_predef, episodes_predef)
-
-        # get user input for episodes range and parse start and end number
-        if episodes[0].get('type') == 'tv':
-            selected_eps = get_ep_range_multiple(client.get_season_ep_ranges(episodes))
-        else:
-            selected_eps = get_ep_range(f"{episodes[0]['episode']}-{episodes[-1]['episode']}", 'Enter', episodes_predef)
-
-        # filter required episode links and print
-        logger.info(f'Fetching episodes based on {selected_eps = }')
-        colprint('header', "\nFetching Episodes & Available Resolutions:")
-        target_ep_links = client.fetch_episode_links(episodes, selected_eps)
-        logger.debug(f'Fetched episodes: {target_ep_links}')
+        if args.rebuild_library:
+            rebuild_library()
+            raise ExitException(0)
 
-        if len(target_ep_links) == 0:
-            logger.error("No episodes are available for download!")
-            raise ExitException(1)
+        if args.serve:
+            # daemon mode. Jobs file (if any) is used as the job queue of the daemon
+            serve(args.serve, args.jobs)
+            raise ExitException(0)
 
-        # set output names & make it windows safe
-        logger.debug(f'Set output names based on {target_series}')
-        series_title, episode_prefix = client.set_out_names(target_series)
-        logger.debug(f'{series_title = }, {episode_prefix = }')
-
-        # set target output dir
-        downloader_config['download_dir'] = os.path.join(f"{downloader_config['download_dir']}", f"{series_title}")
-        logger.debug(f"Final download dir: {downloader_config['download_dir']}")
-
-        # get available resolutions
-        valid_resolutions = []
-        valid_resolutions_gen = get_resolutions(target_ep_links.values())
-        for _valid_res in valid_resolutions_gen:
-            valid_resolutions = _valid_res
-            if len(valid_resolutions) > 0:
-                break   # get the resolutions from the first non-empty episode
-        else:
-            # set to default if empty
-            valid_resolutions = ['360','480','720','1080']
+        if args.watchlist:
+            # watchlist sync mode. Exits once the new episodes are downloaded
+            run_watchlist(args.watchlist)
+            raise ExitException(0)
 
-        logger.debug(f'{valid_resolutions = }')
+        if args.jobs:
+            # headless batch mode. Exits once the jobs are done
+            run_jobs(args.jobs)
+            raise ExitException(0)
 
-        # get valid resolution from user
-        if resolution_predef:
-            colprint('predefined', f'\nUsing Predefined Input for resolution: {resolution_predef}')
-            resolution = resolution_predef
-        else:
-            resolution = str(colprint('user_input', f"\nEnter download resolution ({'|'.join(valid_resolutions)}) [default=720]: ", input_type='recurring', input_dtype='int')) or "720"
+        # run download sessions in a loop, in the same process (logger, config & clients are reused)
+        while True:
+            skip_restart = False
+            try:
+                run_session()
 
-        logger.info(f'Selected download resolution: {resolution}')
+            except KeyboardInterrupt:
+                logger.error('User interrupted')
 
-        # get m3u8 link for the specified resolution
-        logger.info('Fetching m3u8 links for selected episodes')
-        colprint('header', '\nFetching Episode links:')
-        target_dl_links = client.fetch_m3u8_links(target_ep_links, resolution, episode_prefix)
-        available_dl_count = len([ k for k, v in target_dl_links.items() if v.get('downloadLink') is not None ])
-        logger.debug(f'{target_dl_links = }, {available_dl_count = }')
+            except ExitException as ee:
+                # skip restart only if exit code is 0
+                if int(str(ee)) == 0: skip_restart = True
 
-        if len(target_dl_links) == 0:
-            logger.error('No episodes available to download! Exiting.')
-            raise ExitException(1)
+            except Exception as e:
+                logger.error(f'Error occurred: {e}. Check log for more details.')
+                logger.warning(f'Stacktrace: {traceback.format_exc()}')
 
-        msg = f'Episodes available for download [{available_dl_count}/{len(target_dl_links)}].'
-        colprint('header', f'\n{msg}', end=' ')
-        if available_dl_count == 0:
-            logger.error('\nNo episodes available to download! Exiting.')
-            raise ExitException(1)
-        elif start_download_predef:
-            colprint('predefined', f'Using Predefined Input for start download: {start_download_predef}')
-            proceed = 'y'
-        else:
-            proceed = colprint('user_input', f"Proceed to download (y|n)? ", input_type='recurring', input_options=['y', 'n', 'Y', 'N', 'e']).lower() or 'y'
+            finally:
+                # Perform any cleanup tasks
+                if client: client.cleanup()
+                client = None
 
-        logger.info(f'{msg} Proceed to download? {proceed}')
+            # Start a new session
+            if skip_restart or disable_looping: break
+            try:
+                continuation_prompt = colprint('user_input', '\nReady for one more? Start new download (y|n)? ', input_type='recurring', input_options=['y', 'n', 'Y', 'N']).lower() or 'y'
+            except KeyboardInterrupt:
+                break
 
-        if proceed == 'y':
-            pass
-        elif proceed == 'e':
-            # option for user to edit his choices
-            new_selected_eps = get_ep_range(f"{selected_eps['start']}-{selected_eps['end']}", 'Edit')
-            new_ep_start, new_ep_end = new_selected_eps['start'], new_selected_eps['end']
-            # filter target download links based on new range
-            target_dl_links = { k:v for k,v in target_dl_links.items() if (k >= new_ep_start and k <= new_ep_end) or k in new_selected_eps['specific_no'] }
-            logger.debug(f'Edited {target_dl_links = }')
-            colprint('yellow', f'Proceeding to download as per edited range [{new_ep_start} - {new_ep_end}]...')
-        else:
-            logger.error("Download halted on user input")
-            raise ExitException(1)
+            if continuation_prompt != 'y':
+                colprint('results', "Download completed. Thanks for using the scraper!\n")
+                break
 
-        # start downloading...
-        msg = f"Downloading episode(s) to {downloader_config['download_dir']}..."
-        logger.info(msg); colprint('header', f"\n{msg}")
-        # invoke downloader using a threadpool
-        logger.info(f'Invoking batch downloader with {max_parallel_downloads = }')
-        batch_downloader(downloader, target_dl_links, downloader_config, max_parallel_downloads)
+            # predefined inputs apply only to the first session
+            series_type_predef = series_name_predef = seasons_predef = episodes_predef = resolution_predef = start_download_predef = None
+            size_budget_predef = deadline_predef = None
+            logger.info('-------------------------------- NEW SCRAPER SESSION --------------------------------')
 
     except SystemExit as se:
         # propagate the exit from argparse after printing help or on parse error
-        skip_restart = True
+        pass
 
-    except KeyboardInterrupt as ki:
+    except KeyboardInterrupt:
         logger.error('User interrupted')
 
-    except ExitException as ee:
-        # skip restart only if exit code is 0
-        if int(str(ee)) == 0: skip_restart = True
+    except ExitException:
+        pass
 
     except Exception as e:
         logger.error(f'Error occurred: {e}. Check log for more details.')
         logger.warning(f'Stacktrace: {traceback.format_exc()}')
 
     finally:
-        # Perform any cleanup tasks
-        if client: client.cleanup()
         # Ensure to close handlers at the end of the script or before rotating
         close_handlers()
-        # Auto-start a new instance
-        if skip_restart or disable_looping: exit(0)
-        try:
-            continuation_prompt = colprint('user_input', '\nReady for one more? Start new download (y|n)? ', input_type='recurring', input_options=['y', 'n', 'Y', 'N']).lower() or 'y'
-            if continuation_prompt == 'y':
-                os.system(f'{sys.executable} {sys.argv[0]} -c {config_file} -l {log_file_name}')
-            else:
-                colprint('results', "Download completed. Thanks for using the scraper!\n")
-
-        except KeyboardInterrupt:
-            exit(0)
@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+# modules are imported from the repo root, same as scraper.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def make_downloader(tmp_path):
+    '''
+    Create a downloader of the given class for an episode, downloading to tmp_path
+    '''
+    def _make(cls=None, dl_config=None, **ep_details):
+        from Utils.BaseDownloader import BaseDownloader
+        cls = cls or BaseDownloader
+        config = {'download_dir': str(tmp_path), 'concurrency_per_file': 4, 'disk_space_check': 'off', **(dl_config or {})}
+        details = {'episodeName': 'Series Episode 1 - 720P.mp4', 'downloadLink': 'https://cdn.example.com/video.mp4', **ep_details}
+        downloader = cls(config, details)
+        downloader._create_out_dirs()
+        return downloader
+
+    return _make
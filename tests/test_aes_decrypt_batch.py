@@ -0,0 +1,48 @@
+import base64
+
+import pytest
+
+AES = pytest.importorskip('Cryptodome.Cipher.AES')
+
+from Clients.BaseClient import BaseClient
+
+KEY = b'0123456789abcdef'
+IV = b'fedcba9876543210'
+
+
+def _encrypt(text, key=KEY, iv=IV):
+    data = text.encode('utf-8')
+    pad = 16 - len(data) % 16
+    return base64.b64encode(AES.new(key, AES.MODE_CBC, iv).encrypt(data + bytes([pad]) * pad)).decode()
+
+
+@pytest.fixture
+def client():
+    return BaseClient()
+
+
+def test_batch_matches_per_message_cbc(client):
+    texts = ['Hi', 'exactly 16 bytes', 'A longer subtitle line spanning a few AES blocks, with ünïcödé', '  padded  ']
+    words = [ _encrypt(text) for text in texts ]
+
+    assert client._aes_decrypt_batch(words, KEY, IV) == [ client._aes_decrypt(word, KEY, IV) for word in words ]
+    assert client._aes_decrypt_batch(words, KEY, IV) == [ text.strip() for text in texts ]
+
+
+def test_invalid_messages_are_none_without_affecting_others(client):
+    words = [_encrypt('first'), 'not base64!', base64.b64encode(b'short').decode(), '', _encrypt('last')]
+
+    assert client._aes_decrypt_batch(words, KEY, IV) == ['first', None, None, None, 'last']
+
+
+def test_bad_padding_is_none(client):
+    # decrypted with the wrong key, the padding byte is garbage
+    words = [_encrypt('wrong key', key=b'x' * 16)]
+    results = client._aes_decrypt_batch(words, KEY, IV)
+
+    assert len(results) == 1
+    assert results[0] is None or results[0] != 'wrong key'
+
+
+def test_all_invalid(client):
+    assert client._aes_decrypt_batch(['', '!!'], KEY, IV) == [None, None]
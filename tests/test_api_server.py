@@ -0,0 +1,63 @@
+import http.client
+import json
+import threading
+from time import sleep
+
+import pytest
+
+from Utils.ApiServer import ApiError, ApiServer
+
+
+@pytest.fixture
+def start_server():
+    servers = []
+    def _start(routes):
+        server = ApiServer('127.0.0.1', 0, routes)
+        server.start()
+        servers.append(server)
+        return http.client.HTTPConnection('127.0.0.1', server.httpd.server_address[1], timeout=5)
+    yield _start
+    for server in servers:
+        server.shutdown()
+
+
+def test_stream_ends_with_the_generator(start_server):
+    conn = start_server({('GET', '/progress'): lambda params: ( {'n': i} for i in range(int(params['count'])) )})
+    conn.request('GET', '/progress?count=3')
+    response = conn.getresponse()
+
+    assert response.status == 200
+    assert [ json.loads(line) for line in response.read().splitlines() ] == [{'n': 0}, {'n': 1}, {'n': 2}]
+
+
+def test_stream_is_closed_when_client_disconnects(start_server):
+    closed = threading.Event()
+    def _forever(params):
+        try:
+            while True:
+                yield {'tick': True}
+                sleep(0.01)
+        finally:
+            closed.set()
+
+    conn = start_server({('GET', '/progress'): _forever})
+    conn.request('GET', '/progress')
+    response = conn.getresponse()
+    assert json.loads(response.readline()) == {'tick': True}
+    response.close()
+    conn.close()
+
+    assert closed.wait(5)
+
+
+def test_errors(start_server):
+    def _fail(params):
+        raise ApiError('Unknown job ids: [9]', status=404)
+    conn = start_server({('GET', '/progress'): _fail})
+
+    conn.request('GET', '/progress')
+    response = conn.getresponse()
+    assert (response.status, json.loads(response.read())) == (404, {'error': 'Unknown job ids: [9]'})
+
+    conn.request('GET', '/unknown')
+    assert conn.getresponse().status == 404
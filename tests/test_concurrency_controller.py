@@ -0,0 +1,78 @@
+from unittest import mock
+
+import pytest
+
+from Utils import ConcurrencyController
+from Utils.ConcurrencyController import AIMDController
+
+
+def _complete_window(controller, failure=None):
+    for _ in range(controller.get_limit()):
+        if failure: controller.on_failure(failure)
+        else: controller.on_success(1)
+
+
+def test_increase_when_healthy_and_cap_at_max():
+    controller = AIMDController('host', initial=4, min_limit=2, max_limit=5)
+    _complete_window(controller)
+    assert controller.get_limit() == 5
+    _complete_window(controller)
+    assert controller.get_limit() == 5
+
+
+def test_decrease_on_throttling_and_errors():
+    controller = AIMDController('host', initial=8, min_limit=2, max_limit=32)
+    _complete_window(controller, 'throttled')
+    assert controller.get_limit() == 4
+    _complete_window(controller, 'server')
+    assert controller.get_limit() == 2
+    _complete_window(controller, 'server')
+    assert controller.get_limit() == 2      # never below min_limit
+
+
+def test_decrease_on_latency_inflation():
+    controller = AIMDController('host', initial=8, min_limit=2, max_limit=32, latency_tolerance=2.0)
+    controller.on_response(0.1)
+    for _ in range(20):
+        controller.on_response(1.0)     # host is queueing the requests
+    _complete_window(controller)
+    assert controller.get_limit() == 4
+
+
+def test_acquire_respects_limit():
+    controller = AIMDController('host', initial=2, min_limit=2, max_limit=4)
+    assert controller.try_acquire() and controller.try_acquire()
+    assert not controller.try_acquire()
+    controller.release()
+    assert controller.try_acquire()
+
+
+def test_latency_reported_only_for_segment_requests(make_downloader):
+    downloader = make_downloader(dl_config={'concurrency_per_file': 'auto'})
+    response = mock.Mock(status_code=200, text='#EXTM3U', content=b'data')
+
+    with mock.patch.dict(ConcurrencyController._controllers, clear=True), \
+         mock.patch.object(downloader.req_session, 'get', return_value=response):
+        # playlist, key & subtitle requests are not segment traffic
+        downloader._get_stream_data('https://playlist.example.com/index.m3u8', True)
+        assert 'playlist.example.com' not in ConcurrencyController._controllers
+
+        downloader._open_stream('https://segments.example.com/seg1.ts')
+        assert ConcurrencyController._controllers['segments.example.com'].latency_ewma is not None
+
+        downloader._open_stream('https://keys.example.com/key.key', report_latency=False)
+        assert 'keys.example.com' not in ConcurrencyController._controllers
+
+
+def test_cancelled_requests_do_not_reduce_the_limit(make_downloader):
+    from Utils.commons import DownloadCancelled
+    no_retries = { kind: {'retries': 0, 'base_delay': 0, 'max_delay': 0} for kind in ('timeout', 'network', 'throttled', 'server', 'client', 'other') }
+    downloader = make_downloader(dl_config={'concurrency_per_file': 'auto', 'retry_policies': no_retries})
+    def _download(url):
+        raise DownloadCancelled(f'[{url}] already downloaded by another request')
+
+    with mock.patch.dict(ConcurrencyController._controllers, clear=True):
+        with pytest.raises(Exception, match='Failed to download 2 / 2 segments'):
+            downloader._multi_threaded_download(_download, ['https://cdn.example.com/seg1.ts', 'https://cdn.example.com/seg2.ts'], type='segments', total=2)
+        controller = ConcurrencyController._controllers['cdn.example.com']
+        assert controller.window_errors == controller.window_throttled == controller.window_completed == 0
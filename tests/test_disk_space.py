@@ -0,0 +1,104 @@
+import errno
+from collections import namedtuple
+
+import pytest
+
+from Utils.DiskSpace import DiskSpace
+
+MB = 1024 * 1024
+Usage = namedtuple('Usage', 'total used free')
+
+
+@pytest.fixture
+def disk(monkeypatch):
+    '''
+    DiskSpace over fake filesystems: paths starting with /out and /temp are on separate devices unless same_fs
+    '''
+    free = {'/out': 1000 * MB, '/temp': 1000 * MB}
+
+    def _make(min_free_mb=0, same_fs=False):
+        disk_space = DiskSpace(min_free_mb)
+        get_root = lambda path: '/out' if same_fs or path.startswith('/out') else '/temp'
+        monkeypatch.setattr(disk_space, '_get_fs', lambda path: (get_root(path), get_root(path)))
+        monkeypatch.setattr('Utils.DiskSpace.shutil.disk_usage', lambda path: Usage(0, 0, free[path]))
+        return disk_space
+
+    return _make
+
+
+def test_finals_add_up_and_temps_of_parallel_downloads(disk):
+    disk_space = disk()
+    downloads = [ (ep, 300 * MB, '/out/series', '/temp/series') for ep in (1, 2, 3, 4) ]
+
+    fit, skipped, report = disk_space.plan(downloads, max_parallel=2)
+
+    # finals: 3 x 300 MB fit in 1000 MB, temps: only 2 x 300 MB exist at once
+    assert (fit, skipped) == ([1, 2, 3], [4])
+    assert report == {'/out': {'free': 1000 * MB, 'needed': 900 * MB}, '/temp': {'free': 1000 * MB, 'needed': 600 * MB}}
+
+
+def test_same_filesystem_counts_final_and_temp(disk):
+    disk_space = disk(same_fs=True)
+    downloads = [(1, 300 * MB, '/out/series', '/out/temp'), (2, 300 * MB, '/out/series', '/out/temp')]
+
+    fit, skipped, report = disk_space.plan(downloads, max_parallel=1)
+
+    # 600 MB of finals + the largest temp (300 MB)
+    assert (fit, skipped) == ([1, 2], [])
+    assert report['/out']['needed'] == 900 * MB
+
+
+def test_skipped_download_leaves_room_for_smaller_ones(disk):
+    disk_space = disk()
+    downloads = [(1, 600 * MB, '/out', '/temp'), (2, 600 * MB, '/out', '/temp'), (3, 300 * MB, '/out', '/temp'), (4, None, '/out', '/temp')]
+
+    fit, skipped, _ = disk_space.plan(downloads)
+
+    # unknown sizes are not counted
+    assert (fit, skipped) == ([1, 3, 4], [2])
+
+
+def test_min_free_and_reservations_reduce_free_space(disk):
+    disk_space = disk(min_free_mb=200)
+    disk_space.reserve('running', 500 * MB, '/out', '/temp')
+
+    fit, skipped, report = disk_space.plan([(1, 200 * MB, '/out', '/temp'), (2, 200 * MB, '/out', '/temp')])
+
+    assert (fit, skipped) == ([1], [2])
+    assert report['/out']['free'] == 500 * MB
+
+    disk_space.release('running')
+    assert disk_space.plan([(1, 200 * MB, '/out', '/temp'), (2, 200 * MB, '/out', '/temp')])[1] == []
+
+
+def test_reserve_fails_when_it_does_not_fit(disk):
+    disk_space = disk()
+    disk_space.reserve(1, 600 * MB, '/out', '/temp')
+
+    with pytest.raises(OSError) as e:
+        disk_space.reserve(2, 600 * MB, '/out', '/temp')
+    assert e.value.errno == errno.ENOSPC
+
+    # a download reserving again does not count against itself
+    disk_space.reserve(1, 900 * MB, '/out', '/temp')
+
+
+def test_written_bytes_are_not_reserved_again(disk, tmp_path):
+    disk_space = disk()
+    temp_dir = tmp_path / 'episode'
+    temp_dir.mkdir()
+    (temp_dir / 'segment-1.ts').write_bytes(b'x' * 64 * 1024)
+
+    # resumed download: 64 KB of its 192 KB temp files are already on disk (and off the free space)
+    disk_space.reserve(1, 192 * 1024, '/out', str(tmp_path), [str(temp_dir)])
+    assert disk_space._get_reserved('/temp') == 128 * 1024
+    assert disk_space._get_reserved('/out') == 192 * 1024
+
+    # as the download writes, less of its reservation is held back
+    (temp_dir / 'segment-2.ts').write_bytes(b'x' * 128 * 1024)
+    assert disk_space._get_reserved('/temp') == 0
+
+    # all but the unwritten part of the running download is available
+    disk_space.reserve(2, 1000 * MB - 192 * 1024, '/out', '/temp')
+    with pytest.raises(OSError):
+        disk_space.reserve(3, 1, '/out', '/temp')
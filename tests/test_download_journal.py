@@ -0,0 +1,153 @@
+import json
+import os
+import zlib
+
+from Utils.BaseDownloader import ByteRange
+from Utils.DownloadJournal import DownloadJournal, crc32_file
+
+
+class FakeResponse():
+    '''
+    Response streaming the given body, optionally calling on_chunk after every chunk (to change the range midway)
+    '''
+    def __init__(self, body, status_code=206, chunk_size=4, on_chunk=None):
+        self.body, self.status_code, self.chunk_size, self.on_chunk = body, status_code, chunk_size, on_chunk
+        self.closed = False
+
+    def iter_content(self, block_size):
+        for i in range(0, len(self.body), self.chunk_size):
+            yield self.body[i:i + self.chunk_size]
+            if self.on_chunk: self.on_chunk()
+
+    def close(self):
+        self.closed = True
+
+
+def serve(downloader, data, requests, **kwargs):
+    '''
+    Serve byte ranges of data to the downloader, recording the requested range headers
+    '''
+    def _open_stream(url, header=None):
+        start, end = header['Range'].replace('bytes=', '').split('-')
+        requests.append((int(start), int(end)))
+        return FakeResponse(data[int(start):int(end) + 1], **kwargs), url
+
+    downloader._open_stream = _open_stream
+
+
+def test_journal_round_trip(tmp_path):
+    journal_file = tmp_path / 'download.journal'
+    segment = tmp_path / 'seg1.ts'
+    segment.write_bytes(b'segment-data')
+
+    journal = DownloadJournal(str(journal_file))
+    journal.record('seg1.ts', 12, zlib.crc32(b'segment-data'), start=0)
+
+    reloaded = DownloadJournal(str(journal_file))
+    assert reloaded.get('seg1.ts') == {'name': 'seg1.ts', 'size': 12, 'crc': zlib.crc32(b'segment-data'), 'start': 0}
+    assert reloaded.is_complete('seg1.ts', str(segment))
+
+
+def test_journal_ignores_truncated_last_line(tmp_path):
+    journal_file = tmp_path / 'download.journal'
+    journal = DownloadJournal(str(journal_file))
+    journal.record('seg1.ts', 3, 1)
+    with open(journal_file, 'a') as f:
+        f.write(json.dumps({'name': 'seg2.ts', 'size': 3, 'crc': 2})[:-5])     # killed mid-write
+
+    reloaded = DownloadJournal(str(journal_file))
+    assert set(reloaded.entries) == {'seg1.ts'}
+
+    # entries recorded after the crash are not appended to the truncated line
+    reloaded.record('seg3.ts', 3, 3)
+    assert set(DownloadJournal(str(journal_file)).entries) == {'seg1.ts', 'seg3.ts'}
+
+
+def test_journal_detects_corrupt_file(tmp_path):
+    segment = tmp_path / 'seg1.ts'
+    segment.write_bytes(b'abcdef')
+    journal = DownloadJournal(str(tmp_path / 'download.journal'))
+    journal.record('seg1.ts', 6, crc32_file(str(segment)))
+
+    segment.write_bytes(b'abcxyz')      # same size, different content
+    assert not journal.is_complete('seg1.ts', str(segment))
+    assert journal.is_complete('seg1.ts', str(segment), verify=False)
+
+    segment.write_bytes(b'abc')         # truncated
+    assert not journal.is_complete('seg1.ts', str(segment))
+
+
+def test_crc32_file_prefix(tmp_path):
+    data_file = tmp_path / 'data'
+    data_file.write_bytes(b'0123456789')
+    assert crc32_file(str(data_file), 4, block_size=3) == zlib.crc32(b'0123')
+    assert crc32_file(str(data_file)) == zlib.crc32(b'0123456789')
+
+
+def test_download_chunk_reuses_journaled_chunk(make_downloader):
+    downloader = make_downloader()
+    data, requests = bytes(range(32)), []
+    serve(downloader, data, requests)
+
+    byte_range = ByteRange(downloader.download_link, 0, 15, 'video.chunk0')
+    downloader._download_chunk(byte_range)
+    assert requests == [(0, 15)]
+    chunk_file = os.path.join(downloader.temp_dir, 'video.chunk0')
+    assert open(chunk_file, 'rb').read() == data[:16]
+    assert downloader.journal.get('video.chunk0') == {'name': 'video.chunk0', 'size': 16, 'crc': zlib.crc32(data[:16]), 'start': 0}
+
+    status, _ = downloader._download_chunk(ByteRange(downloader.download_link, 0, 15, 'video.chunk0'))
+    assert 'Reusing' in status
+    assert requests == [(0, 15)]
+
+
+def test_download_chunk_downloads_corrupt_chunk_again(make_downloader):
+    downloader = make_downloader()
+    data, requests = bytes(range(32)), []
+    serve(downloader, data, requests)
+    downloader._download_chunk(ByteRange(downloader.download_link, 16, 31, 'video.chunk16'))
+
+    chunk_file = os.path.join(downloader.temp_dir, 'video.chunk16')
+    with open(chunk_file, 'r+b') as f:
+        f.write(b'\xff')    # corrupt the first byte
+    status, _ = downloader._download_chunk(ByteRange(downloader.download_link, 16, 31, 'video.chunk16'))
+
+    assert 'Reusing' not in status
+    assert requests == [(16, 31), (16, 31)]
+    assert open(chunk_file, 'rb').read() == data[16:]
+
+
+def test_download_chunk_resumes_partial_chunk(make_downloader):
+    downloader = make_downloader()
+    data, requests = bytes(range(32)), []
+    serve(downloader, data, requests)
+    chunk_file = os.path.join(downloader.temp_dir, 'video.chunk8')
+    with open(chunk_file, 'wb') as f:
+        f.write(data[8:13])     # interrupted after 5 bytes, not journaled yet
+
+    status, _ = downloader._download_chunk(ByteRange(downloader.download_link, 8, 23, 'video.chunk8'))
+
+    assert 'resumed from byte 5' in status
+    assert requests == [(13, 23)]
+    assert open(chunk_file, 'rb').read() == data[8:24]
+    # crc of the resumed chunk covers the bytes written before the interruption too
+    assert downloader.journal.is_complete('video.chunk8', chunk_file)
+
+
+def test_download_chunk_stops_at_narrowed_range(make_downloader):
+    downloader = make_downloader()
+    data, requests = bytes(range(32)), []
+    byte_range = ByteRange(downloader.download_link, 0, 31, 'video.chunk0')
+
+    def _split():
+        # the rest of the range is taken over by another connection after the first chunk
+        with byte_range.lock:
+            byte_range.end = min(byte_range.end, 9)
+
+    serve(downloader, data, requests, on_chunk=_split)
+    downloader._download_chunk(byte_range)
+
+    chunk_file = os.path.join(downloader.temp_dir, 'video.chunk0')
+    assert open(chunk_file, 'rb').read() == data[:10]
+    assert downloader.journal.get('video.chunk0')['size'] == 10
+    assert downloader.journal.is_complete('video.chunk0', chunk_file)
@@ -0,0 +1,84 @@
+import errno
+import os
+
+import pytest
+
+from Utils.FileMerger import FileMerger
+
+
+@pytest.fixture
+def parts(tmp_path):
+    files = []
+    for i, size in enumerate([4096, 1000, 8192, 3]):
+        part = tmp_path / f'part{i}'
+        part.write_bytes(os.urandom(size))
+        files.append(str(part))
+    return files
+
+
+def _merged(out_file, parts):
+    return b''.join(open(part, 'rb').read() for part in parts), open(out_file, 'rb').read()
+
+
+def _unsupported(*args):
+    raise OSError(errno.EOPNOTSUPP, 'Operation not supported')
+
+
+@pytest.mark.parametrize('method', ['reflink', 'copy_file_range', 'sendfile', 'buffered'])
+def test_every_method_merges_the_same_bytes(tmp_path, parts, method):
+    out_file = str(tmp_path / 'out')
+    with FileMerger(out_file, block_size=1024) as merger:
+        if method not in merger.methods:
+            pytest.skip(f'{method} is not available on this platform')
+        merger.methods = [method] if method == 'buffered' else [method, 'buffered']
+        for part in parts:
+            merger.append(part)
+
+    expected, merged = _merged(out_file, parts)
+    assert merged == expected
+
+
+def test_unsupported_method_falls_back_and_is_not_tried_again(tmp_path, parts):
+    out_file = str(tmp_path / 'out')
+    calls = []
+    with FileMerger(out_file) as merger:
+        merger.methods = ['copy_file_range', 'buffered']
+        merger._copy_file_range = lambda *args: calls.append(args) or _unsupported()
+        for part in parts:
+            merger.append(part)
+
+    assert len(calls) == 1
+    assert merger.methods == ['buffered']
+    assert merger.used_methods == {'buffered': len(parts)}
+    expected, merged = _merged(out_file, parts)
+    assert merged == expected
+
+
+def test_other_errors_are_raised(tmp_path, parts):
+    def _failing(*args):
+        raise OSError(errno.EIO, 'I/O error')
+
+    with pytest.raises(OSError):
+        with FileMerger(str(tmp_path / 'out')) as merger:
+            merger.methods = ['copy_file_range', 'buffered']
+            merger._copy_file_range = _failing
+            merger.append(parts[0])
+
+
+def test_short_copy_is_an_error(tmp_path, parts):
+    with pytest.raises(OSError, match='Copied'):
+        with FileMerger(str(tmp_path / 'out')) as merger:
+            merger.methods = ['buffered']
+            merger.append(parts[3], length=10)
+
+
+def test_ranges_writes_and_preallocation(tmp_path, parts):
+    out_file = str(tmp_path / 'out')
+    with FileMerger(out_file, preallocate_size=1024 * 1024) as merger:
+        merger.append(parts[0], 100, 50)
+        merger.write(b'decrypted')
+        merger.append(parts[2], 4096)
+
+    data = [ open(part, 'rb').read() for part in parts ]
+    # unused preallocated space is truncated
+    assert open(out_file, 'rb').read() == data[0][100:150] + b'decrypted' + data[2][4096:]
@@ -0,0 +1,65 @@
+import json
+import threading
+
+from Utils.commons import DownloadCancelled
+from Utils.HLSDownloader import HLSDownloader
+
+
+class FakeResponse():
+    '''
+    Response streaming the body in chunks, waiting for the event (if any) before the last chunk
+    '''
+    def __init__(self, body, wait_for=None):
+        self.body, self.wait_for = body, wait_for
+
+    def iter_content(self, block_size):
+        yield self.body[:4]
+        if self.wait_for: self.wait_for()
+        yield self.body[4:]
+
+    def close(self):
+        pass
+
+
+def test_straggler_is_hedged_and_written_once(make_downloader):
+    downloader = make_downloader(cls=HLSDownloader, dl_config={'hedge_requests': {'min_samples': 3, 'min_delay': 0.05}})
+    urls = [ f'https://cdn.example.com/seg{i}.ts' for i in range(1, 7) ]
+    straggler = urls[-1]
+    cancel_events, results = {}, {}
+    lock, loser_done = threading.Lock(), threading.Event()
+
+    def _open_stream(url, report_latency=True):
+        # first request of the straggler stalls till the duplicate request wins and cancels it
+        stalled = url == straggler and len(results[url]) == 1
+        wait_for = (lambda: cancel_events[url].wait(5)) if stalled else None
+        return FakeResponse(f'data of {url}'.encode(), wait_for), url
+    downloader._open_stream = _open_stream
+
+    def _download(url, **kwargs):
+        with lock:
+            cancel_events[url] = kwargs['cancel_event']
+            outcomes = results.setdefault(url, [])
+            outcomes.append(None)
+            attempt = len(outcomes) - 1
+        try:
+            outcomes[attempt] = downloader._download_segment(url, **kwargs)
+        except Exception as e:
+            outcomes[attempt] = e
+            raise
+        finally:
+            if url == straggler and attempt == 0: loser_done.set()
+        return outcomes[attempt]
+
+    downloader._multi_threaded_download(_download, list(urls), type='segments', hedge=True, total=len(urls))
+
+    # duplicate request won, the stalled one was cancelled (the download doesn't wait for it)
+    assert loser_done.wait(5)
+    assert [ type(outcome) for outcome in results[straggler] ] == [DownloadCancelled, tuple]
+    assert all(len(results[url]) == 1 for url in urls[:-1])
+
+    # segment is written and journaled once
+    with open(downloader.journal.journal_file) as f:
+        journaled = [ json.loads(line)['name'] for line in f ]
+    assert journaled.count('seg6.ts') == 1
+    with open(f'{downloader.temp_dir}/seg6.ts', 'rb') as f:
+        assert f.read() == f'data of {straggler}'.encode()
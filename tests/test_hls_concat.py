@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+AES = pytest.importorskip('Cryptodome.Cipher.AES')
+
+from Utils.HLSDownloader import HLSDownloader
+
+KEY = b'k' * 16
+BASE_URL = 'https://cdn.example.com/hls'
+
+
+def _encrypt(data, iv):
+    pad = 16 - len(data) % 16
+    return AES.new(KEY, AES.MODE_CBC, iv).encrypt(data + bytes([pad]) * pad)
+
+
+def _downloader(make_downloader, **dl_config):
+    return make_downloader(cls=HLSDownloader, dl_config={'output_container': 'ts', **dl_config})
+
+
+def _write_segments(downloader, segments):
+    with open(os.path.join(downloader.temp_dir, 'key.key'), 'wb') as f:
+        f.write(KEY)
+    for name, (data, iv) in segments.items():
+        with open(os.path.join(downloader.temp_dir, name), 'wb') as f:
+            f.write(_encrypt(data, iv))
+
+
+def _concat(downloader, m3u8_data):
+    ts_urls = downloader._collect_ts_urls(f'{BASE_URL}/index.m3u8', m3u8_data)
+    downloader._concat_segments(m3u8_data, ts_urls)
+    with open(os.path.join(downloader.out_dir, downloader.ts_out_file), 'rb') as f:
+        return f.read()
+
+
+def test_segments_are_decrypted_with_explicit_iv(make_downloader):
+    downloader = _downloader(make_downloader)
+    iv = bytes.fromhex('000102030405060708090a0b0c0d0e0f')
+    _write_segments(downloader, {'seg0.ts': (b'first segment', iv), 'seg1.ts': (b'second segment', iv)})
+    m3u8_data = (
+        '#EXTM3U\n#EXT-X-MEDIA-SEQUENCE:7\n'
+        f'#EXT-X-KEY:METHOD=AES-128,URI="{BASE_URL}/key.key",IV=0x000102030405060708090a0b0c0d0e0f\n'
+        '#EXTINF:4.0,\nseg0.ts\n#EXTINF:4.0,\nseg1.ts\n#EXT-X-ENDLIST\n'
+    )
+
+    assert _concat(downloader, m3u8_data) == b'first segmentsecond segment'
+
+
+def test_iv_is_media_sequence_of_playlist_position(make_downloader):
+    downloader = _downloader(make_downloader)
+    # seg0.ts is repeated: seg1.ts is the 3rd segment of the playlist (sequence 5 + 2)
+    _write_segments(downloader, {'seg0.ts': (b'zero', (5).to_bytes(16, 'big')), 'seg1.ts': (b'one', (7).to_bytes(16, 'big'))})
+    m3u8_data = (
+        '#EXTM3U\n#EXT-X-MEDIA-SEQUENCE:5\n'
+        f'#EXT-X-KEY:METHOD=AES-128,URI="{BASE_URL}/key.key"\n'
+        '#EXTINF:4.0,\nseg0.ts\n#EXTINF:4.0,\nseg0.ts\n#EXTINF:4.0,\nseg1.ts\n#EXT-X-ENDLIST\n'
+    )
+
+    assert _concat(downloader, m3u8_data) == b'zeroone'
+
+
+def test_out_files_include_both_containers_until_decided(make_downloader):
+    assert [ os.path.splitext(f)[1] for f in _downloader(make_downloader, output_container='auto').get_out_files() ] == ['.ts', '.mp4']
+    assert [ os.path.splitext(f)[1] for f in _downloader(make_downloader, output_container='ts').get_out_files() ] == ['.ts', '.mp4']
+    assert [ os.path.splitext(f)[1] for f in _downloader(make_downloader, output_container='mp4').get_out_files() ] == ['.mp4']
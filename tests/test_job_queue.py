@@ -0,0 +1,51 @@
+from Utils.JobQueue import JobQueue
+
+
+def test_same_spec_is_queued_once(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.db'))
+
+    first = queue.add_job({'series_name': 'Series', 'episodes': '1-2'})
+    assert queue.add_job({'episodes': '1-2', 'series_name': 'Series'}) == first
+    assert queue.add_job({'series_name': 'Other'}) != first
+    assert [ spec['series_name'] for _, spec in queue.get_jobs() ] == ['Series', 'Other']
+    queue.close()
+
+
+def test_interrupted_run_is_recovered(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.db'))
+    job_id = queue.add_job({'series_name': 'Series'})
+    queue.set_job_state(job_id, 'running')
+    queue.set_episode_state(job_id, 1, 'downloading', name='Series Episode 1 - 720P.mp4')
+    queue.set_episode_state(job_id, 1, 'completed')
+    queue.set_episode_state(job_id, 2, 'downloading', name='Series Episode 2 - 720P.mp4')
+    queue.close()       # killed midway
+
+    queue = JobQueue(str(tmp_path / 'jobs.db'))
+    assert queue.recover() == 1
+    assert queue.get_episode_states(job_id) == {'1': 'completed', '2': 'pending'}
+    assert queue.summary()[job_id] == {'series': 'Series', 'state': 'pending', 'completed': 1, 'pending': 1}
+    attempts = queue._execute('SELECT attempts FROM episodes WHERE job_id = ? AND episode = ?', (job_id, '2'))[0]['attempts']
+    assert attempts == 1
+
+    # nothing left to recover
+    assert queue.recover() == 0
+    queue.close()
+
+
+def test_finish_job_from_episode_states(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.db'))
+    done, partial = queue.add_job({'series_name': 'Done'}), queue.add_job({'series_name': 'Partial'})
+    queue.set_episode_state(done, 1, 'completed')
+    queue.set_episode_state(partial, 1, 'completed')
+    queue.set_episode_state(partial, 2, 'failed', error='Download failed')
+
+    queue.finish_job(done)
+    queue.finish_job(partial)
+
+    summary = queue.summary()
+    assert (summary[done]['state'], summary[partial]['state']) == ('completed', 'failed')
+    error = queue._execute('SELECT error FROM jobs WHERE id = ?', (partial,))[0]['error']
+    assert error == '1 episode(s) not completed: 2'
+    # failed jobs are run again, completed ones are not
+    assert [ job_id for job_id, _ in queue.get_jobs() ] == [partial]
+    queue.close()
@@ -0,0 +1,53 @@
+import pytest
+
+from Utils.LibraryIndex import LibraryIndex, get_episode_key, parse_file_name
+
+
+@pytest.mark.parametrize('file_name, expected', [
+    ('Series Episode 1 - 720P.mp4', ('1', '720')),
+    ('Series Episode 05 - 1080P.mp4', ('5', '1080')),
+    ('Series Episode 12.5 - 360P.ts', ('12.5', '360')),
+    ('Series 2 Episode 3 - 720P.mkv', ('3', '720')),
+    ('/downloads/Series (2020)/Series Episode 7 - 480P.mp4', ('7', '480')),
+    ('Title 2 Movie - 1080P.mp4', ('', '1080')),
+    ('Title (2021) - 720P.mp4', ('', '720')),
+])
+def test_parse_downloaded_file_names(file_name, expected):
+    assert parse_file_name(file_name) == expected
+
+
+@pytest.mark.parametrize('file_name', [
+    'Series Episode 1 - 720P.mp4.chunk0',
+    'Series Episode 1 - 720p.mp4',
+    'Series Episode 1 - 720P.en.srt',
+    'Series Episode 1.mp4',
+    'temp_Series Episode 1 - 720P.mp4',
+    'uwu.m3u8',
+])
+def test_other_files_are_not_downloads(file_name):
+    assert parse_file_name(file_name) is None
+
+
+def test_episode_keys():
+    assert get_episode_key(5) == get_episode_key(5.0) == get_episode_key('5') == get_episode_key('05') == '5'
+    assert get_episode_key('12.5') == '12.5'
+    assert get_episode_key('s1e2') == 's1e2'
+
+
+def test_scan_and_completed(tmp_path):
+    series_dir = tmp_path / 'Series'
+    (series_dir / 'Season 2').mkdir(parents=True)
+    (series_dir / 'Series Episode 1 - 720P.mp4').write_bytes(b'video')
+    (series_dir / 'Season 2' / 'Series Episode 2 - 1080P.mp4').write_bytes(b'video')
+    (series_dir / 'Series Episode 3 - 720P.mp4').write_bytes(b'')      # empty file is not a download
+    index = LibraryIndex(str(tmp_path / 'library.db'))
+
+    assert index.scan_series('Client', 42, str(series_dir)) == 2
+    assert index.get_completed('Client', '42') == {'1', '2'}
+    assert index.get_completed('Client', 42, resolution=720) == {'1'}
+
+    # downloads whose files are gone are dropped
+    (series_dir / 'Series Episode 1 - 720P.mp4').unlink()
+    assert index.get_completed('Client', 42) == {'2'}
+    assert index.rebuild() == 1
+    index.close()
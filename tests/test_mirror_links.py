@@ -0,0 +1,88 @@
+import pytest
+
+from Clients.BaseClient import BaseClient
+
+CONFIG = ('https://site.example.com', [], ['blocked.example.com'])
+
+
+@pytest.fixture
+def client():
+    client = BaseClient()
+    client.max_mirrors = 3
+    client.mirror_ranker = None
+    # playlists of the fake servers: master playlists list their resolutions, media playlists have none
+    playlists = {
+        'https://a.example.com/master.m3u8': ['360', '720'],
+        'https://b.example.com/master.m3u8': ['360', '720', '1080'],
+        'https://a.example.com/720.m3u8': None,
+        'https://a.example.com/360.m3u8': None,
+        'https://b.example.com/720.m3u8': None,
+    }
+    def _parse_m3u8_links(link, referer, with_metadata=True):
+        resolutions = playlists[link]
+        host = link.split('/')[2]
+        if resolutions is None:
+            if not with_metadata:
+                return {None: {'downloadLink': link, 'downloadType': 'hls'}}
+            res = link.split('/')[-1].split('.')[0]
+            return {res: {'downloadLink': link, 'downloadType': 'hls', 'duration': '00:24:00'}}
+        details = {'duration': '00:24:00'} if with_metadata else {}
+        return { res: {'downloadLink': f'https://{host}/{res}.m3u8', 'downloadType': 'hls', **details} for res in resolutions }
+    client._parse_m3u8_links = _parse_m3u8_links
+    return client
+
+
+def test_alternate_master_links_are_mirrors_of_the_same_resolutions(client):
+    sources = [{'file': 'https://a.example.com/master.m3u8', 'type': 'hls'}, {'file': 'https://b.example.com/master.m3u8', 'type': 'hls'}]
+    links = client._get_download_links(sources, *CONFIG)
+
+    assert list(links) == ['360', '720']
+    assert links['720']['downloadLink'] == 'https://a.example.com/720.m3u8'
+    assert links['720']['mirrorLinks'] == ['https://b.example.com/720.m3u8']
+
+
+def test_quality_links_are_resolutions_and_alternates_their_mirrors(client):
+    links = {}
+    for source in ['https://a.example.com/720.m3u8', 'https://a.example.com/360.m3u8']:
+        links.update(client._get_download_links([{'file': source, 'type': 'hls'}], *CONFIG))
+    client._add_mirror_sources(links, [{'file': 'https://b.example.com/master.m3u8', 'type': 'hls'},
+                                       {'file': 'https://blocked.example.com/master.m3u8', 'type': 'hls'}], *CONFIG)
+
+    assert sorted(links) == ['360', '720']
+    assert links['720']['mirrorLinks'] == ['https://b.example.com/720.m3u8']
+    assert links['360']['mirrorLinks'] == ['https://b.example.com/360.m3u8']
+
+
+def test_mirror_of_unknown_resolution(client):
+    # media playlist mirror matches only a stream with a single resolution
+    single = {'720': {'downloadLink': 'https://a.example.com/720.m3u8', 'downloadType': 'hls'}}
+    client._add_mirror_sources(single, [{'file': 'https://b.example.com/720.m3u8', 'type': 'hls'}], *CONFIG)
+    assert single['720']['mirrorLinks'] == ['https://b.example.com/720.m3u8']
+
+    multiple = {'360': {'downloadLink': 'https://a.example.com/360.m3u8', 'downloadType': 'hls'},
+                '720': {'downloadLink': 'https://a.example.com/720.m3u8', 'downloadType': 'hls'}}
+    client._add_mirror_sources(multiple, [{'file': 'https://b.example.com/720.m3u8', 'type': 'hls'}], *CONFIG)
+    assert not any('mirrorLinks' in details for details in multiple.values())
+
+
+def test_mirrors_are_capped(client):
+    links = {'720': {'downloadLink': 'https://a.example.com/720.m3u8', 'downloadType': 'hls'}}
+    for i in range(5):
+        client._add_mirror_links(links, {'720': {'downloadLink': f'https://m{i}.example.com/720.m3u8', 'downloadType': 'hls'}})
+
+    assert len(links['720']['mirrorLinks']) == client.max_mirrors - 1
+
+
+def test_kisskh_sources():
+    from Clients.KissKhClient import KissKhClient
+    client = object.__new__(KissKhClient)
+    client.alternate_video_keys = ['Video_tmp', 'ThirdParty']
+
+    main, alternates = client._get_video_sources({'Video': {'qualities': {'720': 'https://a/720.m3u8', '1080': 'https://a/1080.m3u8'}},
+                                                  'Video_tmp': 'https://b/master.m3u8', 'ThirdParty': 'https://embed.example.com/player'})
+    assert [ s['file'] for s in main ] == ['https://a/1080.m3u8', 'https://a/720.m3u8']
+    assert alternates == [{'file': 'https://b/master.m3u8', 'type': 'hls'}]
+
+    # countdown timer link of an upcoming episode is kept as the main link
+    main, alternates = client._get_video_sources({'Video': 'https://tickcounter.com/countdown'})
+    assert (main, alternates) == ([{'file': 'https://tickcounter.com/countdown', 'type': 'hls'}], [])
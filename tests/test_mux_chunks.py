@@ -0,0 +1,72 @@
+import os
+
+import Utils.BaseDownloader as base_downloader
+from Utils.BaseDownloader import ByteRange
+
+
+def _downloader_with_chunks(make_downloader, count=3, size=10):
+    downloader = make_downloader()
+    downloader.subtitles = {'English': 'https://cdn.example.com/en.srt'}
+    chunk_ranges = []
+    for i in range(count):
+        byte_range = ByteRange('https://cdn.example.com/video.mp4', i * size, (i + 1) * size - 1, f'{downloader.out_file}.chunk{i * size}')
+        with open(os.path.join(downloader.temp_dir, byte_range.name), 'wb') as f:
+            f.write(bytes([i]) * size)
+        chunk_ranges.append(byte_range)
+
+    commands = []
+    def _run_ffmpeg(command, desc='Muxing'):
+        commands.append(command)
+        open(command[-1], 'wb').close()
+    downloader._run_ffmpeg = _run_ffmpeg
+
+    return downloader, chunk_ranges, commands
+
+
+def test_chunks_are_muxed_with_concat_protocol(make_downloader):
+    downloader, chunk_ranges, commands = _downloader_with_chunks(make_downloader)
+
+    assert downloader._mux_chunks(list(reversed(chunk_ranges))) is True
+
+    chunk_files = [ os.path.join(downloader.temp_dir, r.name) for r in chunk_ranges ]
+    assert commands[0][commands[0].index('-i') + 1] == 'concat:' + '|'.join(chunk_files)
+    assert os.path.isfile(os.path.join(downloader.out_dir, downloader.out_file))
+    # muxed chunks are removed
+    assert not any(os.path.exists(f) for f in chunk_files)
+
+
+def test_pipe_in_chunk_path_falls_back(make_downloader, tmp_path):
+    downloader, chunk_ranges, commands = _downloader_with_chunks(make_downloader)
+    temp_dir = tmp_path / 'temp|dir'
+    temp_dir.mkdir()
+    for r in chunk_ranges:
+        os.replace(os.path.join(downloader.temp_dir, r.name), temp_dir / r.name)
+    downloader.temp_dir = str(temp_dir)
+
+    assert downloader._mux_chunks(chunk_ranges) is False
+    assert commands == []
+    assert all((temp_dir / r.name).exists() for r in chunk_ranges)
+
+
+def test_chunk_list_over_command_line_limit_falls_back(make_downloader, monkeypatch):
+    downloader, chunk_ranges, commands = _downloader_with_chunks(make_downloader, count=5)
+    concat_len = len('concat:' + '|'.join(os.path.join(downloader.temp_dir, r.name) for r in chunk_ranges))
+    monkeypatch.setattr(base_downloader, 'MAX_ARG_BYTES', concat_len)
+    monkeypatch.setattr(base_downloader, 'MAX_COMMAND_LINE', concat_len)
+
+    assert downloader._mux_chunks(chunk_ranges) is False
+    assert commands == []
+
+
+def test_subtitles_cache_outlives_the_temp_dirs(make_downloader, tmp_path):
+    downloader = make_downloader(subtitles={'English': 'https://subs.example.com/ep1.srt?token=1'})
+    downloader._get_stream_data = lambda url: b'1\n00:00:01,000 --> 00:00:02,000\nHello\n'
+
+    sub_file = downloader._download_subtitle('English', 'https://subs.example.com/ep1.srt?token=1')
+    downloader._remove_out_dirs()
+    downloader._cleanup_out_dirs()
+
+    # temp dirs are removed, cached subtitle is reused by the next download of the episode
+    assert not os.path.exists(downloader.parent_temp_dir)
+    assert os.path.isfile(sub_file)
+    assert make_downloader()._download_subtitle('English', 'https://subs.example.com/ep1.srt?token=2') == sub_file
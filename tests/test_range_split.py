@@ -0,0 +1,54 @@
+from Utils.BaseDownloader import ByteRange
+
+MB = 1024 * 1024
+
+
+def _downloader(make_downloader, min_split_mb=4):
+    downloader = make_downloader(dl_config={'min_split_size_mb': min_split_mb})
+    downloader.chunk_size = MB
+    return downloader
+
+
+def _streaming_range(start, end, position=None):
+    byte_range = ByteRange('https://cdn.example.com/video.mp4', start, end, f'video.chunk{start}')
+    byte_range.position = start if position is None else position
+    byte_range.streaming = True
+    return byte_range
+
+
+def test_splits_remaining_part_of_largest_range(make_downloader):
+    downloader = _downloader(make_downloader)
+    small = _streaming_range(0, 20 * MB - 1, position=12 * MB)
+    large = _streaming_range(20 * MB, 60 * MB - 1, position=24 * MB)
+
+    new_range = downloader._split_largest_range([small, large])
+
+    # remaining part of the largest range (24-60 MB) is halved at a chunk boundary
+    assert (new_range.start, new_range.end) == (42 * MB, 60 * MB - 1)
+    assert new_range.name == f'{downloader.out_file}.chunk{42 * MB}'
+    assert large.end == 42 * MB - 1
+    assert small.end == 20 * MB - 1
+
+
+def test_split_point_is_chunk_aligned(make_downloader):
+    downloader = _downloader(make_downloader)
+    split_at = downloader._get_split_point(3 * MB + 123, 40 * MB - 1)
+    assert split_at % MB == 0
+    assert 3 * MB + 123 + 4 * MB <= split_at <= 40 * MB - 4 * MB
+
+
+def test_no_split_for_small_remaining_part(make_downloader):
+    downloader = _downloader(make_downloader)
+    almost_done = _streaming_range(0, 20 * MB - 1, position=14 * MB)    # 6 MB left, parts would be < 4 MB
+    assert downloader._split_largest_range([almost_done]) is None
+    assert almost_done.end == 20 * MB - 1
+
+
+def test_no_split_without_streaming_ranges_or_range_support(make_downloader):
+    downloader = _downloader(make_downloader)
+    waiting = _streaming_range(0, 100 * MB - 1)
+    waiting.streaming = False
+    assert downloader._split_largest_range([waiting]) is None
+
+    downloader.range_support = False
+    assert downloader._split_largest_range([_streaming_range(0, 100 * MB - 1)]) is None
@@ -0,0 +1,110 @@
+from datetime import datetime
+from unittest import mock
+
+import pytest
+
+from Utils.ResolutionPlanner import ResolutionPlanner, get_seconds, get_seconds_until
+
+
+def _episodes(*sizes, duration=1440):
+    return { ep: {'sizes': dict(ep_sizes), 'duration': duration} for ep, ep_sizes in enumerate(sizes, start=1) }
+
+
+SIZES = {'360': 100, '720': 200, '1080': 400}
+
+
+def test_everything_at_max_resolution_when_budget_allows():
+    plan, sizes = ResolutionPlanner(1080).plan(_episodes(SIZES, SIZES), 10_000)
+
+    assert plan == {1: '1080', 2: '1080'}
+    assert sizes == {1: 400, 2: 400}
+
+
+def test_quality_is_spread_evenly():
+    # 700 MB: both at 720P (400), then one more upgrade to 1080P (+200) fits, not two
+    plan, sizes = ResolutionPlanner(1080).plan(_episodes(SIZES, SIZES), 700)
+
+    assert sorted(plan.values()) == ['1080', '720']
+    assert sum(sizes.values()) == 600
+
+
+def test_requested_resolution_is_the_highest_used():
+    plan, _ = ResolutionPlanner(720).plan(_episodes(SIZES), 10_000)
+    assert plan == {1: '720'}
+
+    # nothing at or below the requested resolution: lowest available is used
+    plan, _ = ResolutionPlanner(240).plan(_episodes(SIZES), 10_000)
+    assert plan == {1: '360'}
+
+
+def test_last_episodes_are_left_out_when_lowest_does_not_fit():
+    plan, sizes = ResolutionPlanner(1080).plan(_episodes(SIZES, SIZES, SIZES), 250)
+
+    assert plan == {1: '360', 2: '360', 3: None}
+    assert sizes == {1: 100, 2: 100}
+
+
+def test_missing_sizes_are_estimated_from_other_episodes():
+    episodes = _episodes({'720': 200}, {'720': None}, {'720': None, '1080': None})
+    episodes[2]['duration'] = 720       # half the duration, half the size
+    episodes[3]['duration'] = None      # no duration, median size
+
+    plan, sizes = ResolutionPlanner(1080).plan(episodes, 10_000)
+
+    # 1080P has no size in any episode, so it can't be planned
+    assert plan == {1: '720', 2: '720', 3: '720'}
+    assert sizes == {1: 200, 2: 100, 3: 200}
+
+
+def test_episodes_without_sizes_are_not_planned():
+    plan, sizes = ResolutionPlanner(1080).plan(_episodes({'720': None}), 10_000)
+    assert (plan, sizes) == ({}, {})
+
+
+@pytest.mark.parametrize('duration, seconds', [
+    ('01:23:45', 5025), ('23:45', 1425), ('2h30m', 9000), ('90m', 5400), ('45s', 45), ('1.5h', 5400),
+    ('', None), (None, None), ('soon', None),
+])
+def test_get_seconds(duration, seconds):
+    assert get_seconds(duration) == seconds
+
+
+def test_get_seconds_until():
+    now = datetime(2024, 1, 1, 22, 0)
+    assert get_seconds_until('23:30', now) == 5400
+    assert get_seconds_until('06:00', now) == 8 * 3600      # next day
+    assert get_seconds_until('2h', now) == 7200
+    with pytest.raises(ValueError):
+        get_seconds_until('tomorrow', now)
+
+
+def test_downloads_record_throughput_of_the_batch(make_downloader, monkeypatch, tmp_path):
+    import Utils.BaseDownloader as base_downloader
+    from Utils.MirrorSelector import MirrorSelector
+
+    selector = MirrorSelector(str(tmp_path / 'scores.json'))
+    monkeypatch.setattr(base_downloader, 'get_mirror_selector', lambda: selector)
+    monkeypatch.setattr(base_downloader, '_host_transfers', {})
+    now = [100.0]
+    monkeypatch.setattr(base_downloader, 'monotonic', lambda: now[0])
+    first, second = make_downloader(), make_downloader()
+    record_download = mock.Mock(wraps=selector.record_download)
+    monkeypatch.setattr(selector, 'record_download', record_download)
+
+    # two overlapping downloads, 20 MB each: 40 MB in 10 secs of wall time is 4 MB/s for the batch
+    first_start = first._start_transfer()
+    now[0] = 105.0
+    second_start = second._start_transfer()
+    for _ in range(20):
+        first._report_source_success('https://cdn.example.com/video.mp4', 1024**2, 0.5)
+        second._report_source_success('https://cdn.example.com/video.mp4', 1024**2, 0.5)
+    now[0] = 110.0
+    first._end_transfer(first_start)
+    assert record_download.call_args_list == [mock.call('cdn.example.com', pytest.approx(4 * 1024**2))]
+
+    # second download ran for 10 secs in all, 5 of them alone
+    now[0] = 115.0
+    second._end_transfer(second_start)
+    assert record_download.call_count == 2
+    assert record_download.call_args[0][1] == pytest.approx(40 * 1024**2 / 10)
+    assert base_downloader._host_transfers['cdn.example.com']['active'] == 0
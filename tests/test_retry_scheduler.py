@@ -0,0 +1,56 @@
+from unittest import mock
+
+from Utils.commons import DownloadError
+from Utils.RetryScheduler import RetryPolicy, RetryScheduler
+
+
+def test_classify():
+    policy = RetryPolicy()
+    assert policy.classify(DownloadError('x', 429)) == 'throttled'
+    assert policy.classify(DownloadError('x', 503)) == 'server'
+    assert policy.classify(DownloadError('x', 408)) == 'server'
+    assert policy.classify(DownloadError('x', 404)) == 'client'
+    assert policy.classify(TimeoutError()) == 'timeout'
+    assert policy.classify(ConnectionResetError()) == 'network'
+    assert policy.classify(ValueError()) == 'other'
+
+
+def test_delay_backoff_and_retry_after():
+    policy = RetryPolicy({'server': {'retries': 3, 'base_delay': 2, 'max_delay': 5}})
+    with mock.patch('Utils.RetryScheduler.random.uniform', side_effect=lambda low, high: high):
+        assert [ policy.get_delay(DownloadError('x', 500), attempt) for attempt in range(1, 5) ] == [2, 4, 5, None]
+        # delay requested by the server is honoured (up to max_delay of the policy)
+        assert policy.get_delay(DownloadError('x', 429, '30'), 1) == 30
+        assert policy.get_delay(DownloadError('x', 429, '999'), 1) == 120
+    assert policy.get_delay(DownloadError('x', 404), 1) is None
+
+
+def test_scheduler_orders_items_by_due_time():
+    policy = mock.Mock(get_delay=lambda error, attempt: error)      # error is the delay
+    scheduler = RetryScheduler(policy)
+    now = 1000.0
+    with mock.patch('Utils.RetryScheduler.monotonic', side_effect=lambda: now):
+        scheduler.schedule('b', 5)
+        scheduler.schedule('a', 1)
+        scheduler.schedule('c', 1)      # same due time as 'a', so it comes after 'a'
+        assert len(scheduler) == 3
+        assert scheduler.time_to_next() == 1
+        assert scheduler.pop_ready() == []
+
+        now = 1001.0
+        assert scheduler.pop_ready() == ['a', 'c']
+        assert scheduler.time_to_next() == 4
+
+        now = 1010.0
+        assert scheduler.pop_ready() == ['b']
+        assert scheduler.time_to_next() is None
+
+
+def test_scheduler_retry_budget():
+    policy = mock.Mock(get_delay=lambda error, attempt: 0 if attempt <= 2 else None)
+    scheduler = RetryScheduler(policy, retry_budget=3)
+    assert scheduler.schedule('a', None) == 0
+    assert scheduler.schedule('a', None) == 0
+    assert scheduler.schedule('a', None) is None    # retries of the item are over
+    assert scheduler.schedule('b', None) == 0
+    assert scheduler.schedule('c', None) is None    # retry budget of the download is over
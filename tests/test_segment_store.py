@@ -0,0 +1,68 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from Utils.DownloadJournal import DownloadJournal
+from Utils.SegmentStore import SegmentStore
+
+
+def _store(tmp_path):
+    return SegmentStore(str(tmp_path / 'segments.dat'), DownloadJournal(str(tmp_path / 'journal.jsonl')))
+
+
+def test_segments_get_consecutive_ranges(tmp_path):
+    store = _store(tmp_path)
+    store.add('seg0.ts', b'a' * 10)
+    store.add('seg1.ts', b'b' * 5)
+
+    assert store.get_range('seg0.ts') == (0, 10)
+    assert store.get_range('seg1.ts') == (10, 5)
+    assert store.read('seg1.ts') == b'b' * 5
+    store.close()
+
+
+def test_parallel_adds_never_overlap(tmp_path):
+    store = _store(tmp_path)
+    segments = { f'seg{i}.ts': bytes([i]) * (100 + i) for i in range(50) }
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda item: store.add(*item), segments.items()))
+
+    ranges = sorted(store.get_range(name) for name in segments)
+    for (offset, size), (next_offset, _) in zip(ranges, ranges[1:]):
+        assert offset + size == next_offset
+    assert all(store.read(name) == data for name, data in segments.items())
+    store.close()
+
+
+def test_store_resumes_from_journal(tmp_path):
+    store = _store(tmp_path)
+    store.add('seg0.ts', b'complete')
+    store.close()
+    # a partially written segment at the end of the data file (not in the journal)
+    with open(tmp_path / 'segments.dat', 'ab') as f:
+        f.write(b'partial')
+
+    store = _store(tmp_path)
+    assert store.is_complete('seg0.ts')
+    assert not store.is_complete('seg1.ts')
+    # space after the last byte on disk is never reused
+    store.add('seg1.ts', b'new')
+    assert store.get_range('seg1.ts') == (len(b'complete') + len(b'partial'), 3)
+    store.close()
+
+
+def test_changed_or_missing_bytes_are_not_complete(tmp_path):
+    store = _store(tmp_path)
+    store.add('seg0.ts', b'original')
+    store.close()
+    with open(tmp_path / 'segments.dat', 'r+b') as f:
+        f.write(b'X')
+
+    store = _store(tmp_path)
+    assert not store.is_complete('seg0.ts')
+    assert store.is_complete('seg0.ts', verify=False)
+    store.close()
+
+    os.truncate(tmp_path / 'segments.dat', 4)
+    store = _store(tmp_path)
+    assert not store.is_complete('seg0.ts', verify=False)
+    store.close()